@@ -4,17 +4,156 @@ Sends alerts when anomalies are detected
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from jinja2 import Template
 from datetime import datetime
 from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import threading
+import time
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# (connect, read) timeout for Slack/webhook posts
+HTTP_TIMEOUT = (3, 7)
+
+# Timestamp format used in alert bodies
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Alert bodies, compiled once at import
+_SLACK_TPL = Template("""\
+🚨 *Anomaly Detected in CI/CD Pipeline*
+
+*Job/Workflow:* {{ job_name }}
+*Time:* {{ now }}
+*Severity:* {{ severity }}
+{% if occurrences > 1 %}
+*Occurrences:* {{ occurrences }}
+{% endif %}
+
+{% if features is not none %}
+*Anomalous Metrics:*
+{% for f in features %}
+  • {{ f['feature'] }}: {{ '%.2f' | format(f['value']) }} (expected: {{ '%.2f' | format(f['expected']) }}, z-score: {{ '%.2f' | format(f['z_score']) }})
+{% endfor %}
+{% endif %}
+{% if 'duration' in data %}
+
+*Build Duration:* {{ '%.1f' | format(data['duration']) }}s
+{% endif %}
+{% if 'result' in data %}
+*Result:* {{ data['result'] }}
+{% endif %}
+{% if 'failure_count' in data %}
+*Failures:* {{ data['failure_count'] }}
+{% endif %}
+""", trim_blocks=True, keep_trailing_newline=True)
+
+_HTML_TPL = Template("""
+            <html>
+              <body>
+                <h2 style="color: #e74c3c;">🚨 Anomaly Detected in CI/CD Pipeline</h2>
+                <p><strong>Job/Workflow:</strong> {{ job_name }}</p>
+                <p><strong>Time:</strong> {{ now }}</p>
+                <h3>Anomalous Metrics:</h3>
+                <ul>
+                {% for f in features %}
+                    <li>
+                        <strong>{{ f['feature'] }}:</strong> {{ '%.2f' | format(f['value']) }}
+                        (expected: {{ '%.2f' | format(f['expected']) }}, z-score: {{ '%.2f' | format(f['z_score']) }})
+                    </li>
+                {% endfor %}
+                </ul>
+                <p style="color: #7f8c8d; font-size: 12px;">
+                    This is an automated alert from the CI/CD Anomaly Detection System
+                </p>
+              </body>
+            </html>
+            """, autoescape=True, trim_blocks=True, lstrip_blocks=True)
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing alert destination until it has had time to recover.
+
+    CLOSED: calls go through. After failure_threshold consecutive failures the
+    breaker trips to OPEN and calls are skipped. Once recovery_timeout seconds
+    have passed it moves to HALF_OPEN and lets a single trial call through;
+    success closes the breaker, failure opens it again.
+    """
+    
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 60):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+    
+    def is_open(self) -> bool:
+        """Return True if the call should be skipped"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return False
+            
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.recovery_timeout:
+                    return True
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            
+            # HALF_OPEN: allow exactly one trial call
+            if self._trial_in_flight:
+                return True
+            self._trial_in_flight = True
+            return False
+    
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+    
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+
+def bulkhead(channel: str):
+    """
+    Bound concurrent outbound posts with the manager's semaphore.
+    Fails fast (returns False) if no slot frees up within bulkhead_timeout.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            if not self._outbound_sem.acquire(timeout=self.bulkhead_timeout):
+                logger.warning(f"Too many alerts in flight, dropping {channel} alert")
+                return False
+            try:
+                return func(self, *args, **kwargs)
+            finally:
+                self._outbound_sem.release()
+        return wrapper
+    return decorator
+
 
 class AlertManager:
     """Manages alerts for detected anomalies"""
@@ -27,136 +166,207 @@ class AlertManager:
         self.smtp_user = self.config.get('smtp_user', '')
         self.smtp_password = self.config.get('smtp_password', '')
         self.alert_email = self.config.get('alert_email', '')
+        self.email_html = self.config.get('email_html', True)
+        
+        # Pooled HTTP session so Slack/webhook posts reuse TCP+TLS connections.
+        # Transient 429/5xx responses and connection errors are retried with
+        # jittered exponential backoff, honouring Retry-After.
+        self._session = requests.Session()
+        retry = Retry(
+            total=3,
+            backoff_factor=0.5,
+            backoff_jitter=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['POST']),
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+        
+        # One circuit breaker per destination so an outage fails fast
+        failure_threshold = self.config.get('circuit_failure_threshold', 5)
+        recovery_timeout = self.config.get('circuit_recovery_timeout', 60)
+        self._slack_cb = CircuitBreaker(failure_threshold, recovery_timeout)
+        self._email_cb = CircuitBreaker(failure_threshold, recovery_timeout)
+        self._webhook_cb = CircuitBreaker(failure_threshold, recovery_timeout)
+        
+        # Bulkhead: cap in-flight Slack/webhook posts across threads
+        self.bulkhead_capacity = self.config.get('bulkhead_capacity', 8)
+        self.bulkhead_timeout = self.config.get('bulkhead_timeout', 2)
+        self._outbound_sem = threading.BoundedSemaphore(self.bulkhead_capacity)
+        
+        # Persistent SMTP connection, recycled after smtp_max_messages sends
+        self.smtp_max_messages = self.config.get('smtp_max_messages', 100)
+        self._smtp = None
+        self._smtp_lock = threading.Lock()
+        self._messages_on_conn = 0
+        
+        # Fans a multi-channel alert out so channels are sent concurrently
+        self._channel_executor = ThreadPoolExecutor(max_workers=3, thread_name_prefix='alert-channel')
+    
+    def close(self):
+        """Close pooled HTTP and SMTP connections"""
+        self._channel_executor.shutdown(wait=False)
+        self._session.close()
+        with self._smtp_lock:
+            self._close_smtp()
+    
+    def _get_smtp(self) -> smtplib.SMTP:
+        """Return a live SMTP connection, reconnecting if the old one dropped"""
+        if self._smtp is not None:
+            try:
+                if self._smtp.noop()[0] == 250:
+                    return self._smtp
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._close_smtp()
+        
+        server = smtplib.SMTP(self.smtp_server, self.smtp_port)
+        server.starttls()
+        server.login(self.smtp_user, self.smtp_password)
+        self._smtp = server
+        self._messages_on_conn = 0
+        return server
+    
+    def _close_smtp(self):
+        """Quit the cached SMTP connection (caller holds _smtp_lock)"""
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            self._smtp.close()
+        self._smtp = None
+        self._messages_on_conn = 0
     
     def format_anomaly_message(self, anomaly: Dict) -> str:
         """Format anomaly data into readable message"""
         job_name = anomaly.get('data', {}).get('job_name') or anomaly.get('data', {}).get('workflow_name', 'Unknown')
         
-        message = f"🚨 *Anomaly Detected in CI/CD Pipeline*\n\n"
-        message += f"*Job/Workflow:* {job_name}\n"
-        message += f"*Time:* {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-        message += f"*Severity:* {'HIGH' if anomaly.get('max_z_score', 0) > 4 else 'MEDIUM'}\n\n"
-        
-        if 'anomaly_features' in anomaly:
-            message += "*Anomalous Metrics:*\n"
-            for feature in anomaly['anomaly_features'][:3]:  # Top 3
-                message += f"  • {feature['feature']}: {feature['value']:.2f} "
-                message += f"(expected: {feature['expected']:.2f}, "
-                message += f"z-score: {feature['z_score']:.2f})\n"
+        features = anomaly['anomaly_features'][:3] if 'anomaly_features' in anomaly else None  # Top 3
         
-        # Add build details
-        data = anomaly.get('data', {})
-        if 'duration' in data:
-            message += f"\n*Build Duration:* {data['duration']:.1f}s\n"
-        if 'result' in data:
-            message += f"*Result:* {data['result']}\n"
-        if 'failure_count' in data:
-            message += f"*Failures:* {data['failure_count']}\n"
-        
-        return message
+        return _SLACK_TPL.render(
+            job_name=job_name,
+            now=datetime.now().strftime(TIME_FORMAT),
+            severity='HIGH' if anomaly.get('max_z_score', 0) > 4 else 'MEDIUM',
+            features=features,
+            data=anomaly.get('data', {}),
+            occurrences=anomaly.get('occurrences', 1)
+        )
     
-    def send_slack_alert(self, anomaly: Dict) -> bool:
-        """Send alert to Slack"""
+    @bulkhead('Slack')
+    def send_slack_alert(self, anomaly: Dict, message: Optional[str] = None) -> bool:
+        """Send alert to Slack (message: pre-formatted text, built if omitted)"""
         if not self.slack_webhook:
             logger.warning("Slack webhook URL not configured")
             return False
         
-        try:
+        if message is None:
             message = self.format_anomaly_message(anomaly)
-            
+        
+        return self._post_slack(message, 'alert')
+    
+    def _post_slack(self, text: str, kind: str) -> bool:
+        """Post text to the Slack webhook through the shared session and circuit breaker"""
+        if self._slack_cb.is_open():
+            logger.warning(f"Slack circuit open, skipping {kind}")
+            return False
+        
+        try:
             payload = {
-                'text': message,
+                'text': text,
                 'username': 'CI/CD Anomaly Detector',
                 'icon_emoji': ':robot_face:'
             }
             
-            response = requests.post(
+            response = self._session.post(
                 self.slack_webhook,
                 json=payload,
-                timeout=10
+                timeout=HTTP_TIMEOUT
             )
             
             if response.status_code == 200:
-                logger.info("Slack alert sent successfully")
+                self._slack_cb.record_success()
+                logger.info(f"Slack {kind} sent successfully")
                 return True
             else:
-                logger.error(f"Slack alert failed: {response.status_code}")
+                self._slack_cb.record_failure()
+                logger.error(f"Slack {kind} failed: {response.status_code}")
                 return False
                 
         except Exception as e:
-            logger.error(f"Error sending Slack alert: {e}")
+            self._slack_cb.record_failure()
+            logger.error(f"Error sending Slack {kind}: {e}")
             return False
     
-    def send_email_alert(self, anomaly: Dict) -> bool:
-        """Send alert via email"""
+    def send_email_alert(self, anomaly: Dict, message: Optional[str] = None) -> bool:
+        """Send alert via email (message: pre-formatted text, built if omitted)"""
         if not all([self.smtp_user, self.smtp_password, self.alert_email]):
             logger.warning("Email configuration incomplete")
             return False
         
+        if self._email_cb.is_open():
+            logger.warning("Email circuit open, skipping alert")
+            return False
+        
         try:
             job_name = anomaly.get('data', {}).get('job_name') or anomaly.get('data', {}).get('workflow_name', 'Unknown')
             
-            msg = MIMEMultipart('alternative')
-            msg['Subject'] = f"CI/CD Anomaly Alert - {job_name}"
-            msg['From'] = self.smtp_user
-            msg['To'] = self.alert_email
-            
             # Plain text version
-            text = self.format_anomaly_message(anomaly)
-            
-            # HTML version
-            html = f"""
-            <html>
-              <body>
-                <h2 style="color: #e74c3c;">🚨 Anomaly Detected in CI/CD Pipeline</h2>
-                <p><strong>Job/Workflow:</strong> {job_name}</p>
-                <p><strong>Time:</strong> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>
-                <h3>Anomalous Metrics:</h3>
-                <ul>
-            """
-            
-            if 'anomaly_features' in anomaly:
-                for feature in anomaly['anomaly_features'][:5]:
-                    html += f"""
-                    <li>
-                        <strong>{feature['feature']}:</strong> {feature['value']:.2f}
-                        (expected: {feature['expected']:.2f}, z-score: {feature['z_score']:.2f})
-                    </li>
-                    """
-            
-            html += """
-                </ul>
-                <p style="color: #7f8c8d; font-size: 12px;">
-                    This is an automated alert from the CI/CD Anomaly Detection System
-                </p>
-              </body>
-            </html>
-            """
+            text = message if message is not None else self.format_anomaly_message(anomaly)
             
-            part1 = MIMEText(text, 'plain')
-            part2 = MIMEText(html, 'html')
+            if self.email_html:
+                # HTML version
+                html = _HTML_TPL.render(
+                    job_name=job_name,
+                    now=datetime.now().strftime(TIME_FORMAT),
+                    features=anomaly.get('anomaly_features', [])[:5]
+                )
+                
+                msg = MIMEMultipart('alternative')
+                msg.attach(MIMEText(text, 'plain'))
+                msg.attach(MIMEText(html, 'html'))
+            else:
+                msg = MIMEText(text, 'plain')
             
-            msg.attach(part1)
-            msg.attach(part2)
+            msg['Subject'] = f"CI/CD Anomaly Alert - {job_name}"
+            msg['From'] = self.smtp_user
+            msg['To'] = self.alert_email
             
-            # Send email
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls()
-                server.login(self.smtp_user, self.smtp_password)
-                server.send_message(msg)
+            # Send email over the shared connection
+            with self._smtp_lock:
+                server = self._get_smtp()
+                try:
+                    server.send_message(msg)
+                except Exception:
+                    self._close_smtp()
+                    raise
+                
+                self._messages_on_conn += 1
+                if self._messages_on_conn >= self.smtp_max_messages:
+                    self._close_smtp()
             
+            self._email_cb.record_success()
             logger.info(f"Email alert sent to {self.alert_email}")
             return True
             
         except Exception as e:
+            self._email_cb.record_failure()
             logger.error(f"Error sending email alert: {e}")
             return False
     
+    @bulkhead('webhook')
     def send_webhook_alert(self, anomaly: Dict, webhook_url: str) -> bool:
         """Send alert to custom webhook"""
         if not webhook_url:
             return False
         
+        if self._webhook_cb.is_open():
+            logger.warning("Webhook circuit open, skipping alert")
+            return False
+        
         try:
             payload = {
                 'type': 'anomaly_detected',
@@ -164,21 +374,24 @@ class AlertManager:
                 'anomaly': anomaly
             }
             
-            response = requests.post(
+            response = self._session.post(
                 webhook_url,
                 json=payload,
                 headers={'Content-Type': 'application/json'},
-                timeout=10
+                timeout=HTTP_TIMEOUT
             )
             
             if response.status_code in [200, 201, 202]:
+                self._webhook_cb.record_success()
                 logger.info(f"Webhook alert sent to {webhook_url}")
                 return True
             else:
+                self._webhook_cb.record_failure()
                 logger.error(f"Webhook alert failed: {response.status_code}")
                 return False
                 
         except Exception as e:
+            self._webhook_cb.record_failure()
             logger.error(f"Error sending webhook alert: {e}")
             return False
     
@@ -192,60 +405,65 @@ class AlertManager:
         
         Returns:
             Dictionary of channel: success status
+        
+        When several channels are requested they are sent concurrently, so
+        the call takes as long as the slowest channel rather than the sum.
         """
         if channels is None:
             channels = ['slack', 'email']
         
-        results = {}
+        # Format once and share between the text-based channels
+        message = None
+        if 'slack' in channels or 'email' in channels:
+            message = self.format_anomaly_message(anomaly)
+        
+        sends = {}
         
         if 'slack' in channels:
-            results['slack'] = self.send_slack_alert(anomaly)
+            sends['slack'] = (self.send_slack_alert, anomaly, message)
         
         if 'email' in channels:
-            results['email'] = self.send_email_alert(anomaly)
+            sends['email'] = (self.send_email_alert, anomaly, message)
         
         if 'webhook' in channels and self.config.get('webhook_url'):
-            results['webhook'] = self.send_webhook_alert(
-                anomaly,
-                self.config['webhook_url']
-            )
+            sends['webhook'] = (self.send_webhook_alert, anomaly, self.config['webhook_url'])
         
-        return results
+        if len(sends) <= 1:
+            return {channel: func(*args) for channel, (func, *args) in sends.items()}
+        
+        futures = {
+            channel: self._channel_executor.submit(func, *args)
+            for channel, (func, *args) in sends.items()
+        }
+        return {channel: future.result() for channel, future in futures.items()}
     
+    @bulkhead('batch')
     def send_batch_alert(self, anomalies: List[Dict], max_items: int = 10) -> bool:
         """Send summary alert for multiple anomalies"""
         if not anomalies:
             return False
         
         count = len(anomalies)
-        message = f"🚨 *{count} Anomalies Detected in CI/CD Pipelines*\n\n"
+        lines = [f"🚨 *{count} Anomalies Detected in CI/CD Pipelines*", ""]
         
         for i, anomaly in enumerate(anomalies[:max_items], 1):
             job_name = anomaly.get('data', {}).get('job_name') or anomaly.get('data', {}).get('workflow_name', 'Unknown')
-            message += f"{i}. *{job_name}* - "
             
+            repeats = f" (x{anomaly['occurrences']})" if anomaly.get('occurrences', 1) > 1 else ""
             if 'max_z_score' in anomaly:
-                message += f"z-score: {anomaly['max_z_score']:.2f}\n"
+                lines.append(f"{i}. *{job_name}* - z-score: {anomaly['max_z_score']:.2f}{repeats}")
             else:
-                message += "Detected by ML model\n"
+                lines.append(f"{i}. *{job_name}* - Detected by ML model{repeats}")
         
         if count > max_items:
-            message += f"\n... and {count - max_items} more\n"
+            lines.append("")
+            lines.append(f"... and {count - max_items} more")
+        
+        message = "\n".join(lines) + "\n"
         
         # Send via Slack
         if self.slack_webhook:
-            try:
-                payload = {
-                    'text': message,
-                    'username': 'CI/CD Anomaly Detector',
-                    'icon_emoji': ':robot_face:'
-                }
-                
-                response = requests.post(self.slack_webhook, json=payload, timeout=10)
-                return response.status_code == 200
-            except Exception as e:
-                logger.error(f"Error sending batch alert: {e}")
-                return False
+            return self._post_slack(message, 'batch alert')
         
         return False
 
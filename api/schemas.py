@@ -0,0 +1,163 @@
+"""
+Request schemas for the REST API
+Each schema declares its fields once; bodies are type-checked on the way in
+so malformed input is rejected with a 400 instead of failing deep inside a handler.
+"""
+
+from typing import Any, Dict, Tuple
+
+
+class RequestValidationError(ValueError):
+    """Raised when a request body does not match its schema"""
+
+
+# Default marker for fields the client must supply
+REQUIRED = object()
+
+
+_TYPE_NAMES = {str: 'a string', int: 'an integer', float: 'a number',
+               bool: 'a boolean', list: 'a list', dict: 'an object'}
+
+
+def _accepts(value: Any, types: tuple) -> bool:
+    # JSON true/false must not pass as numbers, but integers are valid floats
+    if isinstance(value, bool):
+        return bool in types
+    if isinstance(value, int) and float in types:
+        return True
+    return isinstance(value, types)
+
+
+def _expected(types: tuple) -> str:
+    return ' or '.join(_TYPE_NAMES.get(t, t.__name__) for t in types)
+
+
+class RequestSchema:
+    """
+    Base class for request bodies
+
+    FIELDS maps field name -> (accepted types, default). A callable default
+    (e.g. list) is called to build a fresh value for each request; REQUIRED
+    fields must be present. A None default also lets the client send null.
+    ITEMS maps a list field to the types its elements must have.
+    """
+
+    FIELDS: Dict[str, Tuple[tuple, Any]] = {}
+    ITEMS: Dict[str, tuple] = {}
+
+    def __init__(self, body: Any):
+        if not isinstance(body, dict):
+            raise RequestValidationError('Request body must be a JSON object')
+
+        for name, (types, default) in self.FIELDS.items():
+            if name not in body:
+                if default is REQUIRED:
+                    raise RequestValidationError(f"Missing required field: '{name}'")
+                setattr(self, name, default() if callable(default) else default)
+                continue
+
+            value = body[name]
+            if value is None and default is None:
+                setattr(self, name, None)
+                continue
+            if not _accepts(value, types):
+                raise RequestValidationError(f"'{name}' must be {_expected(types)}")
+            item_types = self.ITEMS.get(name)
+            if item_types and isinstance(value, list) and \
+                    not all(_accepts(item, item_types) for item in value):
+                raise RequestValidationError(f"'{name}' items must be {_expected(item_types)}")
+            setattr(self, name, value)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    @classmethod
+    def from_request(cls, request) -> 'RequestSchema':
+        """Parse the JSON body of a Flask request (an empty body means all defaults)"""
+        if not request.get_data().strip():
+            return cls({})
+        body = request.get_json(force=True, silent=True)
+        if body is None:
+            raise RequestValidationError('Request body must be valid JSON')
+        return cls(body)
+
+
+class CollectRequest(RequestSchema):
+    FIELDS = {
+        'source': ((str,), 'jenkins'),
+        'count': ((int,), 100),
+    }
+
+
+class TrainRequest(RequestSchema):
+    FIELDS = {
+        'days': ((int,), 30),
+        'contamination': ((float,), 0.1),
+        'use_ensemble': ((bool,), True),
+    }
+
+
+class DetectRequest(RequestSchema):
+    FIELDS = {
+        'metrics': ((list,), list),
+        'threshold': ((float,), 3.0),
+        'send_alerts': ((bool,), True),
+    }
+    ITEMS = {'metrics': (dict,)}
+
+
+class EnsembleDetectRequest(RequestSchema):
+    FIELDS = {
+        'metrics': ((list,), list),
+        'send_alerts': ((bool,), True),
+    }
+    ITEMS = {'metrics': (dict,)}
+
+
+class PipelineRequest(RequestSchema):
+    FIELDS = {
+        'source': ((str, list), 'jenkins'),
+    }
+    ITEMS = {'source': (str,)}
+
+
+class PredictRequest(RequestSchema):
+    FIELDS = {
+        'job_name': ((str,), None),
+        'sequence_length': ((int,), 20),
+    }
+
+
+class AnalyzeCauseRequest(RequestSchema):
+    FIELDS = {
+        'anomaly': ((dict,), None),
+        'context': ((dict,), dict),
+    }
+
+
+class FlakyAnalyzeRequest(RequestSchema):
+    FIELDS = {
+        'days': ((int,), 30),
+    }
+
+
+class AlertRuleRequest(RequestSchema):
+    FIELDS = {
+        'name': ((str,), REQUIRED),
+        'job_pattern': ((str,), None),
+        'min_severity': ((str,), 'medium'),
+        'channels': ((list,), lambda: ['slack']),
+        'team_name': ((str,), None),
+        'slack_webhook': ((str,), None),
+    }
+    ITEMS = {'channels': (str,)}
+
+
+class MaintenanceWindowRequest(RequestSchema):
+    FIELDS = {
+        'name': ((str,), REQUIRED),
+        'start': ((str,), REQUIRED),
+        'end': ((str,), REQUIRED),
+        'affected_jobs': ((list,), None),
+    }
+    ITEMS = {'affected_jobs': (str,)}
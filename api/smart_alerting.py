@@ -11,16 +11,32 @@ New capabilities:
 - Severity filter  : only escalate alerts that meet a threshold
 """
 
+import base64
+import bisect
 import json
 import hashlib
+import queue
+import threading
 import time
 import os
+from collections import deque
+from functools import partial
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Callable, Deque, Dict, List, Optional, Set, Tuple
 import logging
 
 from api.alerting import AlertManager
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
 logger = logging.getLogger(__name__)
 
 
@@ -37,14 +53,20 @@ class MaintenanceWindow:
         self.start = start
         self.end = end
         self.affected_jobs = affected_jobs  # None means every job
+        self._start_ts = start.timestamp()
+        self._end_ts = end.timestamp()
+        self._jobs_set = set(affected_jobs) if affected_jobs is not None else None
 
     def is_active(self) -> bool:
-        return self.start <= datetime.now() <= self.end
+        return self.is_active_at(time.time())
+
+    def is_active_at(self, ts: float) -> bool:
+        return self._start_ts <= ts <= self._end_ts
 
     def affects_job(self, job_name: str) -> bool:
-        if self.affected_jobs is None:
+        if self._jobs_set is None:
             return True
-        return job_name in self.affected_jobs
+        return job_name in self._jobs_set
 
 
 class AlertRule:
@@ -61,20 +83,92 @@ class AlertRule:
                  slack_webhook: Optional[str] = None):
         self.name = name
         self.job_pattern = job_pattern      # substring match; None = any job
+        self._pattern_lc = job_pattern.lower() if job_pattern is not None else None
         self.min_severity = min_severity
+        self._min_rank = self.SEVERITY_RANK.get(min_severity.lower(), 0)
         self.channels = channels or ['slack']
         self.team_name = team_name
         self.slack_webhook = slack_webhook  # override base webhook for this team
 
     def matches_job(self, job_name: str) -> bool:
-        if self.job_pattern is None:
+        return self.matches_job_lc(job_name.lower())
+
+    def matches_job_lc(self, job_lc: str) -> bool:
+        """matches_job for an already lower-cased job name."""
+        if self._pattern_lc is None:
             return True
-        return self.job_pattern.lower() in job_name.lower()
+        return self._pattern_lc in job_lc
 
     def severity_passes(self, severity: str) -> bool:
-        alert_rank = self.SEVERITY_RANK.get(severity.lower(), 0)
-        min_rank = self.SEVERITY_RANK.get(self.min_severity.lower(), 0)
-        return alert_rank >= min_rank
+        return self.SEVERITY_RANK.get(severity.lower(), 0) >= self._min_rank
+
+
+class SlidingBloomFilter:
+    """
+    Approximate set of fingerprints seen within a time window.
+
+    Bits are spread over `generations` rotating bit arrays; the oldest is
+    dropped every window / (generations - 1) seconds, so a member is
+    remembered for at least `window` and at most
+    window * generations / (generations - 1) seconds. Lookups can give
+    false positives (roughly 1% at 10 bits per member with 7 hashes), never
+    false negatives.
+    """
+
+    def __init__(self, window: float, size_bits: int, num_hashes: int = 7,
+                 generations: int = 3):
+        self.size_bits = size_bits
+        self.num_hashes = num_hashes
+        self.period = window / (generations - 1)
+        self._generations = deque(self._empty() for _ in range(generations))
+        self._rotated = time.time()
+
+    def _empty(self) -> bytearray:
+        return bytearray((self.size_bits + 7) // 8)
+
+    def _rotate(self, now: float):
+        steps = int((now - self._rotated) // self.period)
+        if steps <= 0:
+            return
+        for _ in range(min(steps, len(self._generations))):
+            self._generations.popleft()
+            self._generations.append(self._empty())
+        self._rotated += steps * self.period
+
+    def _positions(self, fingerprint: int) -> List[int]:
+        # Double hashing over the two halves of the 64-bit fingerprint
+        h1 = fingerprint & 0xFFFFFFFF
+        h2 = (fingerprint >> 32) | 1
+        return [(h1 + i * h2) % self.size_bits for i in range(self.num_hashes)]
+
+    def add(self, fingerprint: int, now: float):
+        self._rotate(now)
+        bits = self._generations[-1]
+        for pos in self._positions(fingerprint):
+            bits[pos >> 3] |= 1 << (pos & 7)
+
+    def contains(self, fingerprint: int, now: float) -> bool:
+        self._rotate(now)
+        positions = self._positions(fingerprint)
+        return any(
+            all(bits[pos >> 3] & (1 << (pos & 7)) for pos in positions)
+            for bits in self._generations
+        )
+
+    def to_dict(self) -> Dict:
+        return {
+            'size_bits': self.size_bits,
+            'rotated': self._rotated,
+            'generations': [base64.b64encode(bytes(g)).decode() for g in self._generations]
+        }
+
+    def restore(self, state: Dict):
+        """Load bits saved by to_dict if the filter shape still matches."""
+        generations = state.get('generations', [])
+        if state.get('size_bits') != self.size_bits or len(generations) != len(self._generations):
+            return
+        self._generations = deque(bytearray(base64.b64decode(g)) for g in generations)
+        self._rotated = state['rotated']
 
 
 # ---------------------------------------------------------------------------
@@ -88,37 +182,83 @@ class SmartAlertManager:
     without any change - just swap in a SmartAlertManager instance.
     """
 
+    RATE_LIMIT_MODES = ('token_bucket', 'sliding_window')
+
     def __init__(self,
                  alert_manager: AlertManager,
                  batch_window_seconds: int = 60,
                  dedup_window_seconds: int = 300,
                  max_alerts_per_hour: int = 20,
-                 state_file: str = './data/smart_alert_state.json'):
+                 state_file: str = './data/smart_alert_state.json',
+                 rate_limit_mode: str = 'token_bucket',
+                 dedup_bloom_bits: int = 0):
 
         # Original manager - NEVER modified
         self.alert_manager = alert_manager
 
         # Batching
         self.batch_window_seconds = batch_window_seconds
-        self._pending_batch: List[Dict] = []
+        # fingerprint -> queued anomaly; repeats bump its 'occurrences'
+        self._pending_batch: Dict[int, Dict] = {}
         self._batch_start_time: Optional[float] = None
 
         # Deduplication
         self.dedup_window_seconds = dedup_window_seconds
-        self._sent_fingerprints: Dict[str, float] = {}
-
-        # Rate limiting
+        # (sent_at, fingerprint) oldest first, plus the live fingerprints
+        self._fp_deque: Deque[Tuple[float, int]] = deque()
+        self._fp_set: Set[int] = set()
+        # Optional fixed-size approximate dedup for very high alert volumes
+        self._bloom = (SlidingBloomFilter(dedup_window_seconds, dedup_bloom_bits)
+                       if dedup_bloom_bits else None)
+
+        # Rate limiting. 'token_bucket' holds up to max_alerts_per_hour
+        # tokens refilled continuously over an hour; 'sliding_window'
+        # approximates a rolling hour from this and the previous hour's counts.
+        if rate_limit_mode not in self.RATE_LIMIT_MODES:
+            raise ValueError(f"Unknown rate_limit_mode: {rate_limit_mode}")
+        self.rate_limit_mode = rate_limit_mode
         self.max_alerts_per_hour = max_alerts_per_hour
-        self._alert_timestamps: List[float] = []
-
-        # Routing rules (first match wins)
+        self._bucket_tokens = float(max_alerts_per_hour)
+        self._bucket_rate = max_alerts_per_hour / 3600.0
+        self._bucket_last = time.time()
+        self._win_curr = 0
+        self._win_prev = 0
+        self._win_start = time.time()
+
+        # Routing rules (first match wins) and job name -> resolved rule
         self._rules: List[AlertRule] = []
+        self._route_cache: Dict[str, Optional[AlertRule]] = {}
+        # Rules that can still win (see _rebuild_routes) and, with
+        # pyahocorasick installed, an automaton over their patterns
+        self._route_candidates: List[AlertRule] = []
+        self._route_automaton = None
 
-        # Maintenance windows
+        # Team managers by webhook URL, so their HTTP/SMTP pools are reused
+        self._mgr_cache: Dict[str, AlertManager] = {}
+
+        # Maintenance windows, sorted by start time (with the starts kept
+        # alongside for bisect)
         self._maintenance_windows: List[MaintenanceWindow] = []
+        self._window_starts: List[float] = []
 
-        # State persistence path
+        # State persistence: snapshot at state_file, mutations appended to
+        # state_file + '.wal' in between
         self.state_file = state_file
+        self._wal = None
+        self._wal_events = 0
+        self._unsaved_suppressions = 0
+
+        # Delivery: webhook/SMTP calls run on one background worker so a
+        # slow or unreachable channel never blocks the caller
+        self._outbox: 'queue.Queue[Optional[Callable[[], bool]]]' = queue.Queue(maxsize=self.OUTBOX_SIZE)
+        self._worker = threading.Thread(target=self._run_worker,
+                                        name='smart-alert-delivery', daemon=True)
+        self._worker.start()
+
+        # Guards the dedup set, rate limiter, pending batch, stats and WAL:
+        # the API calls in from several worker and request threads.
+        # Re-entrant because snapshots are taken from inside locked sections
+        self._flush_lock = threading.RLock()
 
         # Statistics
         self.stats = {
@@ -145,81 +285,96 @@ class SmartAlertManager:
 
         Returns a dict describing what happened so callers can log it.
         """
-        self.stats['total_received'] += 1
-        job_name = self._extract_job_name(anomaly)
-        severity = self._extract_severity(anomaly)
-
-        outcome = {'sent': False, 'reason': None,
-                   'job_name': job_name, 'severity': severity}
-
-        if not force:
-            # -- 1. Maintenance window check --
-            if self._in_maintenance(job_name):
-                self.stats['suppressed_maintenance'] += 1
-                outcome['reason'] = 'maintenance_window'
-                logger.info(f"Alert suppressed (maintenance): {job_name}")
-                self._save_state()
-                return outcome
-
-            # -- 2. Deduplication check --
-            fp = self._fingerprint(anomaly)
-            if self._is_duplicate(fp):
-                self.stats['suppressed_duplicate'] += 1
-                outcome['reason'] = 'duplicate'
-                logger.info(f"Alert suppressed (duplicate): {job_name}")
-                self._save_state()
-                return outcome
-
-            # -- 3. Rate limit check --
-            if self._is_rate_limited():
-                self.stats['suppressed_rate_limit'] += 1
-                outcome['reason'] = 'rate_limit'
-                logger.warning(f"Alert suppressed (rate limit): {job_name}")
-                self._save_state()
-                return outcome
-
-            # -- 4. Resolve routing rule --
-            rule = self._resolve_rule(job_name)
-
-            # -- 5. Severity threshold check --
-            if rule and not rule.severity_passes(severity):
-                self.stats['suppressed_severity'] += 1
-                outcome['reason'] = 'below_severity_threshold'
-                logger.info(f"Alert suppressed (severity {severity} < {rule.min_severity}): {job_name}")
-                self._save_state()
-                return outcome
-
-            # -- 6. Determine channels --
-            if channels is None:
-                channels = rule.channels if rule else ['slack']
-
-            # -- 7. Use team-specific manager if rule defines one --
-            effective_manager = self._get_effective_manager(rule)
-
-            # -- 8. Record fingerprint now (before flush to count this send) --
-            self._record_sent(fp)
+        outcome = self._new_outcome(anomaly)
+
+        # Admission and the batch swap happen under the lock so concurrent
+        # callers never both pass the dedup check or both take the same
+        # batch; delivery itself runs after it is released
+        with self._flush_lock:
+            batch = self._admit(anomaly, channels, force, outcome)
+        if batch is None:
+            return outcome
+
+        manager, channels, alerts = batch
+        outcome['sent'] = self._send_batch(manager, channels, alerts)
+        outcome['reason'] = 'batch_flushed'
+        return outcome
 
-        else:
-            # force=True skips all suppression
-            effective_manager = self.alert_manager
-            if channels is None:
-                channels = ['slack', 'email']
+    def send_batch_alert(self, anomalies: List[Dict], max_items: int = 10) -> bool:
+        """
+        Send one summary alert for several anomalies.
 
-        # -- 9. Queue into batch --
-        self._add_to_batch(anomaly)
+        Compatible with AlertManager.send_batch_alert. Each anomaly still
+        goes through the severity, maintenance and duplicate checks; the
+        survivors are posted together and count as a single sent alert.
+        """
+        with self._flush_lock:
+            now = time.time()
+            accepted = []
+            fingerprints = set()
+            for anomaly in anomalies:
+                self.stats['total_received'] += 1
+                job_name = self._extract_job_name(anomaly)
+                severity = self._extract_severity(anomaly)
+
+                rule = self._resolve_rule(job_name)
+                if rule and not rule.severity_passes(severity):
+                    self._count_suppressed('severity')
+                    continue
+
+                if self._in_maintenance(job_name, now):
+                    self._count_suppressed('maintenance')
+                    continue
+
+                fp = self._fingerprint(anomaly)
+                if fp in fingerprints or self._is_duplicate(fp, now):
+                    self._count_suppressed('duplicate')
+                    continue
+
+                fingerprints.add(fp)
+                accepted.append(anomaly)
+
+            if not accepted:
+                return False
+
+            # Fingerprints are only recorded once the batch is really going
+            # out, so a rate-limited batch can be retried inside the window
+            if self._is_rate_limited(now):
+                self._count_suppressed('rate_limit', len(accepted))
+                logger.warning(f"Batch alert suppressed (rate limit): {len(accepted)} anomalies")
+                return False
+
+            for fp in fingerprints:
+                self._record_sent(fp, now)
+            self._record_alert_timestamp(now)
+            self.stats['total_sent'] += 1
+
+        logger.info(f"Sending batch of {len(accepted)} alerts")
+        return self._deliver(partial(self.alert_manager.send_batch_alert,
+                                     accepted, max_items=max_items))
+
+    def send_alerts_bulk(self, anomalies: List[Dict],
+                         channels: Optional[List[str]] = None) -> List[Dict]:
+        """
+        Send many alerts at once (e.g. every anomaly from one detection run).
 
-        # -- 10. Flush batch if window has elapsed --
-        if self._should_flush_batch():
-            ok = self._flush_batch(effective_manager, channels)
-            outcome['sent'] = ok
+        Every anomaly goes through the same checks as send_alert, but the
+        whole list is admitted under one hold of the lock and any batches
+        that fall due are delivered afterwards. Returns one outcome per anomaly.
+        """
+        outcomes, due = [], []
+        with self._flush_lock:
+            for anomaly in anomalies:
+                outcome = self._new_outcome(anomaly)
+                batch = self._admit(anomaly, channels, False, outcome)
+                if batch is not None:
+                    due.append((outcome, batch))
+                outcomes.append(outcome)
+
+        for outcome, (manager, batch_channels, alerts) in due:
+            outcome['sent'] = self._send_batch(manager, batch_channels, alerts)
             outcome['reason'] = 'batch_flushed'
-        else:
-            outcome['sent'] = False
-            outcome['reason'] = 'queued_in_batch'
-            logger.info(f"Alert queued ({len(self._pending_batch)} pending): {job_name}")
-
-        self._save_state()
-        return outcome
+        return outcomes
 
     def flush_now(self, channels: Optional[List[str]] = None) -> bool:
         """
@@ -227,13 +382,15 @@ class SmartAlertManager:
         Call this at the end of each scheduler detection cycle so no
         alerts are silently lost if the batch window has not elapsed.
         """
-        if not self._pending_batch:
-            return True
-        rule = self._resolve_rule(self._extract_job_name(self._pending_batch[0]))
-        effective_manager = self._get_effective_manager(rule)
+        with self._flush_lock:
+            batch = self._take_batch(time.time())
+            if not batch:
+                return True
+            rule = self._resolve_rule(self._extract_job_name(batch[0]))
+            effective_manager = self._get_effective_manager(rule)
         if channels is None:
             channels = rule.channels if rule else ['slack']
-        return self._flush_batch(effective_manager, channels)
+        return self._send_batch(effective_manager, channels, batch)
 
     # ------------------------------------------------------------------
     # Rule management
@@ -241,13 +398,23 @@ class SmartAlertManager:
 
     def add_rule(self, rule: AlertRule):
         """Add a routing rule. Evaluated in insertion order; first match wins."""
-        self._rules.append(rule)
+        with self._flush_lock:
+            self._rules.append(rule)
+            self._rebuild_routes()
         logger.info(f"Added alert rule: {rule.name}")
 
     def remove_rule(self, name: str):
-        self._rules = [r for r in self._rules if r.name != name]
+        with self._flush_lock:
+            self._rules = [r for r in self._rules if r.name != name]
+            self._rebuild_routes()
+
+            in_use = {r.slack_webhook for r in self._rules}
+            for webhook in [w for w in self._mgr_cache if w not in in_use]:
+                self._mgr_cache.pop(webhook).close()
 
     def list_rules(self) -> List[Dict]:
+        with self._flush_lock:
+            rules = list(self._rules)
         return [
             {
                 'name': r.name,
@@ -256,7 +423,7 @@ class SmartAlertManager:
                 'channels': r.channels,
                 'team_name': r.team_name
             }
-            for r in self._rules
+            for r in rules
         ]
 
     # ------------------------------------------------------------------
@@ -264,15 +431,19 @@ class SmartAlertManager:
     # ------------------------------------------------------------------
 
     def add_maintenance_window(self, window: MaintenanceWindow):
-        self._maintenance_windows.append(window)
+        with self._flush_lock:
+            i = bisect.bisect_right(self._window_starts, window._start_ts)
+            self._maintenance_windows.insert(i, window)
+            self._window_starts.insert(i, window._start_ts)
         logger.info(f"Added maintenance window: {window.name}")
 
     def remove_maintenance_window(self, name: str):
-        self._maintenance_windows = [
-            w for w in self._maintenance_windows if w.name != name
-        ]
+        with self._flush_lock:
+            self._set_windows([w for w in self._maintenance_windows if w.name != name])
 
     def list_active_windows(self) -> List[Dict]:
+        with self._flush_lock:
+            windows = self._started_windows(time.time())
         return [
             {
                 'name': w.name,
@@ -280,7 +451,7 @@ class SmartAlertManager:
                 'end': w.end.isoformat(),
                 'affected_jobs': w.affected_jobs
             }
-            for w in self._maintenance_windows if w.is_active()
+            for w in windows
         ]
 
     # ------------------------------------------------------------------
@@ -288,20 +459,26 @@ class SmartAlertManager:
     # ------------------------------------------------------------------
 
     def get_stats(self) -> Dict:
+        with self._flush_lock:
+            stats = dict(self.stats)
+            pending = len(self._pending_batch)
+            alerts_last_hour = self._count_alerts_last_hour()
+            active_windows = len(self._started_windows(time.time()))
+            registered_rules = len(self._rules)
         suppressed = (
-            self.stats['suppressed_duplicate'] +
-            self.stats['suppressed_maintenance'] +
-            self.stats['suppressed_rate_limit'] +
-            self.stats['suppressed_severity']
+            stats['suppressed_duplicate'] +
+            stats['suppressed_maintenance'] +
+            stats['suppressed_rate_limit'] +
+            stats['suppressed_severity']
         )
         return {
-            **self.stats,
+            **stats,
             'total_suppressed': suppressed,
-            'suppression_rate': suppressed / max(self.stats['total_received'], 1),
-            'pending_in_batch': len(self._pending_batch),
-            'active_maintenance_windows': len(self.list_active_windows()),
-            'registered_rules': len(self._rules),
-            'alerts_last_hour': self._count_alerts_last_hour()
+            'suppression_rate': suppressed / max(stats['total_received'], 1),
+            'pending_in_batch': pending,
+            'active_maintenance_windows': active_windows,
+            'registered_rules': registered_rules,
+            'alerts_last_hour': alerts_last_hour
         }
 
     # ------------------------------------------------------------------
@@ -324,122 +501,491 @@ class SmartAlertManager:
             return 'medium'
         return 'low'
 
-    def _fingerprint(self, anomaly: Dict) -> str:
+    def _fingerprint(self, anomaly: Dict) -> int:
+        # Key on the job and its leading (highest z-score) feature only, so a
+        # noisy job whose secondary features flicker still coalesces into one
+        # alert per dedup window. A 64-bit blake2b digest kept as an int is
+        # plenty for dedup and much smaller than a hex string.
         job = self._extract_job_name(anomaly)
-        features = sorted(f['feature'] for f in anomaly.get('anomaly_features', []))
-        raw = f"{job}|{'|'.join(features)}"
-        return hashlib.md5(raw.encode()).hexdigest()
+        features = anomaly.get('anomaly_features', [])
+        top = max(features, key=lambda f: f.get('z_score', 0))['feature'] if features else ''
+        # Serialize as a JSON pair so a '|' inside a job name cannot collide
+        payload = (job, top)
+        raw = orjson.dumps(payload) if orjson else json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode()
+        return int.from_bytes(hashlib.blake2b(raw, digest_size=8).digest(), 'big')
+
+    def _prune_fingerprints(self, now: float):
+        # Entries are in send order, so expired ones are all at the left end
+        cutoff = now - self.dedup_window_seconds
+        while self._fp_deque and self._fp_deque[0][0] <= cutoff:
+            _, old = self._fp_deque.popleft()
+            self._fp_set.discard(old)
+
+    def _is_duplicate(self, fingerprint: int, now: float) -> bool:
+        if self._bloom is not None:
+            return self._bloom.contains(fingerprint, now)
+        self._prune_fingerprints(now)
+        return fingerprint in self._fp_set
+
+    def _add_fingerprint(self, fingerprint: int, sent_at: float):
+        if self._bloom is not None:
+            self._bloom.add(fingerprint, sent_at)
+            return
+        self._fp_deque.append((sent_at, fingerprint))
+        self._fp_set.add(fingerprint)
+
+    def _record_sent(self, fingerprint: int, now: float):
+        self._prune_fingerprints(now)
+        self._add_fingerprint(fingerprint, now)
+        self._wal_append({'fp': fingerprint, 't': now})
+
+    def _refill_bucket(self, now: float):
+        elapsed = max(now - self._bucket_last, 0.0)
+        self._bucket_tokens = min(self.max_alerts_per_hour,
+                                  self._bucket_tokens + elapsed * self._bucket_rate)
+        self._bucket_last = max(now, self._bucket_last)
+
+    def _consume_token(self, now: float):
+        self._refill_bucket(now)
+        self._bucket_tokens -= 1
+
+    def _roll_window(self, now: float):
+        elapsed = now - self._win_start
+        if elapsed >= 3600:
+            # Two or more hours on, the previous hour saw nothing
+            self._win_prev = self._win_curr if elapsed < 7200 else 0
+            self._win_curr = 0
+            self._win_start = now - (elapsed % 3600)
+
+    def _sliding_count(self, now: float) -> float:
+        self._roll_window(now)
+        weight = 1.0 - min(max(now - self._win_start, 0.0) / 3600.0, 1.0)
+        return self._win_prev * weight + self._win_curr
+
+    def _record_rate(self, now: float):
+        if self.rate_limit_mode == 'sliding_window':
+            self._roll_window(now)
+            self._win_curr += 1
+        else:
+            self._consume_token(now)
 
-    def _is_duplicate(self, fingerprint: str) -> bool:
-        last = self._sent_fingerprints.get(fingerprint)
-        if last is None:
-            return False
-        return (time.time() - last) < self.dedup_window_seconds
-
-    def _record_sent(self, fingerprint: str):
-        self._sent_fingerprints[fingerprint] = time.time()
-        # Prune stale entries
-        cutoff = time.time() - self.dedup_window_seconds
-        self._sent_fingerprints = {
-            k: v for k, v in self._sent_fingerprints.items() if v > cutoff
-        }
+    def _record_alert_timestamp(self, now: float):
+        self._record_rate(now)
+        self._wal_append({'ts': now})
 
-    def _is_rate_limited(self) -> bool:
-        self._alert_timestamps = [
-            t for t in self._alert_timestamps if time.time() - t < 3600
-        ]
-        return len(self._alert_timestamps) >= self.max_alerts_per_hour
+    def _is_rate_limited(self, now: float) -> bool:
+        if self.rate_limit_mode == 'sliding_window':
+            return self._sliding_count(now) >= self.max_alerts_per_hour
+        self._refill_bucket(now)
+        return self._bucket_tokens < 1
 
     def _count_alerts_last_hour(self) -> int:
-        return len([t for t in self._alert_timestamps if time.time() - t < 3600])
+        now = time.time()
+        if self.rate_limit_mode == 'sliding_window':
+            return int(self._sliding_count(now))
+        self._refill_bucket(now)
+        return max(int(self.max_alerts_per_hour - self._bucket_tokens), 0)
 
-    def _in_maintenance(self, job_name: str) -> bool:
-        return any(
-            w.is_active() and w.affects_job(job_name)
-            for w in self._maintenance_windows
-        )
+    def _set_windows(self, windows: List[MaintenanceWindow]):
+        self._maintenance_windows = windows
+        self._window_starts = [w._start_ts for w in windows]
 
-    def _resolve_rule(self, job_name: str) -> Optional[AlertRule]:
+    def _started_windows(self, now: float) -> List[MaintenanceWindow]:
+        """
+        Windows active at `now`. Only windows that have started are looked
+        at; ones that have already ended can never match again, so they are
+        dropped here, leaving each lookup O(log n + active windows). Caller
+        holds _flush_lock, since the pruning rewrites both window lists.
+        """
+        started = bisect.bisect_right(self._window_starts, now)
+        active = [w for w in self._maintenance_windows[:started] if w._end_ts >= now]
+        if len(active) != started:
+            self._set_windows(active + self._maintenance_windows[started:])
+        return active
+
+    def _in_maintenance(self, job_name: str, now: float) -> bool:
+        with self._flush_lock:
+            return any(w.affects_job(job_name) for w in self._started_windows(now))
+
+    # Distinct job names remembered by _resolve_rule
+    ROUTE_CACHE_SIZE = 4096
+
+    def _rebuild_routes(self):
+        """
+        Precompute rule lookup after the rule list changes. Only the first
+        rule with a given pattern can ever win, and nothing after the first
+        catch-all (no pattern, or an empty one) can, so those are dropped.
+        """
+        self._route_cache.clear()
+        candidates, seen = [], set()
         for rule in self._rules:
-            if rule.matches_job(job_name):
-                return rule
-        return None
+            if rule._pattern_lc in seen:
+                continue
+            seen.add(rule._pattern_lc)
+            candidates.append(rule)
+            if not rule._pattern_lc:
+                break
+        self._route_candidates = candidates
+
+        # One pass over the job name finds every matching pattern, however
+        # many rules there are
+        self._route_automaton = None
+        if ahocorasick is not None and any(r._pattern_lc for r in candidates):
+            automaton = ahocorasick.Automaton()
+            for i, rule in enumerate(candidates):
+                if rule._pattern_lc:
+                    automaton.add_word(rule._pattern_lc, i)
+            automaton.make_automaton()
+            self._route_automaton = automaton
+
+    def _resolve_rule(self, job_name: str) -> Optional[AlertRule]:
+        # Callers hold _flush_lock: a miss writes to the route cache
+        try:
+            return self._route_cache[job_name]
+        except KeyError:
+            pass
+
+        job_lc = job_name.lower()
+        candidates = self._route_candidates
+        if self._route_automaton is not None:
+            # Lowest index is the earliest rule; a trailing catch-all
+            # only applies when no pattern matched
+            hits = [i for _, i in self._route_automaton.iter(job_lc)]
+            if hits:
+                resolved = candidates[min(hits)]
+            elif not candidates[-1]._pattern_lc:
+                resolved = candidates[-1]
+            else:
+                resolved = None
+        else:
+            resolved = next((r for r in candidates if r.matches_job_lc(job_lc)), None)
+
+        if len(self._route_cache) >= self.ROUTE_CACHE_SIZE:
+            self._route_cache.clear()
+        self._route_cache[job_name] = resolved
+        return resolved
 
     def _get_effective_manager(self,
                                rule: Optional[AlertRule]) -> AlertManager:
         """
         Return a manager configured for the rule's team webhook.
-        Creates a new AlertManager if override needed - never mutates the original.
+        Creates (and caches) an AlertManager if override needed - never mutates the original.
         """
-        if rule and rule.slack_webhook:
+        if not (rule and rule.slack_webhook):
+            return self.alert_manager
+
+        manager = self._mgr_cache.get(rule.slack_webhook)
+        if manager is None:
             override = dict(self.alert_manager.config)
             override['slack_webhook_url'] = rule.slack_webhook
-            return AlertManager(override)
-        return self.alert_manager
+            manager = AlertManager(override)
+            self._mgr_cache[rule.slack_webhook] = manager
+        return manager
+
+    def _new_outcome(self, anomaly: Dict) -> Dict:
+        return {'sent': False, 'reason': None,
+                'job_name': self._extract_job_name(anomaly),
+                'severity': self._extract_severity(anomaly)}
+
+    def _admit(self, anomaly: Dict, channels: Optional[List[str]],
+               force: bool, outcome: Dict) -> Optional[Tuple[AlertManager, List[str], List[Dict]]]:
+        """
+        Run the suppression checks and queue the alert; caller holds
+        _flush_lock. Returns (manager, channels, batch) when the batch window
+        has elapsed and the batch was taken for delivery.
+        """
+        self.stats['total_received'] += 1
+        job_name = outcome['job_name']
+        severity = outcome['severity']
+
+        if not force:
+            # Cheapest checks first: most suppressed alerts are rejected
+            # before the clock is read or a fingerprint is hashed
+
+            # -- 1. Severity threshold of the routing rule (memoized per job) --
+            rule = self._resolve_rule(job_name)
+            if rule and AlertRule.SEVERITY_RANK.get(severity.lower(), 0) < rule._min_rank:
+                self._count_suppressed('severity')
+                outcome['reason'] = 'below_severity_threshold'
+                logger.info(f"Alert suppressed (severity {severity} < {rule.min_severity}): {job_name}")
+                return None
+
+            # One clock read per alert: every check below sees the same instant
+            now = time.time()
+
+            # -- 2. Maintenance window check --
+            if self._maintenance_windows and self._in_maintenance(job_name, now):
+                self._count_suppressed('maintenance')
+                outcome['reason'] = 'maintenance_window'
+                logger.info(f"Alert suppressed (maintenance): {job_name}")
+                return None
+
+            # -- 3. Rate limit check --
+            if self._is_rate_limited(now):
+                self._count_suppressed('rate_limit')
+                outcome['reason'] = 'rate_limit'
+                logger.warning(f"Alert suppressed (rate limit): {job_name}")
+                return None
+
+            # -- 4. Deduplication check --
+            fp = self._fingerprint(anomaly)
+            if self._is_duplicate(fp, now):
+                self._count_suppressed('duplicate')
+                outcome['reason'] = 'duplicate'
+                logger.info(f"Alert suppressed (duplicate): {job_name}")
+                return None
+
+            # -- 5. Determine channels --
+            if channels is None:
+                channels = rule.channels if rule else ['slack']
+
+            # -- 6. Use team-specific manager if rule defines one --
+            effective_manager = self._get_effective_manager(rule)
+
+            # -- 7. Record fingerprint now (before flush to count this send) --
+            self._record_sent(fp, now)
+
+        else:
+            # force=True skips all suppression
+            now = time.time()
+            effective_manager = self.alert_manager
+            if channels is None:
+                channels = ['slack', 'email']
+
+        # -- 8. Queue into batch --
+        self._add_to_batch(anomaly, now, None if force else fp)
+
+        # -- 9. Take the batch for delivery if window has elapsed --
+        if self._should_flush_batch(now):
+            return effective_manager, channels, self._take_batch(now)
+
+        outcome['reason'] = 'queued_in_batch'
+        logger.info(f"Alert queued ({len(self._pending_batch)} pending): {job_name}")
+        return None
 
-    def _add_to_batch(self, anomaly: Dict):
+    def _add_to_batch(self, anomaly: Dict, now: float,
+                      fingerprint: Optional[int] = None):
         if self._batch_start_time is None:
-            self._batch_start_time = time.time()
-        self._pending_batch.append(anomaly)
+            self._batch_start_time = now
+        if fingerprint is None:
+            fingerprint = self._fingerprint(anomaly)
+
+        entry = self._pending_batch.get(fingerprint)
+        if entry is not None:
+            entry['occurrences'] += 1
+        else:
+            # Copy so the caller's anomaly is never annotated
+            self._pending_batch[fingerprint] = {**anomaly, 'occurrences': 1}
         self.stats['batched'] += 1
 
-    def _should_flush_batch(self) -> bool:
+    def _should_flush_batch(self, now: float) -> bool:
         if not self._pending_batch or self._batch_start_time is None:
             return False
-        return (time.time() - self._batch_start_time) >= self.batch_window_seconds
+        return (now - self._batch_start_time) >= self.batch_window_seconds
 
-    def _flush_batch(self, manager: AlertManager,
-                     channels: List[str]) -> bool:
+    def _take_batch(self, now: float) -> List[Dict]:
+        """Swap out the pending batch and count it as one send; caller holds _flush_lock."""
         if not self._pending_batch:
-            return True
+            return []
 
-        batch = self._pending_batch.copy()
-        self._pending_batch = []
+        batch = list(self._pending_batch.values())
+        self._pending_batch = {}
         self._batch_start_time = None
 
-        self._alert_timestamps.append(time.time())
+        self._record_alert_timestamp(now)
         self.stats['total_sent'] += 1
+        return batch
 
+    def _send_batch(self, manager: AlertManager,
+                    channels: List[str], batch: List[Dict]) -> bool:
         if len(batch) == 1:
-            result = manager.send_alert(batch[0], channels=channels)
-            logger.info(f"Sent 1 alert: {self._extract_job_name(batch[0])}")
-            return bool(result)
+            logger.info(f"Sending 1 alert: {self._extract_job_name(batch[0])}")
+            return self._deliver(partial(manager.send_alert, batch[0], channels=channels))
         else:
-            result = manager.send_batch_alert(batch)
-            logger.info(f"Sent batch of {len(batch)} alerts")
-            return bool(result)
+            logger.info(f"Sending batch of {len(batch)} alerts")
+            return self._deliver(partial(manager.send_batch_alert, batch))
+
+    # ------------------------------------------------------------------
+    # Delivery worker
+    # ------------------------------------------------------------------
+
+    # Sends waiting for the worker before callers deliver inline instead
+    OUTBOX_SIZE = 10_000
+
+    def _deliver(self, send: Callable[[], bool]) -> bool:
+        """
+        Hand a send to the delivery worker. Returns True once queued; if the
+        outbox is full (or the manager is closed) the send runs inline
+        rather than being dropped.
+        """
+        if not self._worker.is_alive():
+            return bool(send())
+        try:
+            self._outbox.put_nowait(send)
+            return True
+        except queue.Full:
+            logger.warning("Alert outbox full, delivering inline")
+            return bool(send())
+
+    def _run_worker(self):
+        while True:
+            send = self._outbox.get()
+            try:
+                if send is None:
+                    return
+                if not send():
+                    logger.warning("Alert delivery reported failure")
+            except Exception as e:
+                logger.error(f"Alert delivery failed: {e}")
+            finally:
+                self._outbox.task_done()
+
+    def wait_for_delivery(self):
+        """Block until every queued send has been attempted."""
+        self._outbox.join()
 
     # ------------------------------------------------------------------
     # State persistence
     # ------------------------------------------------------------------
 
-    def _save_state(self):
+    # WAL events between full snapshots
+    SNAPSHOT_EVERY = 100
+    # Suppressions only touch stats; snapshot them after this many
+    STATS_SNAPSHOT_EVERY = 1000
+
+    def close(self):
+        """
+        Finish queued sends, write a final snapshot (stats are only persisted
+        in snapshots) and close team managers.
+        """
+        if self._worker.is_alive():
+            self._outbox.put(None)
+            self._worker.join()
+        self._snapshot()
+        if self._wal is not None:
+            self._wal.close()
+            self._wal = None
+
+        for manager in self._mgr_cache.values():
+            manager.close()
+        self._mgr_cache.clear()
+
+    def _count_suppressed(self, reason: str, n: int = 1):
+        """Bump a suppression counter; nothing is written until enough pile up."""
+        self.stats[f'suppressed_{reason}'] += n
+        self._unsaved_suppressions += n
+        if self._unsaved_suppressions >= self.STATS_SNAPSHOT_EVERY:
+            self._snapshot()
+
+    def _wal_path(self) -> str:
+        return self.state_file + '.wal'
+
+    def _wal_append(self, event: Dict):
+        """Append one state mutation as a JSON line; snapshot every SNAPSHOT_EVERY events."""
+        try:
+            if self._wal is None:
+                os.makedirs(os.path.dirname(self.state_file) or '.', exist_ok=True)
+                self._wal = open(self._wal_path(), 'a', buffering=1)
+            self._wal.write(json.dumps(event) + '\n')
+        except Exception as e:
+            logger.warning(f"Could not append smart alert state: {e}")
+            return
+
+        self._wal_events += 1
+        if self._wal_events >= self.SNAPSHOT_EVERY:
+            self._snapshot()
+
+    def _snapshot(self):
+        """Atomically rewrite the compact state file, then truncate the WAL."""
+        with self._flush_lock:
+            self._write_snapshot()
+
+    def _write_snapshot(self):
         try:
             os.makedirs(os.path.dirname(self.state_file) or '.', exist_ok=True)
             state = {
-                'fingerprints': self._sent_fingerprints,
-                'alert_timestamps': self._alert_timestamps,
-                'stats': self.stats
+                'fingerprints': {fp: t for t, fp in self._fp_deque},
+                'bloom': self._bloom.to_dict() if self._bloom is not None else None,
+                'rate_bucket': {'tokens': self._bucket_tokens, 'last': self._bucket_last},
+                'rate_window': {'curr': self._win_curr, 'prev': self._win_prev,
+                                'start': self._win_start},
+                'saved_at': time.time(),
+                'stats': dict(self.stats)
             }
-            with open(self.state_file, 'w') as f:
+            tmp_path = self.state_file + '.tmp'
+            with open(tmp_path, 'w') as f:
                 json.dump(state, f)
+            os.replace(tmp_path, self.state_file)
+
+            if self._wal is not None:
+                self._wal.close()
+            self._wal = open(self._wal_path(), 'w', buffering=1)
+            self._wal_events = 0
+            self._unsaved_suppressions = 0
         except Exception as e:
             logger.warning(f"Could not save smart alert state: {e}")
 
     def _load_state(self):
+        # Counters start empty; replayed sends advance them from their own times
+        self._bucket_last = 0.0
+        self._win_start = 0.0
+        snapshot_last = 0.0
         try:
-            if not os.path.exists(self.state_file):
-                return
-            with open(self.state_file) as f:
-                state = json.load(f)
-            self._sent_fingerprints = state.get('fingerprints', {})
-            self._alert_timestamps = state.get('alert_timestamps', [])
-            saved_stats = state.get('stats', {})
-            self.stats.update(saved_stats)
-            logger.info("Loaded smart alert state from disk")
+            if os.path.exists(self.state_file):
+                with open(self.state_file) as f:
+                    state = json.load(f)
+                if self._bloom is not None and state.get('bloom'):
+                    self._bloom.restore(state['bloom'])
+
+                # JSON object keys are strings; md5 hex keys from older
+                # versions can never match again and are dropped
+                fingerprints = state.get('fingerprints', {})
+                for fp, t in sorted(fingerprints.items(), key=lambda item: item[1]):
+                    if fp.isdigit():
+                        self._add_fingerprint(int(fp), t)
+                bucket = state.get('rate_bucket')
+                if bucket:
+                    self._bucket_tokens = bucket['tokens']
+                    self._bucket_last = bucket['last']
+                    window = state.get('rate_window', {})
+                    self._win_curr = window.get('curr', 0)
+                    self._win_prev = window.get('prev', 0)
+                    self._win_start = window.get('start', 0.0)
+                    snapshot_last = state.get('saved_at', bucket['last'])
+                else:
+                    # Older snapshots stored every sent-alert timestamp
+                    timestamps = sorted(state.get('alert_timestamps', []))
+                    for t in timestamps:
+                        self._record_rate(t)
+                    snapshot_last = timestamps[-1] if timestamps else 0.0
+                saved_stats = state.get('stats', {})
+                self.stats.update(saved_stats)
+                logger.info("Loaded smart alert state from disk")
+
+            if os.path.exists(self._wal_path()):
+                self._replay_wal(snapshot_last)
+            self._prune_fingerprints(time.time())
         except Exception as e:
             logger.warning(f"Could not load smart alert state: {e}")
 
+    def _replay_wal(self, snapshot_last: float):
+        # Sends at or before the snapshot was taken were already counted
+        # (a crash between snapshot and WAL truncation leaves them in both)
+        with open(self._wal_path()) as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue  # torn final line
+                if isinstance(event.get('fp'), int):
+                    # Events are chronological; skip ones the snapshot already holds
+                    self._prune_fingerprints(event['t'])
+                    if event['fp'] not in self._fp_set:
+                        self._add_fingerprint(event['fp'], event['t'])
+                elif 'ts' in event and event['ts'] > snapshot_last:
+                    self._record_rate(event['ts'])
+                self._wal_events += 1
+
 
 # ---------------------------------------------------------------------------
 # Convenience factory
@@ -454,6 +1000,8 @@ def create_smart_alert_manager(alert_manager: AlertManager,
         batch_window_seconds   int   (default 60)
         dedup_window_seconds   int   (default 300)
         max_alerts_per_hour    int   (default 20)
+        rate_limit_mode        str   'token_bucket' (default) or 'sliding_window'
+        dedup_bloom_bits       int   Bloom filter size for approximate dedup (default 0 = exact)
         rules                  list  of rule dicts
         maintenance_windows    list  of window dicts
     """
@@ -463,7 +1011,9 @@ def create_smart_alert_manager(alert_manager: AlertManager,
         alert_manager=alert_manager,
         batch_window_seconds=cfg.get('batch_window_seconds', 60),
         dedup_window_seconds=cfg.get('dedup_window_seconds', 300),
-        max_alerts_per_hour=cfg.get('max_alerts_per_hour', 20)
+        max_alerts_per_hour=cfg.get('max_alerts_per_hour', 20),
+        rate_limit_mode=cfg.get('rate_limit_mode', 'token_bucket'),
+        dedup_bloom_bits=cfg.get('dedup_bloom_bits', 0)
     )
 
     for r in cfg.get('rules', []):
@@ -570,6 +1120,7 @@ def main():
     time.sleep(3)
     print("--- Flushing batch ---")
     smart.flush_now()
+    smart.wait_for_delivery()
 
     print("\n" + "=" * 60)
     print("STATISTICS")
@@ -3,19 +3,38 @@ GitHub Actions Metrics Collector
 Collects workflow run metrics from GitHub Actions
 """
 
+import numpy as np
 import requests
 import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Dict, List, Optional
 import logging
 
+from collectors.http import new_session
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from ciso8601 import parse_datetime as _parse_datetime
+except ImportError:
+    def _parse_datetime(value: str) -> datetime:
+        # fromisoformat only accepts a trailing 'Z' from Python 3.11
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
 
 class GitHubActionsCollector:
     """Collects pipeline metrics from GitHub Actions"""
     
+    # Concurrent per-run job requests when include_jobs=True
+    JOB_FETCH_WORKERS = 16
+    
     def __init__(self, token: str, repo: str):
         self.token = token
         self.repo = repo
@@ -25,14 +44,25 @@ class GitHubActionsCollector:
             "Accept": "application/vnd.github.v3+json"
         }
         
+        # Keep-alive session used by all requests (and the job fetch
+        # threads), on the shared retrying connection pool
+        self.session = new_session(self.headers)
+        
+        # (url, per_page) -> (ETag, runs) from the last full response
+        self._runs_cache: Dict[tuple, tuple] = {}
+        
+    def _json(self, response):
+        """Decode a JSON response body, with orjson when it is installed"""
+        return orjson.loads(response.content) if orjson else response.json()
+    
     def get_workflows(self) -> List[Dict]:
         """Get list of all workflows"""
         try:
             url = f"{self.base_url}/repos/{self.repo}/actions/workflows"
-            response = requests.get(url, headers=self.headers, timeout=10)
+            response = self.session.get(url, timeout=10)
             response.raise_for_status()
-            return response.json().get('workflows', [])
-        except Exception as e:
+            return self._json(response).get('workflows', [])
+        except (requests.RequestException, ValueError) as e:
             logger.error(f"Error fetching workflows: {e}")
             return []
     
@@ -41,10 +71,24 @@ class GitHubActionsCollector:
         try:
             url = f"{self.base_url}/repos/{self.repo}/actions/workflows/{workflow_id}/runs"
             params = {'per_page': per_page, 'status': 'completed'}
-            response = requests.get(url, headers=self.headers, params=params, timeout=10)
+            
+            # Conditional request: GitHub answers 304 with no body (and no
+            # rate-limit cost) when nothing changed since the cached ETag
+            cache_key = (url, per_page)
+            cached = self._runs_cache.get(cache_key)
+            headers = {'If-None-Match': cached[0]} if cached else None
+            
+            response = self.session.get(url, params=params, headers=headers, timeout=10)
+            if response.status_code == 304 and cached:
+                return cached[1]
             response.raise_for_status()
-            return response.json().get('workflow_runs', [])
-        except Exception as e:
+            
+            runs = self._json(response).get('workflow_runs', [])
+            etag = response.headers.get('ETag')
+            if etag:
+                self._runs_cache[cache_key] = (etag, runs)
+            return runs
+        except (requests.RequestException, ValueError) as e:
             logger.error(f"Error fetching workflow runs for {workflow_id}: {e}")
             return []
     
@@ -52,39 +96,47 @@ class GitHubActionsCollector:
         """Get jobs for a specific run"""
         try:
             url = f"{self.base_url}/repos/{self.repo}/actions/runs/{run_id}/jobs"
-            response = requests.get(url, headers=self.headers, timeout=10)
+            response = self.session.get(url, timeout=10)
             response.raise_for_status()
-            return response.json().get('jobs', [])
-        except Exception as e:
+            return self._json(response).get('jobs', [])
+        except (requests.RequestException, ValueError) as e:
             logger.error(f"Error fetching jobs for run {run_id}: {e}")
             return []
     
     def extract_metrics(self, run: Dict, workflow_name: str) -> Dict:
         """Extract relevant metrics from workflow run"""
-        created_at = datetime.fromisoformat(run['created_at'].replace('Z', '+00:00'))
-        updated_at = datetime.fromisoformat(run['updated_at'].replace('Z', '+00:00'))
+        return self.extract_metrics_batch([run], workflow_name)[0]
+    
+    def extract_metrics_batch(self, runs: List[Dict], workflow_name: str) -> List[Dict]:
+        """Extract metrics for all runs of a workflow, with durations computed on arrays"""
+        if not runs:
+            return []
         
-        if run.get('run_started_at'):
-            started_at = datetime.fromisoformat(run['run_started_at'].replace('Z', '+00:00'))
-            queue_time = (started_at - created_at).total_seconds()
-        else:
-            queue_time = 0
+        created_at = [_parse_datetime(run['created_at']) for run in runs]
+        created = np.array([dt.timestamp() for dt in created_at])
+        updated = np.array([_parse_datetime(run['updated_at']).timestamp() for run in runs])
+        started = np.array([
+            _parse_datetime(run['run_started_at']).timestamp() if run.get('run_started_at') else np.nan
+            for run in runs
+        ])
         
-        duration = (updated_at - created_at).total_seconds()
+        durations = (updated - created).tolist()
+        queue_times = np.nan_to_num(started - created, nan=0.0).tolist()
         
-        metrics = {
-            'timestamp': created_at.isoformat(),
-            'workflow_name': workflow_name,
-            'run_number': run.get('run_number', 0),
-            'run_id': run.get('id', 0),
-            'duration': duration,
-            'queue_time': queue_time,
-            'result': run.get('conclusion', 'unknown'),
-            'event': run.get('event', 'unknown'),
-            'attempt': run.get('run_attempt', 1),
-        }
-        
-        return metrics
+        return [
+            {
+                'timestamp': created_dt.isoformat(),
+                'workflow_name': workflow_name,
+                'run_number': run.get('run_number', 0),
+                'run_id': run.get('id', 0),
+                'duration': duration,
+                'queue_time': queue_time,
+                'result': run.get('conclusion', 'unknown'),
+                'event': run.get('event', 'unknown'),
+                'attempt': run.get('run_attempt', 1),
+            }
+            for run, created_dt, duration, queue_time in zip(runs, created_at, durations, queue_times)
+        ]
     
     def get_job_metrics(self, run_id: int) -> Dict:
         """Get detailed job metrics for a run"""
@@ -101,9 +153,9 @@ class GitHubActionsCollector:
             metrics['step_count'] += len(job.get('steps', []))
             
             if job.get('started_at') and job.get('completed_at'):
-                started = datetime.fromisoformat(job['started_at'].replace('Z', '+00:00'))
-                completed = datetime.fromisoformat(job['completed_at'].replace('Z', '+00:00'))
-                metrics['total_job_duration'] += (completed - started).total_seconds()
+                started = _parse_datetime(job['started_at']).timestamp()
+                completed = _parse_datetime(job['completed_at']).timestamp()
+                metrics['total_job_duration'] += completed - started
             
             if job.get('conclusion') == 'failure':
                 metrics['failed_jobs'] += 1
@@ -122,12 +174,14 @@ class GitHubActionsCollector:
             
             runs = self.get_workflow_runs(workflow_id, runs_per_workflow)
             
-            for run in runs:
-                metrics = self.extract_metrics(run, workflow_name)
-                
+            if include_jobs and runs:
+                # One request per run; overlap them instead of waiting on each
+                with ThreadPoolExecutor(max_workers=min(self.JOB_FETCH_WORKERS, len(runs))) as pool:
+                    run_job_metrics = list(pool.map(self.get_job_metrics, [run['id'] for run in runs]))
+            
+            for i, metrics in enumerate(self.extract_metrics_batch(runs, workflow_name)):
                 if include_jobs:
-                    job_metrics = self.get_job_metrics(run['id'])
-                    metrics.update(job_metrics)
+                    metrics.update(run_job_metrics[i])
                 else:
                     # Set default values
                     metrics.update({
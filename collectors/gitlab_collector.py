@@ -3,19 +3,81 @@ GitLab CI/CD Metrics Collector
 Collects pipeline and job metrics from GitLab
 """
 
+import numpy as np
 import requests
 import json
-from datetime import datetime
-from typing import Dict, List, Optional
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import unquote
 import logging
 
+from collectors.http import new_session
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from ciso8601 import parse_datetime as _parse_datetime
+except ImportError:
+    def _parse_datetime(value: str) -> datetime:
+        # fromisoformat only accepts a trailing 'Z' from Python 3.11
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+# GitLab pipeline status -> standard result
+_STATUS_MAP = {
+    'success': 'SUCCESS',
+    'failed': 'FAILURE',
+    'canceled': 'CANCELLED',
+    'skipped': 'SKIPPED',
+    'running': 'RUNNING',
+    'pending': 'PENDING',
+    'manual': 'MANUAL'
+}
+
+# Pipelines with their jobs and test summary in one round trip per page
+_PIPELINES_QUERY = """
+query($path: ID!, $first: Int!, $after: String, $updatedAfter: Time, $withJobs: Boolean!, $withTests: Boolean!) {
+  project(fullPath: $path) {
+    pipelines(first: $first, after: $after, updatedAfter: $updatedAfter) {
+      pageInfo { hasNextPage endCursor }
+      nodes {
+        id iid ref status path createdAt startedAt finishedAt
+        jobs @include(if: $withJobs) { nodes { status duration } }
+        testReportSummary @include(if: $withTests) { total { count failed } }
+      }
+    }
+  }
+}
+"""
+
 
 class GitLabCollector:
     """Collects CI/CD metrics from GitLab"""
     
+    # Concurrent API requests made by collect_all_metrics
+    FETCH_WORKERS = 16
+    
+    # GitLab returns at most this many items per page (REST and GraphQL)
+    PAGE_SIZE = 100
+    
+    # Finished pipelines never change, so their details are kept (up to
+    # MAX_DETAIL_CACHE); project info is refreshed after PROJECT_INFO_TTL seconds.
+    # Running pipelines and project info are re-fetched with their ETag, so
+    # an unchanged resource costs a bodiless 304
+    TERMINAL_STATUSES = frozenset({'success', 'failed', 'canceled', 'skipped'})
+    MAX_DETAIL_CACHE = 5000
+    PROJECT_INFO_TTL = 3600
+    
     def __init__(self, gitlab_url: str, private_token: str, project_id: str):
         """
         Initialize GitLab collector
@@ -32,42 +94,115 @@ class GitLabCollector:
             "Content-Type": "application/json"
         }
         self.api_base = f"{self.gitlab_url}/api/v4"
+        self.graphql_url = f"{self.gitlab_url}/api/graphql"
+        self._full_path: Optional[str] = None
+        self._detail_cache: Dict[int, Dict] = {}
+        self._project_info: Optional[Tuple[float, Dict]] = None
+        self._etag_cache: Dict[str, Tuple[str, Dict]] = {}
+        # Both caches are filled from the fetch pool's worker threads
+        self._cache_lock = threading.Lock()
+        self._last_scrape: Optional[str] = None  # ISO start time of the last incremental collection
+        
+        # Keep-alive session: calls to the same host reuse pooled
+        # connections instead of a new TCP+TLS handshake each
+        self.session = new_session(self.headers)
+    
+    def close(self):
+        """Detach the session; the shared pool stays open for other collectors"""
+        self.session.adapters.clear()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+    
+    def _json(self, response):
+        """Decode a JSON response body, with orjson when it is installed"""
+        return orjson.loads(response.content) if orjson else response.json()
+    
+    def _get_revalidated(self, url: str):
+        """
+        GET a JSON resource, revalidating a previous copy with If-None-Match:
+        GitLab answers 304 with no body when it has not changed
+        """
+        cached = self._etag_cache.get(url)
+        headers = {'If-None-Match': cached[0]} if cached else None
+        response = self.session.get(url, headers=headers, timeout=10)
+        if cached and response.status_code == 304:
+            return cached[1]
+        response.raise_for_status()
+        
+        payload = self._json(response)
+        etag = response.headers.get('ETag')
+        if etag:
+            self._cache_put(self._etag_cache, url, (etag, payload))
+        return payload
+    
+    def _cache_put(self, cache: Dict, key, value):
+        """Store into a bounded cache, evicting the oldest entry when it is full"""
+        with self._cache_lock:
+            if key not in cache and len(cache) >= self.MAX_DETAIL_CACHE:
+                cache.pop(next(iter(cache)), None)  # oldest first
+            cache[key] = value
     
     def get_pipelines(self, per_page: int = 100, status: str = None) -> List[Dict]:
         """
         Get list of pipelines
         
         Args:
-            per_page: Number of pipelines per page
+            per_page: Number of pipelines to return (pages past 100 are followed)
             status: Filter by status (success, failed, running, etc.)
             
         Returns:
             List of pipeline dictionaries
         """
-        try:
-            url = f"{self.api_base}/projects/{self.project_id}/pipelines"
-            params = {'per_page': per_page}
-            
-            if status:
-                params['status'] = status
+        return list(islice(self.iter_pipelines(status, page_size=min(per_page, self.PAGE_SIZE)), per_page))
+    
+    def iter_pipelines(self, status: str = None, page_size: int = PAGE_SIZE,
+                       updated_after: Optional[str] = None) -> Iterator[Dict]:
+        """
+        Yield pipelines newest first, fetching the next page (from the Link
+        header) only when the previous one has been consumed. With
+        updated_after (ISO 8601), GitLab only returns pipelines changed since then.
+        """
+        url = f"{self.api_base}/projects/{self.project_id}/pipelines"
+        params = {'per_page': page_size}
+        if status:
+            params['status'] = status
+        if updated_after:
+            params['updated_after'] = updated_after
+        
+        while url:
+            try:
+                response = self.session.get(url, params=params, timeout=10)
+                response.raise_for_status()
+                page = self._json(response)
+            except (requests.RequestException, ValueError) as e:
+                logger.error(f"Error fetching pipelines: {e}")
+                return
             
-            response = requests.get(url, headers=self.headers, params=params, timeout=10)
-            response.raise_for_status()
+            yield from page
             
-            return response.json()
-        except Exception as e:
-            logger.error(f"Error fetching pipelines: {e}")
-            return []
+            # The next link already carries the query string
+            url = response.links.get('next', {}).get('url')
+            params = None
     
     def get_pipeline_details(self, pipeline_id: int) -> Optional[Dict]:
         """Get detailed information about a specific pipeline"""
+        cached = self._detail_cache.get(pipeline_id)
+        if cached is not None:
+            return cached
+        
         try:
             url = f"{self.api_base}/projects/{self.project_id}/pipelines/{pipeline_id}"
-            response = requests.get(url, headers=self.headers, timeout=10)
-            response.raise_for_status()
-            
-            return response.json()
-        except Exception as e:
+            pipeline = self._get_revalidated(url)
+            if pipeline.get('status') in self.TERMINAL_STATUSES:
+                self._cache_put(self._detail_cache, pipeline_id, pipeline)
+                with self._cache_lock:
+                    self._etag_cache.pop(url, None)
+            return pipeline
+        except (requests.RequestException, ValueError) as e:
             logger.error(f"Error fetching pipeline {pipeline_id}: {e}")
             return None
     
@@ -75,11 +210,11 @@ class GitLabCollector:
         """Get all jobs for a pipeline"""
         try:
             url = f"{self.api_base}/projects/{self.project_id}/pipelines/{pipeline_id}/jobs"
-            response = requests.get(url, headers=self.headers, timeout=10)
+            response = self.session.get(url, timeout=10)
             response.raise_for_status()
             
-            return response.json()
-        except Exception as e:
+            return self._json(response)
+        except (requests.RequestException, ValueError) as e:
             logger.error(f"Error fetching jobs for pipeline {pipeline_id}: {e}")
             return []
     
@@ -87,18 +222,103 @@ class GitLabCollector:
         """Get test report for a pipeline"""
         try:
             url = f"{self.api_base}/projects/{self.project_id}/pipelines/{pipeline_id}/test_report"
-            response = requests.get(url, headers=self.headers, timeout=10)
+            response = self.session.get(url, timeout=10)
             
             # Test reports may not exist for all pipelines
             if response.status_code == 404:
                 return None
             
             response.raise_for_status()
-            return response.json()
-        except Exception as e:
+            return self._json(response)
+        except (requests.RequestException, ValueError) as e:
             logger.debug(f"No test report for pipeline {pipeline_id}: {e}")
             return None
     
+    def get_pipelines_bulk(self, count: int = 100, include_jobs: bool = True,
+                           include_tests: bool = True,
+                           updated_after: Optional[str] = None) -> Optional[List[Tuple[Dict, Optional[List[Dict]], Optional[Dict]]]]:
+        """
+        Fetch recent pipelines with their jobs and test summary via GraphQL
+        
+        Returns (pipeline, jobs, test_report) tuples shaped like the REST
+        responses extract_metrics expects, or None if GraphQL is unavailable
+        """
+        try:
+            full_path = self._project_full_path()
+            if not full_path:
+                return None
+            
+            results = []
+            after = None
+            while len(results) < count:
+                variables = {
+                    'path': full_path,
+                    'first': min(self.PAGE_SIZE, count - len(results)),
+                    'after': after,
+                    'updatedAfter': updated_after,
+                    'withJobs': include_jobs,
+                    'withTests': include_tests
+                }
+                response = self.session.post(self.graphql_url, timeout=30,
+                                             json={'query': _PIPELINES_QUERY, 'variables': variables})
+                response.raise_for_status()
+                body = self._json(response)
+                if body.get('errors'):
+                    logger.warning(f"GitLab GraphQL errors: {body['errors']}")
+                    return None
+                
+                project = (body.get('data') or {}).get('project')
+                if project is None:
+                    return None
+                connection = project['pipelines']
+                results.extend(self._from_graphql(node) for node in connection['nodes'])
+                
+                page_info = connection['pageInfo']
+                if not page_info['hasNextPage']:
+                    break
+                after = page_info['endCursor']
+            
+            return results
+        except Exception as e:
+            logger.warning(f"GitLab GraphQL query failed: {e}")
+            return None
+    
+    def _project_full_path(self) -> Optional[str]:
+        """GraphQL addresses projects by path; resolve a numeric project ID once"""
+        if self._full_path is None:
+            if str(self.project_id).isdigit():
+                project = self.get_project_info()
+                self._full_path = project['path'] if project else None
+            else:
+                self._full_path = unquote(str(self.project_id))
+        return self._full_path
+    
+    def _from_graphql(self, node: Dict) -> Tuple[Dict, Optional[List[Dict]], Optional[Dict]]:
+        """Convert a GraphQL pipeline node to the REST pipeline/jobs/test report shapes"""
+        pipeline = {
+            'id': int(node['id'].rsplit('/', 1)[-1]),
+            'iid': int(node.get('iid') or 0),
+            'ref': node.get('ref'),
+            'status': (node.get('status') or 'unknown').lower(),
+            'created_at': node['createdAt'],
+            'started_at': node.get('startedAt'),
+            'finished_at': node.get('finishedAt'),
+            'web_url': f"{self.gitlab_url}{node['path']}" if node.get('path') else '',
+        }
+        
+        jobs = None
+        if node.get('jobs') is not None:
+            jobs = [{'status': (j.get('status') or '').lower(), 'duration': j.get('duration')}
+                    for j in node['jobs']['nodes']]
+        
+        test_report = None
+        summary = node.get('testReportSummary')
+        if summary and summary.get('total'):
+            test_report = {'total_count': summary['total'].get('count') or 0,
+                           'failed_count': summary['total'].get('failed') or 0}
+        
+        return pipeline, jobs, test_report
+    
     def extract_metrics(self, pipeline: Dict, jobs: List[Dict] = None, 
                        test_report: Dict = None) -> Dict:
         """
@@ -112,19 +332,18 @@ class GitLabCollector:
         Returns:
             Extracted metrics dictionary
         """
-        # Parse timestamps
-        created_at = datetime.fromisoformat(pipeline['created_at'].replace('Z', '+00:00'))
+        # Parse timestamps once each; durations are differences of epoch seconds
+        created_at = _parse_datetime(pipeline['created_at'])
+        created = created_at.timestamp()
         
         if pipeline.get('finished_at'):
-            finished_at = datetime.fromisoformat(pipeline['finished_at'].replace('Z', '+00:00'))
-            duration = (finished_at - created_at).total_seconds()
+            duration = _parse_datetime(pipeline['finished_at']).timestamp() - created
         else:
             duration = 0
         
         # Calculate queue time
         if pipeline.get('started_at'):
-            started_at = datetime.fromisoformat(pipeline['started_at'].replace('Z', '+00:00'))
-            queue_time = (started_at - created_at).total_seconds()
+            queue_time = _parse_datetime(pipeline['started_at']).timestamp() - created
         else:
             queue_time = 0
         
@@ -142,14 +361,18 @@ class GitLabCollector:
         # Job metrics
         if jobs:
             metrics['job_count'] = len(jobs)
-            metrics['failed_jobs'] = len([j for j in jobs if j.get('status') == 'failed'])
             metrics['step_count'] = len(jobs)  # Each job is a step in GitLab
             
-            # Calculate total job duration
+            # Failed count and total job duration in one pass
+            failed_jobs = 0
             total_job_duration = 0
             for job in jobs:
-                if job.get('duration'):
-                    total_job_duration += job['duration']
+                if job.get('status') == 'failed':
+                    failed_jobs += 1
+                duration = job.get('duration')
+                if duration:
+                    total_job_duration += duration
+            metrics['failed_jobs'] = failed_jobs
             metrics['total_job_duration'] = total_job_duration
         else:
             metrics['job_count'] = 0
@@ -177,20 +400,17 @@ class GitLabCollector:
     
     def _map_status(self, status: str) -> str:
         """Map GitLab status to standard result"""
-        status_map = {
-            'success': 'SUCCESS',
-            'failed': 'FAILURE',
-            'canceled': 'CANCELLED',
-            'skipped': 'SKIPPED',
-            'running': 'RUNNING',
-            'pending': 'PENDING',
-            'manual': 'MANUAL'
-        }
-        return status_map.get(status.lower(), 'UNKNOWN')
+        # The API already sends lower case; only lower-case anything else
+        result = _STATUS_MAP.get(status)
+        if result is None:
+            result = _STATUS_MAP.get(status.lower(), 'UNKNOWN')
+        return result
     
     def collect_all_metrics(self, pipeline_count: int = 100, 
                            include_jobs: bool = True,
-                           include_tests: bool = True) -> List[Dict]:
+                           include_tests: bool = True,
+                           use_graphql: bool = True,
+                           incremental: bool = False) -> List[Dict]:
         """
         Collect metrics from all recent pipelines
         
@@ -198,58 +418,118 @@ class GitLabCollector:
             pipeline_count: Number of pipelines to collect
             include_jobs: Whether to fetch job details
             include_tests: Whether to fetch test reports
+            use_graphql: Fetch everything in one GraphQL query per page,
+                falling back to per-pipeline REST calls if that fails
+            incremental: Only collect pipelines updated since the last
+                incremental collection by this collector
             
         Returns:
             List of metrics dictionaries
         """
         logger.info(f"Collecting metrics from GitLab project: {self.project_id}")
         
-        pipelines = self.get_pipelines(per_page=pipeline_count)
-        all_metrics = []
+        # Taken before the first request so nothing updated mid-scrape is missed
+        started = datetime.now(timezone.utc).isoformat()
+        since = self._last_scrape if incremental else None
         
-        for pipeline in pipelines:
-            pipeline_id = pipeline['id']
-            
-            # Get detailed pipeline info
-            detailed_pipeline = self.get_pipeline_details(pipeline_id)
-            if not detailed_pipeline:
-                continue
-            
-            # Get jobs if requested
-            jobs = None
-            if include_jobs:
-                jobs = self.get_pipeline_jobs(pipeline_id)
-            
-            # Get test report if requested
-            test_report = None
-            if include_tests:
-                test_report = self.get_pipeline_test_report(pipeline_id)
-            
-            # Extract metrics
-            metrics = self.extract_metrics(detailed_pipeline, jobs, test_report)
-            metrics['workflow_name'] = f"gitlab-{self.project_id}"  # Standardize naming
+        all_metrics = self._collect(pipeline_count, include_jobs, include_tests, use_graphql, since)
+        
+        # Only move the window forward once something was collected; a failed
+        # or empty scrape just asks for the same window again next time
+        if incremental and all_metrics:
+            self._last_scrape = started
+        return all_metrics
+    
+    def _collect(self, pipeline_count: int, include_jobs: bool, include_tests: bool,
+                 use_graphql: bool, updated_after: Optional[str]) -> List[Dict]:
+        bulk = (self.get_pipelines_bulk(pipeline_count, include_jobs, include_tests, updated_after)
+                if use_graphql else None)
+        if bulk is not None:
+            all_metrics = []
+            for pipeline, jobs, test_report in bulk:
+                metrics = self.extract_metrics(pipeline, jobs, test_report)
+                metrics['workflow_name'] = f"gitlab-{self.project_id}"  # Standardize naming
+                all_metrics.append(metrics)
             
-            all_metrics.append(metrics)
+            logger.info(f"Collected {len(all_metrics)} pipeline metrics from GitLab (GraphQL)")
+            return all_metrics
+        
+        # Pages are pulled lazily, so detail requests for the first page are
+        # already running while later pages are fetched
+        pipelines = islice(self.iter_pipelines(page_size=min(pipeline_count, self.PAGE_SIZE),
+                                               updated_after=updated_after), pipeline_count)
+        
+        # Every request is independent of the others, so issue all of them
+        # (details, jobs, test report for each pipeline) through one bounded
+        # pool; at most FETCH_WORKERS are in flight at a time
+        all_metrics = []
+        if pipeline_count > 0:
+            with ThreadPoolExecutor(max_workers=self.FETCH_WORKERS) as pool:
+                pending = [
+                    (pool.submit(self.get_pipeline_details, p['id']),
+                     pool.submit(self.get_pipeline_jobs, p['id']) if include_jobs else None,
+                     pool.submit(self.get_pipeline_test_report, p['id']) if include_tests else None)
+                    for p in pipelines
+                ]
+                
+                for details, jobs, test_report in pending:
+                    detailed_pipeline = details.result()
+                    if not detailed_pipeline:
+                        continue
+                    
+                    metrics = self.extract_metrics(
+                        detailed_pipeline,
+                        jobs.result() if jobs else None,
+                        test_report.result() if test_report else None
+                    )
+                    metrics['workflow_name'] = f"gitlab-{self.project_id}"  # Standardize naming
+                    all_metrics.append(metrics)
         
         logger.info(f"Collected {len(all_metrics)} pipeline metrics from GitLab")
         return all_metrics
     
+    # Numeric fields of extract_metrics, returned as float32 columns
+    COLUMNAR_FIELDS = ('duration', 'queue_time', 'job_count', 'failed_jobs', 'step_count',
+                       'total_job_duration', 'test_count', 'failure_count', 'failure_rate')
+    
+    @classmethod
+    def to_columnar(cls, metrics: List[Dict]) -> Dict[str, np.ndarray]:
+        """Convert pipeline metrics dicts to one contiguous array per field"""
+        n = len(metrics)
+        columns = {
+            field: np.fromiter((m[field] for m in metrics), dtype=np.float32, count=n)
+            for field in cls.COLUMNAR_FIELDS
+        }
+        columns['pipeline_id'] = np.fromiter((m['pipeline_id'] for m in metrics), dtype=np.int64, count=n)
+        columns['timestamp'] = np.array([m['timestamp'] for m in metrics], dtype=str)
+        columns['ref'] = np.array([m['ref'] for m in metrics], dtype=str)
+        columns['result'] = np.array([m['result'] for m in metrics], dtype='U10')
+        return columns
+    
+    def collect_all_metrics_columnar(self, pipeline_count: int = 100,
+                                     include_jobs: bool = True,
+                                     include_tests: bool = True) -> Dict[str, np.ndarray]:
+        """collect_all_metrics as a dict of NumPy arrays (one per field)"""
+        return self.to_columnar(self.collect_all_metrics(pipeline_count, include_jobs, include_tests))
+    
     def get_project_info(self) -> Optional[Dict]:
         """Get information about the project"""
+        if self._project_info and time.time() - self._project_info[0] < self.PROJECT_INFO_TTL:
+            return self._project_info[1]
+        
         try:
             url = f"{self.api_base}/projects/{self.project_id}"
-            response = requests.get(url, headers=self.headers, timeout=10)
-            response.raise_for_status()
-            
-            project = response.json()
-            return {
+            project = self._get_revalidated(url)
+            info = {
                 'id': project['id'],
                 'name': project['name'],
                 'path': project['path_with_namespace'],
                 'web_url': project['web_url'],
                 'default_branch': project.get('default_branch', 'main')
             }
-        except Exception as e:
+            self._project_info = (time.time(), info)
+            return info
+        except (requests.RequestException, KeyError, ValueError) as e:
             logger.error(f"Error fetching project info: {e}")
             return None
     
@@ -260,10 +540,10 @@ class GitLabCollector:
             url = f"{self.api_base}/projects/{self.project_id}/merge_requests"
             params = {'state': state, 'per_page': per_page}
             
-            response = requests.get(url, headers=self.headers, params=params, timeout=10)
+            response = self.session.get(url, params=params, timeout=10)
             response.raise_for_status()
             
-            merge_requests = response.json()
+            merge_requests = self._json(response)
             mr_metrics = []
             
             for mr in merge_requests:
@@ -325,9 +605,10 @@ def main():
         print(json.dumps(metrics[0], indent=2))
         
         # Statistics
-        successful = len([m for m in metrics if m['result'] == 'SUCCESS'])
-        failed = len([m for m in metrics if m['result'] == 'FAILURE'])
-        avg_duration = sum(m['duration'] for m in metrics) / len(metrics)
+        columns = collector.to_columnar(metrics)
+        successful = int((columns['result'] == 'SUCCESS').sum())
+        failed = int((columns['result'] == 'FAILURE').sum())
+        avg_duration = columns['duration'].mean()
         
         print(f"\nStatistics:")
         print(f"  Success rate: {successful/len(metrics)*100:.1f}%")
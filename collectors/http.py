@@ -0,0 +1,59 @@
+"""
+Shared HTTP plumbing for the CI/CD collectors
+All collector sessions mount one process-wide adapter, so their connection
+pools (and sockets) are shared while each keeps its own auth headers.
+"""
+
+import threading
+from typing import Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Distinct hosts kept pooled, and connections kept alive per host
+POOL_CONNECTIONS = 16
+POOL_MAXSIZE = 64
+
+_adapter: Optional[HTTPAdapter] = None
+_adapter_lock = threading.Lock()
+
+
+def shared_adapter() -> HTTPAdapter:
+    """
+    The process-wide adapter. Transient 429/5xx responses are retried with
+    backoff, honouring Retry-After; POST is retried too because the only
+    POSTs made are read-only GraphQL queries.
+    """
+    global _adapter
+    with _adapter_lock:
+        if _adapter is None:
+            retry = Retry(
+                total=3,
+                backoff_factor=0.3,
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=frozenset({'GET', 'POST'}),
+                respect_retry_after_header=True,
+                raise_on_status=False
+            )
+            _adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE,
+                                   max_retries=retry)
+        return _adapter
+
+
+def new_session(headers: Optional[Dict[str, str]] = None,
+                auth: Optional[Tuple[str, str]] = None) -> requests.Session:
+    """
+    A keep-alive session with its own headers/auth, backed by the shared
+    adapter. Its default Accept-Encoding (gzip, deflate) is kept, so JSON
+    responses come back compressed.
+    """
+    session = requests.Session()
+    if headers:
+        session.headers.update(headers)
+    session.auth = auth
+
+    adapter = shared_adapter()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
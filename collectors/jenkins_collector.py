@@ -6,32 +6,63 @@ Collects build metrics from Jenkins for anomaly detection
 import requests
 import json
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Dict, List, Optional
 import logging
 
+from collectors.http import new_session
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 class JenkinsCollector:
     """Collects pipeline metrics from Jenkins"""
     
+    # Jobs whose builds are fetched concurrently by collect_all_metrics
+    JOB_FETCH_WORKERS = 8
+    
+    # Seconds the job list is reused before asking Jenkins again
+    JOB_LIST_TTL = 300
+    
+    # Only the build and action fields extract_metrics reads; asking for
+    # actions[*] returns every action's full payload (SCM, causes, ...)
+    BUILD_TREE = ('builds[number,duration,result,timestamp,'
+                  'actions[_class,totalCount,failCount,queuingDurationMillis]]')
+    
     def __init__(self, jenkins_url: str, username: str, token: str):
         self.jenkins_url = jenkins_url.rstrip('/')
         self.auth = (username, token)
-        self.session = requests.Session()
-        self.session.auth = self.auth
+        # Shared retrying connection pool; tree= queries keep the
+        # (gzip-compressed) responses small
+        self.session = new_session(auth=self.auth)
+        self._job_list: Optional[tuple] = None  # (fetched_at, names)
+        self._last_scrape_ms: Optional[int] = None  # start of the last incremental collection
         
+    def _json(self, response):
+        """Decode a JSON response body, with orjson when it is installed"""
+        return orjson.loads(response.content) if orjson else response.json()
+    
     def get_job_list(self) -> List[str]:
         """Get list of all jobs"""
+        if self._job_list and time.time() - self._job_list[0] < self.JOB_LIST_TTL:
+            return list(self._job_list[1])
+        
         try:
             url = f"{self.jenkins_url}/api/json?tree=jobs[name]"
             response = self.session.get(url, timeout=10)
             response.raise_for_status()
-            jobs = response.json().get('jobs', [])
-            return [job['name'] for job in jobs]
-        except Exception as e:
+            jobs = self._json(response).get('jobs', [])
+            names = [job['name'] for job in jobs]
+            self._job_list = (time.time(), names)
+            return list(names)
+        except (requests.RequestException, ValueError) as e:
             logger.error(f"Error fetching job list: {e}")
             return []
     
@@ -41,20 +72,20 @@ class JenkinsCollector:
             url = f"{self.jenkins_url}/job/{job_name}/{build_number}/api/json"
             response = self.session.get(url, timeout=10)
             response.raise_for_status()
-            return response.json()
-        except Exception as e:
+            return self._json(response)
+        except (requests.RequestException, ValueError) as e:
             logger.error(f"Error fetching build {build_number} for job {job_name}: {e}")
             return None
     
     def get_recent_builds(self, job_name: str, count: int = 100) -> List[Dict]:
         """Get recent builds for a job"""
         try:
-            url = f"{self.jenkins_url}/job/{job_name}/api/json?tree=builds[number,duration,result,timestamp,actions[*]]{{0,{count}}}"
+            url = f"{self.jenkins_url}/job/{job_name}/api/json?tree={self.BUILD_TREE}{{0,{count}}}"
             response = self.session.get(url, timeout=10)
             response.raise_for_status()
-            builds = response.json().get('builds', [])
+            builds = self._json(response).get('builds', [])
             return builds
-        except Exception as e:
+        except (requests.RequestException, ValueError) as e:
             logger.error(f"Error fetching recent builds for {job_name}: {e}")
             return []
     
@@ -92,22 +123,45 @@ class JenkinsCollector:
         
         return metrics
     
-    def collect_all_metrics(self, jobs: Optional[List[str]] = None, builds_per_job: int = 100) -> List[Dict]:
-        """Collect metrics from all jobs"""
+    def collect_all_metrics(self, jobs: Optional[List[str]] = None, builds_per_job: int = 100,
+                            incremental: bool = False) -> List[Dict]:
+        """
+        Collect metrics from all jobs
+        
+        With incremental=True only builds that finished since the last
+        incremental collection are returned. Jenkins has no server-side
+        filter for this, so builds are filtered on their end time here.
+        """
+        started_ms = int(time.time() * 1000)
+        since_ms = self._last_scrape_ms if incremental else None
+        
         if jobs is None:
             jobs = self.get_job_list()
         
-        all_metrics = []
-        
-        for job_name in jobs:
+        def fetch(job_name: str) -> List[Dict]:
             logger.info(f"Collecting metrics for job: {job_name}")
-            builds = self.get_recent_builds(job_name, builds_per_job)
-            
+            return self.get_recent_builds(job_name, builds_per_job)
+        
+        # Jobs are independent, so overlap their round trips
+        job_builds = []
+        if jobs:
+            with ThreadPoolExecutor(max_workers=min(self.JOB_FETCH_WORKERS, len(jobs))) as pool:
+                job_builds = list(pool.map(fetch, jobs))
+        
+        all_metrics = []
+        for job_name, builds in zip(jobs, job_builds):
             for build in builds:
-                if build.get('duration', 0) > 0:  # Only completed builds
-                    metrics = self.extract_metrics(build)
-                    metrics['job_name'] = job_name
-                    all_metrics.append(metrics)
+                if build.get('duration', 0) <= 0:  # Only completed builds
+                    continue
+                # Builds that started before the last scrape may have finished since
+                if since_ms is not None and build.get('timestamp', 0) + build['duration'] <= since_ms:
+                    continue
+                metrics = self.extract_metrics(build)
+                metrics['job_name'] = job_name
+                all_metrics.append(metrics)
+        
+        if incremental and all_metrics:
+            self._last_scrape_ms = started_ms
         
         logger.info(f"Collected {len(all_metrics)} build metrics")
         return all_metrics
@@ -3,97 +3,129 @@ Prometheus Metrics Exporter
 Exposes CI/CD metrics and anomaly detection results to Prometheus
 """
 
-from prometheus_client import start_http_server, Gauge, Counter, Histogram, Info
+from prometheus_client import start_http_server, disable_created_metrics, Gauge, Counter, Histogram, Info, REGISTRY
 import time
+from typing import Dict, Tuple
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Every counter/histogram child otherwise exports an extra *_created sample
+# on each scrape, which no dashboard or alert rule here reads
+disable_created_metrics()
+
+# Bucket bounds (seconds) sized for CI: the library defaults top out at 10s,
+# so every build landed in +Inf. Fewer buckets also mean fewer series per
+# job_name x result to render on each scrape
+BUILD_DURATION_BUCKETS = (30, 60, 120, 300, 600, 1200, 1800, 3600, 7200)
+QUEUE_TIME_BUCKETS = (5, 15, 30, 60, 120, 300, 600, 1800)
+
 
 class PrometheusExporter:
     """Exports CI/CD and anomaly detection metrics to Prometheus"""
     
-    def __init__(self, port: int = 8000):
+    def __init__(self, port: int = 8000, registry=REGISTRY):
         self.port = port
+        self.registry = registry
         
         # Pipeline metrics
         self.build_duration = Histogram(
             'cicd_build_duration_seconds',
             'Build duration in seconds',
-            ['job_name', 'result']
+            ['job_name', 'result'],
+            buckets=BUILD_DURATION_BUCKETS,
+            registry=registry
         )
         
         self.build_count = Counter(
             'cicd_build_total',
             'Total number of builds',
-            ['job_name', 'result']
+            ['job_name', 'result'],
+            registry=registry
         )
         
         self.queue_time = Histogram(
             'cicd_queue_time_seconds',
             'Time spent in queue',
-            ['job_name']
+            ['job_name'],
+            buckets=QUEUE_TIME_BUCKETS,
+            registry=registry
         )
         
         self.test_count = Gauge(
             'cicd_test_count',
             'Number of tests run',
-            ['job_name']
+            ['job_name'],
+            registry=registry
         )
         
         self.failure_count = Gauge(
             'cicd_failure_count',
             'Number of test failures',
-            ['job_name']
+            ['job_name'],
+            registry=registry
         )
         
         # Anomaly detection metrics
         self.anomaly_score = Gauge(
             'cicd_anomaly_score',
             'Anomaly score for the build',
-            ['job_name', 'metric_type']
+            ['job_name', 'metric_type'],
+            registry=registry
         )
         
         self.anomaly_detected = Counter(
             'cicd_anomaly_total',
             'Total number of anomalies detected',
-            ['job_name', 'anomaly_type']
+            ['job_name', 'anomaly_type'],
+            registry=registry
         )
         
         self.model_accuracy = Gauge(
             'cicd_model_accuracy',
             'Current model accuracy score',
-            ['model_name']
+            ['model_name'],
+            registry=registry
         )
         
         self.model_last_trained = Gauge(
             'cicd_model_last_trained_timestamp',
             'Timestamp of last model training',
-            ['model_name']
+            ['model_name'],
+            registry=registry
         )
         
         # System metrics
         self.active_jobs = Gauge(
             'cicd_active_jobs',
-            'Number of currently active jobs'
+            'Number of currently active jobs',
+            registry=registry
         )
         
         self.data_points_collected = Counter(
             'cicd_data_points_total',
             'Total data points collected',
-            ['source']
+            ['source'],
+            registry=registry
         )
         
         # Info metrics
         self.system_info = Info(
             'cicd_anomaly_detector',
-            'Information about the anomaly detection system'
+            'Information about the anomaly detection system',
+            registry=registry
         )
         
+        # Labelled children, resolved once per label set: .labels() checks
+        # and hashes the label values on every call
+        self._build_children: Dict[Tuple[str, str], tuple] = {}
+        self._job_children: Dict[str, tuple] = {}
+        self._source_children: Dict[str, Counter] = {}
+        
     def start(self):
-        """Start the Prometheus HTTP server"""
-        start_http_server(self.port)
+        """Start the Prometheus HTTP server (scrapes are served on its own thread)"""
+        start_http_server(self.port, registry=self.registry)
         logger.info(f"Prometheus metrics server started on port {self.port}")
         
         # Set system info
@@ -107,33 +139,47 @@ class PrometheusExporter:
         job_name = metrics.get('job_name', metrics.get('workflow_name', 'unknown'))
         result = metrics.get('result', 'unknown')
         
+        build = self._build_children.get((job_name, result))
+        if build is None:
+            build = self._build_children[(job_name, result)] = (
+                self.build_duration.labels(job_name=job_name, result=result),
+                self.build_count.labels(job_name=job_name, result=result)
+            )
+        duration, count = build
+        
+        job = self._job_children.get(job_name)
+        if job is None:
+            job = self._job_children[job_name] = (
+                self.queue_time.labels(job_name=job_name),
+                self.test_count.labels(job_name=job_name),
+                self.failure_count.labels(job_name=job_name)
+            )
+        queue_time, test_count, failure_count = job
+        
         # Record duration
         if 'duration' in metrics and metrics['duration'] > 0:
-            self.build_duration.labels(
-                job_name=job_name,
-                result=result
-            ).observe(metrics['duration'])
+            duration.observe(metrics['duration'])
         
         # Record build count
-        self.build_count.labels(
-            job_name=job_name,
-            result=result
-        ).inc()
+        count.inc()
         
         # Record queue time
         if 'queue_time' in metrics and metrics['queue_time'] > 0:
-            self.queue_time.labels(job_name=job_name).observe(metrics['queue_time'])
+            queue_time.observe(metrics['queue_time'])
         
         # Record test metrics
         if 'test_count' in metrics:
-            self.test_count.labels(job_name=job_name).set(metrics['test_count'])
+            test_count.set(metrics['test_count'])
         
         if 'failure_count' in metrics:
-            self.failure_count.labels(job_name=job_name).set(metrics['failure_count'])
+            failure_count.set(metrics['failure_count'])
         
         # Record data collection
         source = 'jenkins' if 'build_number' in metrics else 'github'
-        self.data_points_collected.labels(source=source).inc()
+        points = self._source_children.get(source)
+        if points is None:
+            points = self._source_children[source] = self.data_points_collected.labels(source=source)
+        points.inc()
     
     def record_anomaly(self, job_name: str, anomaly_type: str, score: float):
         """Record detected anomaly"""
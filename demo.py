@@ -16,60 +16,65 @@ from api.alerting import AlertManager
 import json
 
 
-def generate_mock_pipeline_data(n_samples=200):
-    """Generate realistic mock CI/CD pipeline data"""
+def generate_mock_pipeline_data(n_samples=200, rng=None):
+    """Generate realistic mock CI/CD pipeline data (rng: a NumPy Generator, e.g. for a fixed seed)"""
     print("📊 Generating mock pipeline data...")
     
+    if rng is None:
+        rng = np.random.default_rng()
+    
     jobs = ['build-api', 'test-frontend', 'deploy-staging', 'integration-tests', 'deploy-prod']
-    data = []
     
-    # Normal builds
-    for i in range(n_samples):
-        job = np.random.choice(jobs)
-        
-        # Different jobs have different characteristics
-        if 'test' in job:
-            base_duration = 180
-            base_tests = 150
-        elif 'deploy' in job:
-            base_duration = 120
-            base_tests = 50
-        else:
-            base_duration = 240
-            base_tests = 100
-        
-        data.append({
-            'job_name': job,
-            'build_number': i + 1,
-            'duration': np.random.normal(base_duration, 30),
-            'queue_time': np.random.exponential(5),
-            'test_count': int(np.random.normal(base_tests, 10)),
-            'failure_count': np.random.poisson(1),
-            'step_count': np.random.randint(5, 12),
-            'result': np.random.choice(['SUCCESS', 'SUCCESS', 'SUCCESS', 'FAILURE'], p=[0.85, 0.1, 0.04, 0.01]),
-            'timestamp': f"2024-02-{(i % 28) + 1:02d}T{(i % 24):02d}:00:00"
-        })
-        
-        # Calculate derived metrics
-        data[-1]['failure_rate'] = data[-1]['failure_count'] / max(data[-1]['test_count'], 1)
-        data[-1]['job_count'] = 1
-        data[-1]['failed_jobs'] = 1 if data[-1]['result'] == 'FAILURE' else 0
+    # Different jobs have different characteristics
+    base_duration = np.array([180 if 'test' in job else 120 if 'deploy' in job else 240 for job in jobs])
+    base_tests = np.array([150 if 'test' in job else 50 if 'deploy' in job else 100 for job in jobs])
+    
+    # One array per field, each drawn in a single call over the whole batch
+    job_idx = rng.integers(len(jobs), size=n_samples)
+    duration = rng.normal(base_duration[job_idx], 30)
+    queue_time = rng.exponential(5, size=n_samples)
+    test_count = rng.normal(base_tests[job_idx], 10).astype(int)
+    failure_count = rng.poisson(1, size=n_samples)
+    step_count = rng.integers(5, 12, size=n_samples)
+    failed = rng.random(n_samples) < 0.01
     
     # Add some anomalies
     print("🚨 Adding anomalous builds...")
-    anomaly_indices = np.random.choice(range(len(data)), size=15, replace=False)
+    anomaly_indices = rng.choice(n_samples, size=15, replace=False)
+    anomaly_type = rng.integers(3, size=len(anomaly_indices))
     
-    for idx in anomaly_indices:
-        anomaly_type = np.random.choice(['slow', 'failures', 'queue'])
-        
-        if anomaly_type == 'slow':
-            data[idx]['duration'] = np.random.normal(600, 100)
-        elif anomaly_type == 'failures':
-            data[idx]['failure_count'] = np.random.randint(15, 30)
-            data[idx]['failure_rate'] = data[idx]['failure_count'] / max(data[idx]['test_count'], 1)
-            data[idx]['result'] = 'FAILURE'
-        else:  # queue
-            data[idx]['queue_time'] = np.random.uniform(60, 120)
+    slow = anomaly_indices[anomaly_type == 0]
+    duration[slow] = rng.normal(600, 100, size=len(slow))
+    
+    failures = anomaly_indices[anomaly_type == 1]
+    failure_count[failures] = rng.integers(15, 30, size=len(failures))
+    failed[failures] = True
+    
+    queue = anomaly_indices[anomaly_type == 2]
+    queue_time[queue] = rng.uniform(60, 120, size=len(queue))
+    
+    failure_rate = failure_count / np.maximum(test_count, 1)
+    
+    # Rows are only assembled at the end, from plain Python values
+    data = [
+        {
+            'job_name': jobs[j],
+            'build_number': i + 1,
+            'duration': d,
+            'queue_time': q,
+            'test_count': t,
+            'failure_count': f,
+            'step_count': st,
+            'result': 'FAILURE' if bad else 'SUCCESS',
+            'timestamp': f"2024-02-{(i % 28) + 1:02d}T{(i % 24):02d}:00:00",
+            'failure_rate': fr,
+            'job_count': 1,
+            'failed_jobs': int(bad),
+        }
+        for i, (j, d, q, t, f, st, bad, fr) in enumerate(zip(
+            job_idx.tolist(), duration.tolist(), queue_time.tolist(), test_count.tolist(),
+            failure_count.tolist(), step_count.tolist(), failed.tolist(), failure_rate.tolist()))
+    ]
     
     print(f"✅ Generated {len(data)} builds ({len(anomaly_indices)} anomalous)")
     return data
@@ -88,7 +93,8 @@ def main():
     storage = DataStorage('./data')
     
     # Generate mock data
-    pipeline_data = generate_mock_pipeline_data(200)
+    rng = np.random.default_rng()
+    pipeline_data = generate_mock_pipeline_data(200, rng)
     
     # Save data
     print("\n💾 Saving data...")
@@ -112,11 +118,11 @@ def main():
     
     # Test on new data
     print("\n🔍 Testing on new builds...")
-    test_data = generate_mock_pipeline_data(50)
+    test_data = generate_mock_pipeline_data(50, rng)
     
     # ML-based detection
     predictions, scores = detector.predict(test_data)
-    ml_anomalies = sum(1 for p in predictions if p == -1)
+    ml_anomalies = int((predictions == -1).sum())
     
     # Statistical detection
     stat_anomalies = detector.detect_statistical_anomalies(test_data, threshold=2.5)
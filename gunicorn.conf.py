@@ -0,0 +1,17 @@
+"""
+Gunicorn settings for the API (picked up automatically from the working directory)
+
+    gunicorn wsgi:app
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.getenv('API_PORT', 5000)}"
+
+# One process: background jobs, the response cache and alert batching are
+# kept in memory. Concurrency comes from threads, which suits the I/O-bound
+# collector and alert calls.
+workers = 1
+worker_class = 'gthread'
+threads = int(os.getenv('API_THREADS', 8))
+timeout = int(os.getenv('API_TIMEOUT', 60))
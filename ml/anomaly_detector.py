@@ -11,6 +11,8 @@ from sklearn.decomposition import PCA
 import joblib
 import json
 import os
+import threading
+from collections import OrderedDict
 from datetime import datetime
 from typing import Dict, List, Tuple, Optional
 import logging
@@ -18,31 +20,79 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+
+if njit is not None:
+    @njit(parallel=True, cache=True)
+    def _count_flagged(values, center, inv_scale, threshold):
+        """Per row, how many features have |z| > threshold (one fused pass, no temporaries)"""
+        n, f = values.shape
+        counts = np.zeros(n, dtype=np.int32)
+        for i in prange(n):
+            c = 0
+            for j in range(f):
+                if abs((values[i, j] - center[j]) * inv_scale[j]) > threshold:
+                    c += 1
+            counts[i] = c
+        return counts
+else:
+    _count_flagged = None
+
 
 class AnomalyDetector:
     """Detects anomalies in CI/CD pipeline metrics using ML"""
     
-    def __init__(self, contamination: float = 0.1, random_state: int = 42):
+    # Scales the MAD so it estimates the standard deviation of normal data,
+    # keeping robust z-score thresholds comparable to classic ones
+    MAD_TO_STD = 1.4826
+    
+    # Forest scores remembered per distinct (scaled) feature row
+    SCORE_CACHE_SIZE = 10_000
+    
+    def __init__(self, contamination: float = 0.1, random_state: int = 42,
+                 robust: bool = False, threshold_percentile: Optional[float] = None,
+                 n_jobs: Optional[int] = None):
         """
         Initialize the anomaly detector
         
         Args:
             contamination: Expected proportion of outliers in the dataset
             random_state: Random seed for reproducibility
+            robust: Score statistical anomalies against median/MAD instead of
+                mean/std, so outliers in the training data do not widen the band
+            threshold_percentile: Calibrate the default z-score threshold to
+                this percentile of the training samples' max z-scores
+            n_jobs: Threads used to build the forest's trees (-1 for all cores)
         """
         self.contamination = contamination
         self.random_state = random_state
+        self.robust = robust
+        self.threshold_percentile = threshold_percentile
+        self.n_jobs = n_jobs
+        self.z_threshold: Optional[float] = None
         
         self.model = IsolationForest(
             contamination=contamination,
             random_state=random_state,
-            n_estimators=100
+            n_estimators=100,
+            n_jobs=n_jobs
         )
         
         self.scaler = StandardScaler()
         self.pca = None
         self.feature_names = []
         self.statistics = {}
+        self._z_params = None  # (feature names, center, scale, 1/scale) as arrays
+        self._loaded_from = None  # (directory, mmap_mode, file stats) of the last load
+        
+        # Row bytes -> forest score; CI metrics repeat exactly (same counts,
+        # whole-second durations), so identical rows skip the forest walk
+        self._score_cache = OrderedDict()
+        self._score_cache_lock = threading.Lock()
         self.is_trained = False
         
     def prepare_features(self, data: List[Dict]) -> pd.DataFrame:
@@ -64,23 +114,64 @@ class AnomalyDetector:
         
         # Add derived features
         if 'duration' in df.columns and 'test_count' in df.columns:
-            df['duration_per_test'] = df.apply(
-                lambda row: row['duration'] / row['test_count'] if row['test_count'] > 0 else row['duration'],
-                axis=1
-            )
+            duration = df['duration'].to_numpy(dtype=float)
+            df['duration_per_test'] = self._per_test(duration, df['test_count'].to_numpy(dtype=float), duration)
             available_features.append('duration_per_test')
         
         if 'failure_count' in df.columns and 'test_count' in df.columns:
-            df['failure_rate_calculated'] = df.apply(
-                lambda row: row['failure_count'] / row['test_count'] if row['test_count'] > 0 else 0,
-                axis=1
-            )
+            df['failure_rate_calculated'] = self._per_test(df['failure_count'].to_numpy(dtype=float),
+                                                           df['test_count'].to_numpy(dtype=float), 0.0)
             if 'failure_rate_calculated' not in available_features:
                 available_features.append('failure_rate_calculated')
         
         self.feature_names = available_features
         return df[available_features]
     
+    @staticmethod
+    def _per_test(values: np.ndarray, test_count: np.ndarray, fallback) -> np.ndarray:
+        """values / test_count for whole columns; rows without tests get fallback"""
+        has_tests = test_count > 0
+        return np.where(has_tests, values / np.where(has_tests, test_count, 1.0), fallback)
+    
+    # Derived feature -> the raw fields it is computed from
+    _DERIVED_FROM = {
+        'duration_per_test': ('duration', 'test_count'),
+        'failure_rate_calculated': ('failure_count', 'test_count'),
+    }
+    
+    def _feature_matrix(self, data: List[Dict]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The trained features of data as an ndarray, built column by column
+        without a DataFrame. Null or missing fields are 0, as in prepare_features.
+        
+        Returns:
+            (matrix, per feature: whether any record carried its field(s))
+        """
+        columns = {}
+        
+        def column(name):
+            if name not in columns:
+                values = np.array([d.get(name) for d in data], dtype=float)  # None -> nan
+                present = not np.isnan(values).all()
+                values[np.isnan(values)] = 0.0
+                columns[name] = (values, present)
+            return columns[name]
+        
+        matrix = np.empty((len(data), len(self.feature_names)))
+        present = np.empty(len(self.feature_names), dtype=bool)
+        for j, name in enumerate(self.feature_names):
+            sources = self._DERIVED_FROM.get(name)
+            if sources is None:
+                matrix[:, j], present[j] = column(name)
+                continue
+            
+            (values, values_present), (test_count, tests_present) = column(sources[0]), column(sources[1])
+            fallback = values if name == 'duration_per_test' else 0.0
+            matrix[:, j] = self._per_test(values, test_count, fallback)
+            present[j] = values_present and tests_present
+        
+        return matrix, present
+    
     def calculate_statistics(self, features: pd.DataFrame):
         """Calculate statistical metrics for each feature"""
         self.statistics = {
@@ -90,6 +181,43 @@ class AnomalyDetector:
             'q25': features.quantile(0.25).to_dict(),
             'q75': features.quantile(0.75).to_dict(),
         }
+        median = features.median()
+        self.statistics['mad'] = (features - median).abs().median().to_dict()
+        self._z_params = None
+        
+        self.z_threshold = None
+        if self.threshold_percentile is not None and len(features):
+            z_scores, usable = self._z_scores(features.to_numpy(dtype=float))
+            row_max = np.where(usable, z_scores, 0.0).max(axis=1)
+            self.z_threshold = float(np.percentile(row_max, self.threshold_percentile))
+    
+    def _z_score_params(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Center, scale and 1/scale aligned with feature_names, rebuilt only when
+        either changes. Robust mode uses median and scaled MAD, falling back to
+        std for features whose MAD is 0 (e.g. counts that are usually 0).
+        """
+        names = tuple(self.feature_names)
+        if self._z_params is None or self._z_params[0] != names:
+            std = np.array([self.statistics['std'][f] for f in names], dtype=float)
+            if self.robust:
+                center = np.array([self.statistics['median'][f] for f in names], dtype=float)
+                mad = np.array([self.statistics['mad'][f] for f in names], dtype=float)
+                scale = np.where(mad > 0, self.MAD_TO_STD * mad, std)
+            else:
+                center = np.array([self.statistics['mean'][f] for f in names], dtype=float)
+                scale = std
+            # Features with zero/undefined spread get 0 and never flag
+            with np.errstate(divide='ignore'):
+                inv_scale = np.where(scale > 0, 1.0 / scale, 0.0)
+            self._z_params = (names, center, scale, inv_scale)
+        return self._z_params[1:]
+    
+    def _z_scores(self, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """|z| for every cell, and which features have a usable spread"""
+        center, _, inv_scale = self._z_score_params()
+        with np.errstate(invalid='ignore'):
+            return np.abs((values - center) * inv_scale), inv_scale > 0
     
     def train(self, data: List[Dict], use_pca: bool = False, n_components: int = 5) -> Dict:
         """
@@ -116,8 +244,8 @@ class AnomalyDetector:
         # Calculate statistics
         self.calculate_statistics(features)
         
-        # Scale features
-        scaled_features = self.scaler.fit_transform(features)
+        # Scale features (fitted on the bare array, as predict passes one)
+        scaled_features = self.scaler.fit_transform(features.to_numpy(dtype=float))
         
         # Optional PCA
         if use_pca and len(self.feature_names) > n_components:
@@ -125,12 +253,16 @@ class AnomalyDetector:
             scaled_features = self.pca.fit_transform(scaled_features)
             logger.info(f"PCA variance explained: {self.pca.explained_variance_ratio_.sum():.2%}")
         
-        # Train model
+        # Train model (the forest works in float32; cast once here rather
+        # than let fit copy internally)
+        scaled_features = scaled_features.astype(np.float32)
         self.model.fit(scaled_features)
         self.is_trained = True
+        self._loaded_from = None
+        self._clear_score_cache()
         
         # Calculate training statistics
-        predictions = self.model.predict(scaled_features)
+        predictions, _ = self._score(scaled_features)
         anomaly_count = (predictions == -1).sum()
         
         stats = {
@@ -159,8 +291,8 @@ class AnomalyDetector:
         if not self.is_trained:
             raise ValueError("Model must be trained before making predictions")
         
-        # Prepare features
-        features = self.prepare_features(data)
+        # Build the trained feature columns straight into an ndarray
+        features, _ = self._feature_matrix(data)
         
         # Scale features
         scaled_features = self.scaler.transform(features)
@@ -169,19 +301,60 @@ class AnomalyDetector:
         if self.pca is not None:
             scaled_features = self.pca.transform(scaled_features)
         
-        # Predict
-        predictions = self.model.predict(scaled_features)
+        return self._score_cached(scaled_features)
+    
+    def _score_cached(self, scaled_features) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        _score, reusing cached scores for rows seen before and scoring only the
+        rest. Rows are keyed in float32, the precision the forest compares in,
+        so rows it cannot tell apart share one entry.
+        """
+        rows = np.ascontiguousarray(scaled_features, dtype=np.float32)
+        keys = [row.tobytes() for row in rows]
+        anomaly_scores = np.empty(len(rows))
+        
+        misses = []
+        with self._score_cache_lock:
+            for i, key in enumerate(keys):
+                score = self._score_cache.get(key)
+                if score is None:
+                    misses.append(i)
+                else:
+                    self._score_cache.move_to_end(key)
+                    anomaly_scores[i] = score
+        
+        if misses:
+            anomaly_scores[misses] = self._score(rows[misses])[1]
+            with self._score_cache_lock:
+                for i in misses:
+                    self._score_cache[keys[i]] = anomaly_scores[i]
+                while len(self._score_cache) > self.SCORE_CACHE_SIZE:
+                    self._score_cache.popitem(last=False)
+        
+        predictions = np.where(anomaly_scores - self.model.offset_ < 0, -1, 1)
+        return predictions, anomaly_scores
+    
+    def _clear_score_cache(self):
+        with self._score_cache_lock:
+            self._score_cache.clear()
+    
+    def _score(self, scaled_features) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Labels and scores from one pass over the forest: model.predict would
+        recompute score_samples, and its decision is just score - offset_ < 0
+        """
         anomaly_scores = self.model.score_samples(scaled_features)
-        
+        predictions = np.where(anomaly_scores - self.model.offset_ < 0, -1, 1)
         return predictions, anomaly_scores
     
-    def detect_statistical_anomalies(self, data: List[Dict], threshold: float = 3.0) -> List[Dict]:
+    def detect_statistical_anomalies(self, data: List[Dict], threshold: Optional[float] = None) -> List[Dict]:
         """
         Detect anomalies using statistical methods (z-score)
         
         Args:
             data: List of metric dictionaries
             threshold: Number of standard deviations for anomaly threshold
+                (default: the calibrated threshold if any, else 3.0)
             
         Returns:
             List of anomaly reports
@@ -189,37 +362,44 @@ class AnomalyDetector:
         if not self.statistics:
             raise ValueError("Model must be trained before detecting anomalies")
         
-        features = self.prepare_features(data)
-        anomalies = []
+        values, present = self._feature_matrix(data)
+        # Fields no record carries are left out rather than scored as 0
+        values[:, ~present] = np.nan
+        
+        if threshold is None:
+            threshold = self.z_threshold if self.z_threshold is not None else 3.0
+        
+        # Score every cell at once; features with zero/undefined spread never flag
+        center, scale, inv_scale = self._z_score_params()
+        if _count_flagged is not None:
+            # Numba finds the flagged rows; z-scores are only built for those
+            rows = np.flatnonzero(_count_flagged(np.ascontiguousarray(values), center,
+                                                 inv_scale, float(threshold)))
+            z_scores, usable = self._z_scores(values[rows])
+        else:
+            z_scores, usable = self._z_scores(values)
+            rows = np.flatnonzero(((z_scores > threshold) & usable).any(axis=1))
+            z_scores = z_scores[rows]
+        flagged = (z_scores > threshold) & usable
         
-        for idx, row in features.iterrows():
-            anomaly_features = []
-            max_z_score = 0
-            
-            for feature in self.feature_names:
-                value = row[feature]
-                mean = self.statistics['mean'][feature]
-                std = self.statistics['std'][feature]
-                
-                if std > 0:
-                    z_score = abs((value - mean) / std)
-                    if z_score > threshold:
-                        anomaly_features.append({
-                            'feature': feature,
-                            'value': float(value),
-                            'expected': float(mean),
-                            'std': float(std),
-                            'z_score': float(z_score)
-                        })
-                        max_z_score = max(max_z_score, z_score)
-            
-            if anomaly_features:
-                anomalies.append({
-                    'index': int(idx),
-                    'max_z_score': float(max_z_score),
-                    'anomaly_features': anomaly_features,
-                    'data': data[idx] if idx < len(data) else {}
-                })
+        anomalies = []
+        for k, idx in enumerate(rows):
+            cols = np.flatnonzero(flagged[k])
+            anomalies.append({
+                'index': int(idx),
+                'max_z_score': float(z_scores[k, cols].max()),
+                'anomaly_features': [
+                    {
+                        'feature': self.feature_names[c],
+                        'value': float(values[idx, c]),
+                        'expected': float(center[c]),
+                        'std': float(scale[c]),
+                        'z_score': float(z_scores[k, c])
+                    }
+                    for c in cols
+                ],
+                'data': data[idx] if idx < len(data) else {}
+            })
         
         return anomalies
     
@@ -231,18 +411,20 @@ class AnomalyDetector:
         scaler_path = os.path.join(directory, 'scaler.pkl')
         stats_path = os.path.join(directory, 'statistics.json')
         
-        joblib.dump(self.model, model_path)
-        joblib.dump(self.scaler, scaler_path)
+        self._dump(self.model, model_path)
+        self._dump(self.scaler, scaler_path)
         
         if self.pca is not None:
             pca_path = os.path.join(directory, 'pca.pkl')
-            joblib.dump(self.pca, pca_path)
+            self._dump(self.pca, pca_path)
         
         # Save metadata
         metadata = {
             'feature_names': self.feature_names,
             'statistics': self.statistics,
             'contamination': self.contamination,
+            'robust': self.robust,
+            'z_threshold': self.z_threshold,
             'is_trained': self.is_trained,
             'has_pca': self.pca is not None,
         }
@@ -252,64 +434,98 @@ class AnomalyDetector:
         
         logger.info(f"Model saved to {directory}")
     
-    def load_model(self, directory: str):
-        """Load the model and scaler from disk"""
+    @staticmethod
+    def _dump(obj, path: str):
+        """Write via a temp file + rename so a model memory-mapped from path stays valid"""
+        tmp_path = f"{path}.tmp"
+        joblib.dump(obj, tmp_path)
+        os.replace(tmp_path, path)
+    
+    def load_model(self, directory: str, mmap_mode: Optional[str] = None):
+        """
+        Load the model and scaler from disk
+        
+        Args:
+            directory: Directory written by save_model
+            mmap_mode: Passed to joblib.load; 'r' memory-maps the model's numpy
+                arrays read-only instead of copying them into memory
+        
+        Reloading a directory whose files have not changed since the last
+        load is a no-op.
+        """
         model_path = os.path.join(directory, 'isolation_forest.pkl')
         scaler_path = os.path.join(directory, 'scaler.pkl')
         stats_path = os.path.join(directory, 'statistics.json')
         pca_path = os.path.join(directory, 'pca.pkl')
         
-        self.model = joblib.load(model_path)
-        self.scaler = joblib.load(scaler_path)
+        signature = (os.path.abspath(directory), mmap_mode, tuple(
+            (st.st_ino, st.st_mtime_ns, st.st_size) if st else None
+            for st in map(self._stat, (model_path, scaler_path, stats_path, pca_path))
+        ))
+        if signature == self._loaded_from:
+            logger.debug(f"Model in {directory} unchanged, not reloading")
+            return
+        
+        self.model = joblib.load(model_path, mmap_mode=mmap_mode)
+        self.model.n_jobs = self.n_jobs
+        self.scaler = joblib.load(scaler_path, mmap_mode=mmap_mode)
         
-        if os.path.exists(pca_path):
-            self.pca = joblib.load(pca_path)
+        self.pca = joblib.load(pca_path, mmap_mode=mmap_mode) if os.path.exists(pca_path) else None
         
         with open(stats_path, 'r') as f:
             metadata = json.load(f)
         
         self.feature_names = metadata['feature_names']
         self.statistics = metadata['statistics']
+        self._z_params = None
         self.contamination = metadata['contamination']
+        self.robust = metadata.get('robust', False)
+        self.z_threshold = metadata.get('z_threshold')
         self.is_trained = metadata['is_trained']
         
+        # Build the z-score arrays now rather than on the first detection
+        self._z_score_params()
+        self._loaded_from = signature
+        self._clear_score_cache()
+        
         logger.info(f"Model loaded from {directory}")
+    
+    @staticmethod
+    def _stat(path: str) -> Optional[os.stat_result]:
+        try:
+            return os.stat(path)
+        except FileNotFoundError:
+            return None
 
 
 def main():
     """Example usage with mock data"""
-    # Generate mock training data
-    np.random.seed(42)
+    rng = np.random.default_rng(42)
     
-    normal_data = []
-    for i in range(200):
-        normal_data.append({
-            'duration': np.random.normal(300, 50),
-            'queue_time': np.random.normal(10, 3),
-            'test_count': np.random.randint(80, 120),
-            'failure_count': np.random.randint(0, 3),
-            'failure_rate': np.random.uniform(0, 0.05),
-            'step_count': np.random.randint(5, 15),
-            'job_count': np.random.randint(1, 5),
-            'failed_jobs': 0,
-        })
+    def mock_builds(n, duration, queue_time, failure_count, failure_rate, failed_jobs):
+        """n builds, one batched draw per field; the tuples parameterise each distribution"""
+        columns = {
+            'duration': rng.normal(*duration, size=n),
+            'queue_time': rng.normal(*queue_time, size=n),
+            'test_count': rng.integers(80, 120, size=n),
+            'failure_count': rng.integers(*failure_count, size=n),
+            'failure_rate': rng.uniform(*failure_rate, size=n),
+            'step_count': rng.integers(5, 15, size=n),
+            'job_count': rng.integers(1, 5, size=n),
+            'failed_jobs': rng.integers(*failed_jobs, size=n),
+        }
+        return [dict(zip(columns, row)) for row in zip(*(col.tolist() for col in columns.values()))]
+    
+    # Generate mock training data
+    normal_data = mock_builds(200, duration=(300, 50), queue_time=(10, 3), failure_count=(0, 3),
+                              failure_rate=(0, 0.05), failed_jobs=(0, 1))
     
-    # Add some anomalies
-    anomaly_data = []
-    for i in range(20):
-        anomaly_data.append({
-            'duration': np.random.normal(800, 100),  # Much longer
-            'queue_time': np.random.normal(50, 10),  # Long queue
-            'test_count': np.random.randint(80, 120),
-            'failure_count': np.random.randint(10, 20),  # Many failures
-            'failure_rate': np.random.uniform(0.1, 0.3),
-            'step_count': np.random.randint(5, 15),
-            'job_count': np.random.randint(1, 5),
-            'failed_jobs': np.random.randint(1, 3),
-        })
+    # Add some anomalies: much longer, long queue, many failures
+    anomaly_data = mock_builds(20, duration=(800, 100), queue_time=(50, 10), failure_count=(10, 20),
+                               failure_rate=(0.1, 0.3), failed_jobs=(1, 3))
     
     all_data = normal_data + anomaly_data
-    np.random.shuffle(all_data)
+    rng.shuffle(all_data)
     
     # Train model
     detector = AnomalyDetector(contamination=0.1)
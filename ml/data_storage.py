@@ -3,26 +3,81 @@ Data Storage Manager
 Handles persistent storage of metrics and anomaly detection results
 """
 
+import io
 import json
+import math
 import os
+import threading
+import time
 import pandas as pd
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import Iterator, List, Dict, Optional, Tuple
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+try:
+    import pyarrow  # pandas' Parquet engine
+except ImportError:
+    pyarrow = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _loads(raw):
+    """Parse JSON text or bytes, with orjson when it is installed"""
+    return orjson.loads(raw) if orjson else json.loads(raw)
+
 
 class DataStorage:
     """Manages storage of CI/CD metrics and anomaly detection results"""
     
-    def __init__(self, data_dir: str = './data'):
+    # Number of parsed metrics files kept in memory
+    METRICS_CACHE_SIZE = 64
+    
+    # Threads used to read uncached metrics files
+    READ_WORKERS = 8
+    
+    # Minimum seconds between fsyncs of the anomaly log
+    ANOMALY_FSYNC_INTERVAL = 1.0
+    
+    # Parquet column listing, per row, the fields that record did not have
+    MISSING_COLUMN = '__missing__'
+    
+    def __init__(self, data_dir: str = './data', metrics_format: Optional[str] = None):
+        """
+        Args:
+            data_dir: Root directory for metrics, anomalies and reports
+            metrics_format: 'parquet' or 'json' for new metrics files; defaults
+                to Parquet when pyarrow is installed. Files of either format are read.
+        """
         self.data_dir = data_dir
+        self.metrics_format = metrics_format or ('parquet' if pyarrow is not None else 'json')
         self.metrics_dir = os.path.join(data_dir, 'metrics')
         self.anomalies_dir = os.path.join(data_dir, 'anomalies')
         self.reports_dir = os.path.join(data_dir, 'reports')
         
+        # filepath -> ((mtime_ns, size), parsed metrics, metrics by job name)
+        self._metrics_cache = OrderedDict()
+        self._metrics_cache_lock = threading.Lock()
+        
+        # filepath -> ((mtime_ns, size), columnar DataFrame), built on demand
+        self._metrics_frames = {}
+        
+        # filepath -> ((mtime_ns, size), per-file aggregates for the summary report)
+        self._summary_parts = {}
+        
+        # detection_type -> (filepath, open append handle) for the current hour
+        self._anomaly_logs = {}
+        self._anomaly_logs_lock = threading.Lock()
+        self._last_fsync = 0.0
+        
         self._create_directories()
     
     def _create_directories(self):
@@ -31,23 +86,157 @@ class DataStorage:
             os.makedirs(directory, exist_ok=True)
     
     def save_metrics(self, metrics: List[Dict], source: str = 'unknown'):
-        """Save collected metrics to JSON file"""
+        """Save collected metrics to a Parquet or JSON file"""
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"{source}_{timestamp}.json"
-        filepath = os.path.join(self.metrics_dir, filename)
         
-        with open(filepath, 'w') as f:
-            json.dump(metrics, f, indent=2)
+        if self.metrics_format == 'parquet':
+            filepath = os.path.join(self.metrics_dir, f"{source}_{timestamp}.parquet")
+            try:
+                self._parquet_frame(metrics).to_parquet(filepath, compression='zstd', index=False)
+                logger.info(f"Saved {len(metrics)} metrics to {filepath}")
+                return filepath
+            except (TypeError, ValueError) as e:
+                # e.g. a field holding numbers in some records and text in others
+                logger.warning(f"Metrics do not fit a Parquet schema ({e}), saving as JSON")
+                if os.path.exists(filepath):
+                    os.remove(filepath)
+        
+        filepath = os.path.join(self.metrics_dir, f"{source}_{timestamp}.json")
+        if orjson:
+            with open(filepath, 'wb') as f:
+                f.write(orjson.dumps(metrics, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
+        else:
+            with open(filepath, 'w') as f:
+                json.dump(metrics, f, indent=2)
         
         logger.info(f"Saved {len(metrics)} metrics to {filepath}")
         return filepath
     
-    def load_metrics(self, source: Optional[str] = None, days: int = 30) -> List[Dict]:
-        """Load metrics from storage"""
-        all_metrics = []
+    def _read_file(self, filepath: str) -> bytes:
+        with open(filepath, 'rb') as f:
+            return f.read()
+    
+    @staticmethod
+    def _index_by_job(metrics: List[Dict]) -> Dict[str, List[Dict]]:
+        """Group records under their job_name and workflow_name"""
+        by_job = {}
+        for m in metrics:
+            for name in {m.get('job_name'), m.get('workflow_name')}:
+                if name is not None:
+                    by_job.setdefault(name, []).append(m)
+        return by_job
+    
+    @classmethod
+    def _parquet_frame(cls, metrics: List[Dict]) -> pd.DataFrame:
+        """
+        Records as a frame that round-trips through Parquet: integer fields
+        some records lack stay integers (nullable Int64 rather than float),
+        and each row lists the fields it lacked so they are not read back as nulls
+        """
+        frame = pd.DataFrame(metrics)
+        for column in frame.columns:
+            if frame[column].dtype.kind != 'f':
+                continue
+            values = [m.get(column) for m in metrics]
+            present = [v for v in values if v is not None]
+            if not present:
+                # Only nulls: keep them as None rather than NaN
+                frame[column] = pd.Series(values, dtype=object)
+            elif all(isinstance(v, int) and not isinstance(v, bool) for v in present):
+                frame[column] = pd.array(values, dtype='Int64')
+        
+        missing = [[c for c in frame.columns if c not in m] or None for m in metrics]
+        if any(missing):
+            frame[cls.MISSING_COLUMN] = missing
+        return frame
+    
+    @classmethod
+    def _frame_records(cls, frame: pd.DataFrame) -> List[Dict]:
+        """Rows of a Parquet frame as dicts, each with exactly the fields it was saved with"""
+        records = frame.to_dict('records')
+        if cls.MISSING_COLUMN not in frame.columns:
+            # Written before missing fields were tracked: every null is a gap
+            return [
+                {k: v for k, v in row.items() if not (v is None or (isinstance(v, float) and math.isnan(v)))}
+                for row in records
+            ]
+        
+        result = []
+        for row in records:
+            missing = row.pop(cls.MISSING_COLUMN)
+            for k in (missing if missing is not None else ()):
+                row.pop(k, None)
+            # pyarrow reads list fields back as numpy arrays
+            result.append({k: v.tolist() if hasattr(v, 'tolist') else v for k, v in row.items()})
+        return result
+    
+    @classmethod
+    def _plain_frame(cls, frame: pd.DataFrame) -> pd.DataFrame:
+        """A Parquet frame with the dtypes pd.DataFrame(records) would give the same records"""
+        frame = frame.drop(columns=cls.MISSING_COLUMN, errors='ignore')
+        for column in frame.columns:
+            if isinstance(frame[column].dtype, pd.Int64Dtype):
+                has_na = frame[column].isna().any()
+                frame[column] = frame[column].astype('float64' if has_na else 'int64')
+        return frame
+    
+    def _read_metrics_files(self, files: List[Tuple[str, tuple]]) -> Dict[str, Tuple[List[Dict], Dict]]:
+        """
+        Parse metrics files, reusing the last parse while (mtime, size) are unchanged
+        
+        Args:
+            files: (filepath, (mtime_ns, size)) pairs
+            
+        Returns:
+            (metrics, metrics by job name) keyed by filepath
+        """
+        parsed = {}
+        with self._metrics_cache_lock:
+            for filepath, key in files:
+                entry = self._metrics_cache.get(filepath)
+                if entry and entry[0] == key:
+                    self._metrics_cache.move_to_end(filepath)
+                    parsed[filepath] = entry[1:]
+        
+        misses = [(filepath, key) for filepath, key in files if filepath not in parsed]
+        if not misses:
+            return parsed
+        
+        # Issue the reads concurrently so their latency overlaps (file I/O
+        # releases the GIL); parsing then happens here as each one lands
+        paths = [filepath for filepath, _ in misses]
+        if len(paths) == 1:
+            contents = [self._read_file(paths[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.READ_WORKERS, len(paths))) as pool:
+                contents = list(pool.map(self._read_file, paths))
+        
+        for (filepath, key), raw in zip(misses, contents):
+            if filepath.endswith('.parquet'):
+                # Already columnar, so keep the frame for load_metrics_frame too
+                frame = pd.read_parquet(io.BytesIO(raw))
+                metrics = self._frame_records(frame)
+                with self._metrics_cache_lock:
+                    self._metrics_frames[filepath] = (key, self._plain_frame(frame))
+            else:
+                metrics = _loads(raw)
+            by_job = self._index_by_job(metrics)
+            parsed[filepath] = (metrics, by_job)
+            
+            with self._metrics_cache_lock:
+                self._metrics_cache[filepath] = (key, metrics, by_job)
+                self._metrics_cache.move_to_end(filepath)
+                while len(self._metrics_cache) > self.METRICS_CACHE_SIZE:
+                    self._metrics_cache.popitem(last=False)
+        
+        return parsed
+    
+    def _select_metrics_files(self, source: Optional[str], days: int) -> List[Tuple[str, tuple]]:
+        """Metrics files matching source that are at most `days` old"""
+        selected = []
         
         for filename in os.listdir(self.metrics_dir):
-            if not filename.endswith('.json'):
+            if not filename.endswith(('.json', '.parquet')):
                 continue
             
             if source and not filename.startswith(source):
@@ -56,38 +245,149 @@ class DataStorage:
             filepath = os.path.join(self.metrics_dir, filename)
             
             # Check file age
-            file_time = datetime.fromtimestamp(os.path.getmtime(filepath))
+            stat = os.stat(filepath)
+            file_time = datetime.fromtimestamp(stat.st_mtime)
             age_days = (datetime.now() - file_time).days
             
             if age_days > days:
                 continue
             
-            with open(filepath, 'r') as f:
-                metrics = json.load(f)
-                all_metrics.extend(metrics)
+            selected.append((filepath, (stat.st_mtime_ns, stat.st_size)))
+        
+        return selected
+    
+    def load_metrics(self, source: Optional[str] = None, days: int = 30) -> List[Dict]:
+        """Load metrics from storage (records are shared with the cache; treat them as read-only)"""
+        selected = self._select_metrics_files(source, days)
+        parsed = self._read_metrics_files(selected)
+        
+        all_metrics = []
+        for filepath, _ in selected:
+            all_metrics.extend(parsed[filepath][0])
         
         logger.info(f"Loaded {len(all_metrics)} metrics from storage")
         return all_metrics
     
+    def load_job_metrics(self, job_name: str, days: int = 30) -> List[Dict]:
+        """Load metrics whose job_name or workflow_name matches, in load_metrics order"""
+        selected = self._select_metrics_files(None, days)
+        parsed = self._read_metrics_files(selected)
+        
+        job_metrics = []
+        for filepath, _ in selected:
+            job_metrics.extend(parsed[filepath][1].get(job_name, ()))
+        
+        return job_metrics
+    
+    def load_metrics_frame(self, source: Optional[str] = None, days: int = 30) -> pd.DataFrame:
+        """load_metrics as one DataFrame, reusing each file's columns while it is unchanged"""
+        selected = self._select_metrics_files(source, days)
+        parsed = self._read_metrics_files(selected)
+        
+        frames = [self._file_frame(filepath, key, parsed[filepath][0]) for filepath, key in selected]
+        
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
+    
+    def _file_frame(self, filepath: str, key: tuple, metrics: List[Dict]) -> pd.DataFrame:
+        """Columnar view of one metrics file, rebuilt only when the file changes"""
+        with self._metrics_cache_lock:
+            entry = self._metrics_frames.get(filepath)
+        
+        if entry is None or entry[0] != key:
+            entry = (key, pd.DataFrame(metrics))
+            with self._metrics_cache_lock:
+                self._metrics_frames[filepath] = entry
+                # Drop frames for files evicted from the parse cache, but
+                # only once past the high-water mark, not on every miss
+                if len(self._metrics_frames) > 2 * self.METRICS_CACHE_SIZE:
+                    for stale in [p for p in self._metrics_frames if p not in self._metrics_cache]:
+                        del self._metrics_frames[stale]
+        
+        return entry[1]
+    
+    @staticmethod
+    def _summarize_frame(df: pd.DataFrame) -> Dict:
+        """Mergeable aggregates of one file's metrics"""
+        part = {'rows': len(df), 'columns': set(df.columns)}
+        if 'duration' in df.columns:
+            duration = df['duration'].dropna()
+            part['duration'] = (float(duration.sum()), len(duration),
+                                float(duration.max()) if len(duration) else None)
+        if 'result' in df.columns:
+            part['results'] = Counter(df['result'].dropna())
+        for col in ('job_name', 'workflow_name'):
+            if col in df.columns:
+                part[col] = set(df[col].dropna())
+        return part
+    
+    def _file_summary(self, filepath: str, key: tuple, metrics: List[Dict]) -> Dict:
+        """_summarize_frame for one metrics file, cached until the file changes"""
+        with self._metrics_cache_lock:
+            entry = self._summary_parts.get(filepath)
+        
+        if entry is None or entry[0] != key:
+            entry = (key, self._summarize_frame(self._file_frame(filepath, key, metrics)))
+            with self._metrics_cache_lock:
+                self._summary_parts[filepath] = entry
+        
+        return entry[1]
+    
+    def _anomaly_log(self, detection_type: str, filepath: str):
+        """Append handle for filepath, rolling over from the previous hour's file"""
+        current = self._anomaly_logs.get(detection_type)
+        if current and current[0] == filepath:
+            return current[1]
+        
+        if current:
+            current[1].close()
+        f = open(filepath, 'a', buffering=1 << 16)
+        self._anomaly_logs[detection_type] = (filepath, f)
+        return f
+    
     def save_anomalies(self, anomalies: List[Dict], detection_type: str = 'ml'):
-        """Save detected anomalies"""
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"anomalies_{detection_type}_{timestamp}.json"
+        """Append detected anomalies as NDJSON to this hour's log for detection_type"""
+        timestamp = datetime.now().strftime('%Y%m%d_%H')
+        filename = f"anomalies_{detection_type}_{timestamp}.ndjson"
         filepath = os.path.join(self.anomalies_dir, filename)
         
-        with open(filepath, 'w') as f:
-            json.dump(anomalies, f, indent=2)
+        if orjson:
+            payload = b''.join(orjson.dumps(anomaly, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_APPEND_NEWLINE)
+                               for anomaly in anomalies).decode()
+        else:
+            payload = ''.join(json.dumps(anomaly) + '\n' for anomaly in anomalies)
+        
+        with self._anomaly_logs_lock:
+            f = self._anomaly_log(detection_type, filepath)
+            f.write(payload)
+            f.flush()
+            
+            # Readers see flushed data immediately; durability is batched
+            now = time.monotonic()
+            if now - self._last_fsync >= self.ANOMALY_FSYNC_INTERVAL:
+                os.fsync(f.fileno())
+                self._last_fsync = now
         
         logger.info(f"Saved {len(anomalies)} anomalies to {filepath}")
         return filepath
     
-    def load_recent_anomalies(self, hours: int = 24) -> List[Dict]:
-        """Load anomalies from recent hours"""
-        all_anomalies = []
+    def close(self):
+        """Sync and close open anomaly logs"""
+        with self._anomaly_logs_lock:
+            for _, f in self._anomaly_logs.values():
+                f.flush()
+                os.fsync(f.fileno())
+                f.close()
+            self._anomaly_logs.clear()
+    
+    def _select_anomaly_files(self, hours: int) -> List[str]:
+        """Anomaly logs (and legacy JSON files) modified in the last `hours`"""
         cutoff_time = datetime.now().timestamp() - (hours * 3600)
         
+        selected = []
         for filename in os.listdir(self.anomalies_dir):
-            if not filename.endswith('.json'):
+            if not filename.endswith(('.ndjson', '.json')):
                 continue
             
             filepath = os.path.join(self.anomalies_dir, filename)
@@ -95,9 +395,33 @@ class DataStorage:
             if os.path.getmtime(filepath) < cutoff_time:
                 continue
             
-            with open(filepath, 'r') as f:
-                anomalies = json.load(f)
-                all_anomalies.extend(anomalies)
+            selected.append(filepath)
+        
+        return selected
+    
+    @staticmethod
+    def _parse_anomalies(filepath: str, raw: bytes) -> List[Dict]:
+        if filepath.endswith('.json'):
+            return _loads(raw)
+        
+        # A last line without its newline is still being written
+        lines = raw.split(b'\n')[:-1]
+        return [_loads(line) for line in lines if line]
+    
+    def iter_recent_anomalies(self, hours: int = 24) -> Iterator[Dict]:
+        """Yield anomalies from recent hours one file at a time"""
+        for filepath in self._select_anomaly_files(hours):
+            yield from self._parse_anomalies(filepath, self._read_file(filepath))
+    
+    def load_recent_anomalies(self, hours: int = 24) -> List[Dict]:
+        """Load anomalies from recent hours, reading the files concurrently"""
+        paths = self._select_anomaly_files(hours)
+        
+        all_anomalies = []
+        if paths:
+            with ThreadPoolExecutor(max_workers=min(self.READ_WORKERS, len(paths))) as pool:
+                for filepath, raw in zip(paths, pool.map(self._read_file, paths)):
+                    all_anomalies.extend(self._parse_anomalies(filepath, raw))
         
         logger.info(f"Loaded {len(all_anomalies)} recent anomalies")
         return all_anomalies
@@ -111,47 +435,64 @@ class DataStorage:
         return filepath
     
     def generate_summary_report(self) -> Dict:
-        """Generate summary statistics from stored data"""
-        all_metrics = self.load_metrics(days=7)
+        """
+        Generate summary statistics from stored data
+        
+        Each metrics file is reduced to a few aggregates once (until it
+        changes); a report merges those rather than re-scanning every record.
+        """
+        selected = self._select_metrics_files(None, 7)
+        parsed = self._read_metrics_files(selected)
+        parts = [self._file_summary(filepath, key, parsed[filepath][0]) for filepath, key in selected]
+        
+        # Forget files that fell out of the window
+        with self._metrics_cache_lock:
+            for stale in set(self._summary_parts) - {filepath for filepath, _ in selected}:
+                del self._summary_parts[stale]
+        
         all_anomalies = self.load_recent_anomalies(hours=168)  # 7 days
         
-        if not all_metrics:
+        total = sum(part['rows'] for part in parts)
+        columns = set().union(*(part['columns'] for part in parts))
+        
+        if total == 0 or not columns:
             return {
                 'error': 'No metrics available',
                 'total_metrics': 0,
                 'total_anomalies': 0
             }
         
-        df = pd.DataFrame(all_metrics)
-        
         # Calculate statistics
         summary = {
             'generated_at': datetime.now().isoformat(),
             'period': '7 days',
-            'total_metrics': len(all_metrics),
+            'total_metrics': total,
             'total_anomalies': len(all_anomalies),
-            'anomaly_rate': len(all_anomalies) / len(all_metrics) if all_metrics else 0,
+            'anomaly_rate': len(all_anomalies) / total,
         }
         
         # Build statistics
-        if 'duration' in df.columns:
-            summary['avg_duration'] = float(df['duration'].mean())
-            summary['max_duration'] = float(df['duration'].max())
+        if 'duration' in columns:
+            durations = [part['duration'] for part in parts if 'duration' in part]
+            count = sum(n for _, n, _ in durations)
+            maxima = [m for _, _, m in durations if m is not None]
+            summary['avg_duration'] = sum(s for s, _, _ in durations) / count if count else float('nan')
+            summary['max_duration'] = max(maxima) if maxima else float('nan')
         
-        if 'result' in df.columns:
-            result_counts = df['result'].value_counts().to_dict()
-            summary['result_distribution'] = {str(k): int(v) for k, v in result_counts.items()}
+        if 'result' in columns:
+            result_counts = sum((part['results'] for part in parts if 'results' in part), Counter())
+            summary['result_distribution'] = {str(k): int(v) for k, v in result_counts.most_common()}
             
             # Failure rate
-            total = len(df)
-            failures = df[df['result'].isin(['FAILURE', 'failure', 'cancelled'])].shape[0]
-            summary['failure_rate'] = failures / total if total > 0 else 0
+            failures = sum(result_counts[r] for r in ('FAILURE', 'failure', 'cancelled'))
+            summary['failure_rate'] = failures / total
         
         # Job/Workflow statistics
-        job_col = 'job_name' if 'job_name' in df.columns else 'workflow_name'
-        if job_col in df.columns:
-            summary['total_jobs'] = int(df[job_col].nunique())
-            summary['builds_per_job'] = len(df) / df[job_col].nunique()
+        job_col = 'job_name' if 'job_name' in columns else 'workflow_name'
+        if job_col in columns:
+            jobs = set().union(*(part.get(job_col, ()) for part in parts))
+            summary['total_jobs'] = len(jobs)
+            summary['builds_per_job'] = total / len(jobs)
         
         # Save report
         report_file = os.path.join(
@@ -169,6 +510,9 @@ class DataStorage:
         cutoff_time = datetime.now().timestamp() - (days * 86400)
         removed_count = 0
         
+        # Reopen anomaly logs afterwards rather than appending to removed files
+        self.close()
+        
         for directory in [self.metrics_dir, self.anomalies_dir, self.reports_dir]:
             for filename in os.listdir(directory):
                 filepath = os.path.join(directory, filename)
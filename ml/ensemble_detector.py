@@ -128,18 +128,19 @@ class EnsembleDetector:
     
     def _format_ml_predictions(self, data: List[Dict], predictions: np.ndarray, scores: np.ndarray) -> List[Dict]:
         """Format ML model predictions to standard format"""
-        anomalies = []
-        
-        for i, (pred, score) in enumerate(zip(predictions, scores)):
-            if pred == -1:  # Anomaly
-                anomalies.append({
-                    'index': i,
-                    'score': float(abs(score)),
-                    'data': data[i],
-                    'method': 'ml'
-                })
-        
-        return anomalies
+        # Only the flagged rows (-1) become dicts; the scan itself stays in numpy
+        idx = np.flatnonzero(np.asarray(predictions) == -1)
+        abs_scores = np.abs(np.asarray(scores)[idx])
+        
+        return [
+            {
+                'index': int(i),
+                'score': float(score),
+                'data': data[i],
+                'method': 'ml'
+            }
+            for i, score in zip(idx, abs_scores)
+        ]
     
     def _format_lstm_predictions(self, detector, data: List[Dict]) -> List[Dict]:
         """Format LSTM predictions to standard format"""
@@ -3,6 +3,7 @@ LSTM Time Series Predictor
 Predicts next build duration and detects anomalies based on temporal patterns
 """
 
+import importlib.util
 import numpy as np
 import pandas as pd
 from typing import List, Dict, Tuple, Optional
@@ -35,18 +36,23 @@ class LSTMPredictor:
         self.is_trained = False
         self.history = []
         
-        # Fallback to statistical methods when TensorFlow not available
-        self.use_statistical_fallback = True
+        # Fallback to statistical methods when TensorFlow not available.
+        # Only probe for it here; the import itself is deferred to first use.
+        self._keras = None
+        self.use_statistical_fallback = importlib.util.find_spec('tensorflow') is None
         
-        try:
-            import tensorflow as tf
-            from tensorflow import keras
-            self.tf = tf
-            self.keras = keras
-            self.use_statistical_fallback = False
-            logger.info("TensorFlow available, using LSTM models")
-        except ImportError:
+        if self.use_statistical_fallback:
             logger.warning("TensorFlow not available, using statistical fallback")
+        else:
+            logger.info("TensorFlow available, using LSTM models")
+    
+    @property
+    def keras(self):
+        """TensorFlow Keras module, imported on first access"""
+        if self._keras is None:
+            from tensorflow import keras
+            self._keras = keras
+        return self._keras
     
     def prepare_sequences(self, data: List[Dict]) -> Tuple[np.ndarray, np.ndarray]:
         """
@@ -233,9 +239,11 @@ class LSTMPredictor:
         
         # LSTM prediction
         predictions = {}
+        df = pd.DataFrame(recent_builds)
         
+        # Last sequence of every usable feature
+        series = {}
         for feature in self.features:
-            df = pd.DataFrame(recent_builds)
             if feature not in df.columns:
                 continue
             
@@ -243,13 +251,17 @@ class LSTMPredictor:
             if len(values) < self.sequence_length:
                 continue
             
-            # Get last sequence
-            sequence = values[-self.sequence_length:]
-            X = sequence.reshape(1, self.sequence_length, 1)
-            
-            # Predict
-            pred = self.models['lstm'].predict(X, verbose=0)[0][0]
-            
+            series[feature] = values
+        
+        if not series:
+            return predictions
+        
+        # One forward pass over all features instead of one call per feature
+        X = np.stack([values[-self.sequence_length:] for values in series.values()])
+        X = X.reshape(len(series), self.sequence_length, 1)
+        preds = self.models['lstm'].predict(X, verbose=0)[:, 0]
+        
+        for (feature, values), pred in zip(series.items(), preds):
             predictions[feature] = {
                 'predicted': float(pred),
                 'actual_last': float(values[-1]),
@@ -69,8 +69,14 @@ class AnomalyDetectionScheduler:
             'batch_window_seconds': int(os.getenv('ALERT_BATCH_WINDOW', 60)),
             'dedup_window_seconds': int(os.getenv('ALERT_DEDUP_WINDOW', 300)),
             'max_alerts_per_hour': int(os.getenv('ALERT_MAX_PER_HOUR', 20)),
+            'rate_limit_mode': os.getenv('ALERT_RATE_LIMIT_MODE', 'token_bucket'),
+            'dedup_bloom_bits': int(os.getenv('ALERT_DEDUP_BLOOM_BITS', 0)),
         })
         
+        # One collector per source, kept across cycles so HTTP connections
+        # and response caches are reused
+        self._collectors = {}
+        
         # Configuration
         self.jenkins_enabled = bool(os.getenv('JENKINS_URL'))
         self.github_enabled = bool(os.getenv('GITHUB_TOKEN'))
@@ -89,10 +95,13 @@ class AnomalyDetectionScheduler:
                 logger.info("Loaded existing isolation forest model")
             except:
                 logger.info("No existing model found")
-            self.detector.load_model('./models')
-            logger.info("Loaded existing model")
-        except:
-            logger.info("No existing model found")
+    
+    def _get_collector(self, source, factory):
+        """Return the collector for a source, creating it on first use"""
+        collector = self._collectors.get(source)
+        if collector is None:
+            collector = self._collectors[source] = factory()
+        return collector
     
     def collect_jenkins_metrics(self):
         """Collect metrics from Jenkins"""
@@ -106,8 +115,9 @@ class AnomalyDetectionScheduler:
             jenkins_user = os.getenv('JENKINS_USER', 'admin')
             jenkins_token = os.getenv('JENKINS_TOKEN', '')
             
-            collector = JenkinsCollector(jenkins_url, jenkins_user, jenkins_token)
-            metrics = collector.collect_all_metrics(builds_per_job=50)
+            collector = self._get_collector(
+                'jenkins', lambda: JenkinsCollector(jenkins_url, jenkins_user, jenkins_token))
+            metrics = collector.collect_all_metrics(builds_per_job=50, incremental=True)
             
             if metrics:
                 self.storage.save_metrics(metrics, 'jenkins')
@@ -135,7 +145,8 @@ class AnomalyDetectionScheduler:
             github_token = os.getenv('GITHUB_TOKEN')
             github_repo = os.getenv('GITHUB_REPO')
             
-            collector = GitHubActionsCollector(github_token, github_repo)
+            collector = self._get_collector(
+                'github', lambda: GitHubActionsCollector(github_token, github_repo))
             metrics = collector.collect_all_metrics(runs_per_workflow=50)
             
             if metrics:
@@ -165,8 +176,9 @@ class AnomalyDetectionScheduler:
             gitlab_token = os.getenv('GITLAB_TOKEN')
             gitlab_project = os.getenv('GITLAB_PROJECT')
             
-            collector = GitLabCollector(gitlab_url, gitlab_token, gitlab_project)
-            metrics = collector.collect_all_metrics(pipeline_count=50)
+            collector = self._get_collector(
+                'gitlab', lambda: GitLabCollector(gitlab_url, gitlab_token, gitlab_project))
+            metrics = collector.collect_all_metrics(pipeline_count=50, incremental=True)
             
             if metrics:
                 self.storage.save_metrics(metrics, 'gitlab')
@@ -0,0 +1,201 @@
+"""
+Unit tests for alert manager
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from api.alerting import AlertManager, CircuitBreaker
+
+
+def mock_anomaly():
+    """Build a minimal anomaly"""
+    return {
+        'max_z_score': 4.5,
+        'anomaly_features': [
+            {'feature': 'duration', 'value': 800.0, 'expected': 300.0, 'z_score': 4.5}
+        ],
+        'data': {'job_name': 'build-api', 'duration': 800.0}
+    }
+
+
+class FailingSession:
+    """Stand-in for requests.Session that always errors"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def post(self, *args, **kwargs):
+        self.calls += 1
+        raise ConnectionError("slack unreachable")
+
+    def close(self):
+        pass
+
+
+def test_circuit_breaker_opens_after_threshold():
+    """Test breaker trips after consecutive failures"""
+    cb = CircuitBreaker(failure_threshold=3, recovery_timeout=60)
+
+    for _ in range(2):
+        cb.record_failure()
+    assert not cb.is_open()
+
+    cb.record_failure()
+    assert cb.is_open()
+    assert cb.state == CircuitBreaker.OPEN
+
+
+def test_circuit_breaker_half_open_trial():
+    """Test breaker allows one trial call after recovery timeout"""
+    cb = CircuitBreaker(failure_threshold=1, recovery_timeout=0)
+    cb.record_failure()
+
+    assert not cb.is_open()  # trial call allowed
+    assert cb.state == CircuitBreaker.HALF_OPEN
+    assert cb.is_open()  # second caller waits for the trial
+
+    cb.record_success()
+    assert cb.state == CircuitBreaker.CLOSED
+    assert not cb.is_open()
+
+
+def test_slack_alert_skipped_when_circuit_open():
+    """Test Slack alerts fail fast once the breaker trips"""
+    manager = AlertManager({
+        'slack_webhook_url': 'https://hooks.example.com/x',
+        'circuit_failure_threshold': 2,
+        'circuit_recovery_timeout': 60,
+    })
+    session = FailingSession()
+    manager._session = session
+
+    for _ in range(5):
+        assert manager.send_slack_alert(mock_anomaly()) is False
+
+    assert session.calls == 2
+
+
+def test_slack_alert_fails_fast_when_bulkhead_full():
+    """Test sends are dropped when all outbound slots are taken"""
+    manager = AlertManager({
+        'slack_webhook_url': 'https://hooks.example.com/x',
+        'bulkhead_capacity': 1,
+        'bulkhead_timeout': 0.01,
+    })
+    session = FailingSession()
+    manager._session = session
+
+    manager._outbound_sem.acquire()
+    try:
+        assert manager.send_slack_alert(mock_anomaly()) is False
+        assert session.calls == 0
+    finally:
+        manager._outbound_sem.release()
+
+
+class FakeSMTP:
+    """Records SMTP connections made by the alert manager"""
+
+    instances = []
+
+    def __init__(self, host, port):
+        self.sent = 0
+        self.closed = False
+        FakeSMTP.instances.append(self)
+
+    def starttls(self):
+        pass
+
+    def login(self, user, password):
+        pass
+
+    def noop(self):
+        return (250, b'OK')
+
+    def send_message(self, msg):
+        self.sent += 1
+        self.last_message = msg
+
+    def quit(self):
+        self.closed = True
+
+
+def test_email_alerts_reuse_smtp_connection(monkeypatch):
+    """Test emails share one SMTP connection until the per-connection cap"""
+    import api.alerting as alerting
+    FakeSMTP.instances = []
+    monkeypatch.setattr(alerting.smtplib, 'SMTP', FakeSMTP)
+
+    manager = AlertManager({
+        'smtp_user': 'bot@example.com',
+        'smtp_password': 'secret',
+        'alert_email': 'oncall@example.com',
+        'smtp_max_messages': 3,
+    })
+
+    for _ in range(4):
+        assert manager.send_email_alert(mock_anomaly())
+
+    assert len(FakeSMTP.instances) == 2
+    assert FakeSMTP.instances[0].sent == 3
+    assert FakeSMTP.instances[0].closed
+
+    manager.close()
+    assert FakeSMTP.instances[1].closed
+
+
+def test_email_alert_plain_text_only(monkeypatch):
+    """Test email_html=False sends a single text/plain part"""
+    import api.alerting as alerting
+    FakeSMTP.instances = []
+    monkeypatch.setattr(alerting.smtplib, 'SMTP', FakeSMTP)
+
+    manager = AlertManager({
+        'smtp_user': 'bot@example.com',
+        'smtp_password': 'secret',
+        'alert_email': 'oncall@example.com',
+        'email_html': False,
+    })
+
+    assert manager.send_email_alert(mock_anomaly())
+
+    msg = FakeSMTP.instances[0].last_message
+    assert msg.get_content_type() == 'text/plain'
+    assert msg['Subject'] == 'CI/CD Anomaly Alert - build-api'
+    manager.close()
+
+
+def test_send_alert_dispatches_channels_concurrently():
+    """Test multi-channel alerts take max(channel time), not the sum"""
+    import time
+
+    class SlowSession:
+        def post(self, *args, **kwargs):
+            time.sleep(0.2)
+
+            class Response:
+                status_code = 200
+            return Response()
+
+        def close(self):
+            pass
+
+    manager = AlertManager({
+        'slack_webhook_url': 'https://hooks.example.com/x',
+        'webhook_url': 'https://ops.example.com/hook',
+    })
+    manager._session = SlowSession()
+
+    start = time.time()
+    results = manager.send_alert(mock_anomaly(), channels=['slack', 'webhook'])
+    elapsed = time.time() - start
+
+    assert results == {'slack': True, 'webhook': True}
+    assert elapsed < 0.35
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
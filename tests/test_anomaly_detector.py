@@ -64,6 +64,18 @@ def test_feature_preparation():
     assert len(detector.feature_names) > 0
 
 
+def test_derived_features_handle_zero_tests():
+    """Test per-test ratios fall back when a build ran no tests"""
+    detector = AnomalyDetector()
+    features = detector.prepare_features([
+        {'duration': 100.0, 'test_count': 4, 'failure_count': 1},
+        {'duration': 80.0, 'test_count': 0, 'failure_count': 2},
+    ])
+
+    assert features['duration_per_test'].tolist() == [25.0, 80.0]
+    assert features['failure_rate_calculated'].tolist() == [0.25, 0.0]
+
+
 def test_model_training():
     """Test model training"""
     detector = AnomalyDetector(contamination=0.1)
@@ -94,6 +106,63 @@ def test_anomaly_prediction():
     assert -1 in predictions or 1 in predictions
 
 
+def test_predict_matches_isolation_forest():
+    """Test single-pass labels agree with IsolationForest.predict"""
+    detector = AnomalyDetector(n_jobs=2)
+    detector.train(generate_mock_data(100))
+
+    test_data = generate_mock_data(20)
+    predictions, scores = detector.predict(test_data)
+
+    scaled = detector.scaler.transform(detector.prepare_features(test_data).to_numpy())
+    assert np.array_equal(predictions, detector.model.predict(scaled))
+    assert np.allclose(scores, detector.model.score_samples(scaled))
+
+
+def test_predict_reuses_scores_for_repeated_rows(monkeypatch):
+    """Test rows already scored are served from the cache with identical results"""
+    detector = AnomalyDetector()
+    detector.train(generate_mock_data(100))
+    test_data = generate_mock_data(20)
+
+    first = detector.predict(test_data)
+
+    scored = []
+    real_score_samples = detector.model.score_samples
+    monkeypatch.setattr(detector.model, 'score_samples',
+                        lambda X: scored.append(len(X)) or real_score_samples(X))
+
+    second = detector.predict(test_data + test_data[:1] + generate_mock_data(2, add_anomalies=False))
+
+    n = len(test_data)
+    assert scored == [2]
+    assert np.array_equal(second[0][:n], first[0])
+    assert np.array_equal(second[1][:n], first[1])
+    assert second[1][n] == first[1][0]
+    assert {len(key) for key in detector._score_cache} == {4 * len(detector.feature_names)}  # float32 rows
+
+    detector.train(generate_mock_data(100))
+    assert len(detector._score_cache) == 0
+
+
+def test_feature_matrix_matches_prepare_features():
+    """Test the ndarray fast path builds the same features as the DataFrame path"""
+    detector = AnomalyDetector()
+    data = generate_mock_data(30)
+    data[0]['test_count'] = 0
+    data[1]['queue_time'] = None
+    del data[2]['failure_count']
+
+    expected = detector.prepare_features(data).to_numpy()
+    matrix, present = detector._feature_matrix(data)
+
+    assert np.allclose(matrix, expected)
+    assert present.all()
+
+    _, present = detector._feature_matrix([{k: v for k, v in d.items() if k != 'queue_time'} for d in data])
+    assert not present[detector.feature_names.index('queue_time')]
+
+
 def test_statistical_detection():
     """Test statistical anomaly detection"""
     detector = AnomalyDetector()
@@ -111,6 +180,80 @@ def test_statistical_detection():
     assert len(anomalies) >= 0
 
 
+def test_statistical_detection_flags_outlier_features():
+    """Test z-scores are reported per feature and cached between calls"""
+    detector = AnomalyDetector()
+    detector.train(generate_mock_data(100, add_anomalies=False))
+
+    outlier = dict(generate_mock_data(1, add_anomalies=False)[0], duration=5000.0)
+    first = detector.detect_statistical_anomalies([outlier], threshold=3.0)
+    cached = detector._z_params
+    second = detector.detect_statistical_anomalies([outlier], threshold=3.0)
+
+    assert first == second
+    assert detector._z_params is cached
+    flagged = {f['feature'] for f in first[0]['anomaly_features']}
+    assert 'duration' in flagged
+    duration = next(f for f in first[0]['anomaly_features'] if f['feature'] == 'duration')
+    expected = abs(5000.0 - detector.statistics['mean']['duration']) / detector.statistics['std']['duration']
+    assert duration['z_score'] == pytest.approx(expected)
+
+
+def test_statistical_detection_with_row_kernel(monkeypatch):
+    """Test the flagged-row kernel path reports the same anomalies as plain NumPy"""
+    import ml.anomaly_detector as anomaly_detector
+
+    detector = AnomalyDetector()
+    detector.train(generate_mock_data(100))
+    test_data = generate_mock_data(30)
+
+    monkeypatch.setattr(anomaly_detector, '_count_flagged', None)
+    expected = detector.detect_statistical_anomalies(test_data, threshold=2.0)
+
+    def count_flagged(values, center, inv_scale, threshold):
+        return (np.abs((values - center) * inv_scale) > threshold).sum(axis=1)
+
+    monkeypatch.setattr(anomaly_detector, '_count_flagged', count_flagged)
+    assert detector.detect_statistical_anomalies(test_data, threshold=2.0) == expected
+    assert expected
+
+
+def test_robust_statistics_ignore_training_outliers():
+    """Test median/MAD scoring still flags values that outliers hide from mean/std"""
+    data = [{'duration': 300.0 + i % 10, 'test_count': 100, 'failure_count': 0} for i in range(100)]
+    data += [{'duration': 5000.0, 'test_count': 100, 'failure_count': 0}] * 10
+    probe = [{'duration': 600.0, 'test_count': 100, 'failure_count': 0}]
+
+    classic = AnomalyDetector()
+    classic.train(data)
+    robust = AnomalyDetector(robust=True)
+    robust.train(data)
+
+    assert classic.detect_statistical_anomalies(probe) == []
+    anomalies = robust.detect_statistical_anomalies(probe)
+    assert [f['feature'] for f in anomalies[0]['anomaly_features']] == ['duration', 'duration_per_test']
+    assert anomalies[0]['anomaly_features'][0]['expected'] == robust.statistics['median']['duration']
+
+
+def test_calibrated_threshold_persists():
+    """Test threshold_percentile sets the default threshold and survives save/load"""
+    import tempfile
+
+    detector = AnomalyDetector(robust=True, threshold_percentile=95)
+    detector.train(generate_mock_data(100))
+    assert detector.z_threshold > 0
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        detector.save_model(temp_dir)
+        loaded = AnomalyDetector()
+        loaded.load_model(temp_dir)
+
+    assert loaded.robust
+    assert loaded.z_threshold == detector.z_threshold
+    test_data = generate_mock_data(20)
+    assert loaded.detect_statistical_anomalies(test_data) == detector.detect_statistical_anomalies(test_data)
+
+
 def test_model_save_load():
     """Test model persistence"""
     import tempfile
@@ -144,5 +287,30 @@ def test_model_save_load():
         shutil.rmtree(temp_dir)
 
 
+
+def test_reload_skips_unchanged_model(monkeypatch, tmp_path):
+    """Test load_model only reads the files again after they change"""
+    import ml.anomaly_detector as anomaly_detector
+
+    detector = AnomalyDetector()
+    detector.train(generate_mock_data(100))
+    detector.save_model(str(tmp_path))
+
+    loads = []
+    real_load = anomaly_detector.joblib.load
+    monkeypatch.setattr(anomaly_detector.joblib, 'load',
+                        lambda path, **kwargs: loads.append(path) or real_load(path, **kwargs))
+
+    loaded = AnomalyDetector()
+    loaded.load_model(str(tmp_path))
+    assert loaded._z_params is not None
+    loaded.load_model(str(tmp_path))
+    assert len(loads) == 2
+
+    detector.save_model(str(tmp_path))
+    loaded.load_model(str(tmp_path))
+    assert len(loads) == 4
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
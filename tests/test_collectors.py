@@ -0,0 +1,425 @@
+"""
+Unit tests for CI/CD collectors
+"""
+
+import sys
+import os
+import json
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+import requests
+from collectors.github_collector import GitHubActionsCollector
+from collectors.gitlab_collector import GitLabCollector
+from collectors.jenkins_collector import JenkinsCollector
+from collectors.prometheus_exporter import PrometheusExporter
+from prometheus_client import CollectorRegistry
+
+
+class FakeResponse:
+    """Minimal stand-in for requests.Response"""
+
+    def __init__(self, payload, status_code=200, links=None, headers=None):
+        self.payload = payload
+        self.status_code = status_code
+        self.links = links or {}
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"HTTP {self.status_code}")
+
+    @property
+    def content(self):
+        return json.dumps(self.payload).encode()
+
+    def json(self):
+        return self.payload
+
+
+class FakeSession:
+    """Answers GETs from a url -> payload table, GraphQL POSTs from a page list"""
+
+    def __init__(self, routes, graphql_pages=None):
+        self.routes = routes
+        self.graphql_pages = list(graphql_pages or [])
+        self.calls = []
+
+    def get(self, url, **kwargs):
+        self.calls.append(url)
+        for suffix, payload in self.routes.items():
+            if url.endswith(suffix):
+                return FakeResponse(payload)
+        return FakeResponse({}, status_code=404)
+
+    def post(self, url, json=None, **kwargs):
+        self.calls.append(url)
+        if not self.graphql_pages:
+            return FakeResponse({'errors': [{'message': 'not available'}]})
+        return FakeResponse(self.graphql_pages.pop(0))
+
+    def close(self):
+        pass
+
+
+def gitlab_pipeline(pipeline_id):
+    """Finished pipeline as returned by the GitLab API"""
+    return {
+        'id': pipeline_id,
+        'status': 'success',
+        'created_at': '2024-01-01T10:00:00Z',
+        'started_at': '2024-01-01T10:00:30Z',
+        'finished_at': '2024-01-01T10:05:00Z',
+    }
+
+
+def test_gitlab_collects_pipelines_in_order():
+    """Test concurrent pipeline fetches keep list order and skip missing details"""
+    collector = GitLabCollector('https://gitlab.example.com', 'token', '42')
+    ids = list(range(1, 13))
+    routes = {'/pipelines': [{'id': i} for i in ids]}
+    for i in ids:
+        if i != 5:
+            routes[f'/pipelines/{i}'] = gitlab_pipeline(i)
+        routes[f'/pipelines/{i}/jobs'] = [{'status': 'success', 'duration': 10.0}]
+    collector.session = FakeSession(routes)
+
+    metrics = collector.collect_all_metrics(pipeline_count=len(ids), include_tests=False)
+
+    assert [m['pipeline_id'] for m in metrics] == [i for i in ids if i != 5]
+    assert metrics[0]['duration'] == 300
+    assert metrics[0]['queue_time'] == 30
+    assert metrics[0]['total_job_duration'] == 10.0
+
+
+def graphql_page(ids, has_next):
+    """One page of the GitLab pipelines GraphQL response"""
+    nodes = [{
+        'id': f'gid://gitlab/Ci::Pipeline/{i}', 'iid': str(i), 'ref': 'main',
+        'status': 'FAILED', 'path': f'/group/app/-/pipelines/{i}',
+        'createdAt': '2024-01-01T10:00:00Z', 'startedAt': '2024-01-01T10:00:30Z',
+        'finishedAt': '2024-01-01T10:05:00Z',
+        'jobs': {'nodes': [{'status': 'FAILED', 'duration': 12.0}]},
+        'testReportSummary': {'total': {'count': 10, 'failed': 2}},
+    } for i in ids]
+    return {'data': {'project': {'pipelines': {
+        'pageInfo': {'hasNextPage': has_next, 'endCursor': 'cursor'},
+        'nodes': nodes,
+    }}}}
+
+
+def test_gitlab_graphql_bulk_collection():
+    """Test pipelines, jobs and test summaries come from paged GraphQL queries"""
+    collector = GitLabCollector('https://gitlab.example.com', 'token', 'group/app')
+    collector.PAGE_SIZE = 2
+    session = FakeSession({}, [graphql_page([3, 2], True), graphql_page([1], False)])
+    collector.session = session
+
+    metrics = collector.collect_all_metrics(pipeline_count=5)
+
+    assert session.calls == ['https://gitlab.example.com/api/graphql'] * 2
+    assert [m['pipeline_id'] for m in metrics] == [3, 2, 1]
+    first = metrics[0]
+    assert first['result'] == 'FAILURE'
+    assert first['duration'] == 300
+    assert first['failed_jobs'] == 1
+    assert first['failure_rate'] == 0.2
+    assert first['web_url'] == 'https://gitlab.example.com/group/app/-/pipelines/3'
+
+
+def test_gitlab_falls_back_to_rest():
+    """Test a GraphQL error falls back to per-pipeline REST calls"""
+    collector = GitLabCollector('https://gitlab.example.com', 'token', 'group/app')
+    collector.session = FakeSession({
+        '/pipelines': [{'id': 7}],
+        '/pipelines/7': gitlab_pipeline(7),
+    })
+
+    metrics = collector.collect_all_metrics(include_jobs=False, include_tests=False)
+
+    assert [m['pipeline_id'] for m in metrics] == [7]
+
+
+def test_gitlab_follows_pipeline_pages():
+    """Test pipelines past the first page are fetched by following Link headers"""
+    collector = GitLabCollector('https://gitlab.example.com', 'token', 'group/app')
+    base = 'https://gitlab.example.com/api/v4/projects/group/app/pipelines'
+    pages = {
+        base: FakeResponse([{'id': 1}, {'id': 2}], links={'next': {'url': base + '?page=2'}}),
+        base + '?page=2': FakeResponse([{'id': 3}, {'id': 4}], links={'next': {'url': base + '?page=3'}}),
+        base + '?page=3': FakeResponse([{'id': 5}]),
+    }
+
+    class PagedSession(FakeSession):
+        def get(self, url, params=None, **kwargs):
+            self.calls.append((url, params))
+            return pages[url]
+
+    session = PagedSession({})
+    collector.session = session
+
+    assert [p['id'] for p in collector.get_pipelines(per_page=3)] == [1, 2, 3]
+    assert len(session.calls) == 2
+    assert session.calls[0] == (base, {'per_page': 3})
+    assert session.calls[1] == (base + '?page=2', None)
+
+    assert [p['id'] for p in collector.iter_pipelines()] == [1, 2, 3, 4, 5]
+
+
+def test_gitlab_columnar_metrics():
+    """Test pipeline metrics convert to one typed array per field"""
+    collector = GitLabCollector('https://gitlab.example.com', 'token', 'group/app')
+    collector.session = FakeSession({}, [graphql_page([3, 2, 1], False)])
+
+    columns = collector.collect_all_metrics_columnar(pipeline_count=3)
+
+    assert columns['pipeline_id'].tolist() == [3, 2, 1]
+    assert columns['duration'].dtype == np.float32
+    assert columns['duration'].tolist() == [300.0] * 3
+    assert columns['failure_rate'].tolist() == pytest.approx([0.2] * 3)
+    assert columns['result'].tolist() == ['FAILURE'] * 3
+
+    empty = GitLabCollector.to_columnar([])
+    assert empty['duration'].shape == (0,)
+
+
+def test_gitlab_caches_finished_pipeline_details():
+    """Test details of finished pipelines are fetched once, running ones every time"""
+    collector = GitLabCollector('https://gitlab.example.com', 'token', 'group/app')
+    running = dict(gitlab_pipeline(2), status='running', finished_at=None)
+    session = FakeSession({
+        '/pipelines': [{'id': 1}, {'id': 2}],
+        '/pipelines/1': gitlab_pipeline(1),
+        '/pipelines/2': running,
+    })
+    collector.session = session
+
+    for _ in range(2):
+        collector.collect_all_metrics(include_jobs=False, include_tests=False, use_graphql=False)
+
+    assert session.calls.count('https://gitlab.example.com/api/v4/projects/group/app/pipelines/1') == 1
+    assert session.calls.count('https://gitlab.example.com/api/v4/projects/group/app/pipelines/2') == 2
+
+
+def test_gitlab_revalidates_running_pipelines_with_etag():
+    """Test a running pipeline is re-fetched with If-None-Match and a 304 reuses the copy"""
+    collector = GitLabCollector('https://gitlab.example.com', 'token', 'group/app')
+    running = dict(gitlab_pipeline(2), status='running', finished_at=None)
+
+    class EtagSession(FakeSession):
+        def get(self, url, headers=None, **kwargs):
+            self.calls.append(headers)
+            if headers and headers.get('If-None-Match') == '"v1"':
+                return FakeResponse(None, status_code=304)
+            return FakeResponse(running, headers={'ETag': '"v1"'})
+
+    session = EtagSession({})
+    collector.session = session
+
+    assert collector.get_pipeline_details(2) == running
+    assert collector.get_pipeline_details(2) == running
+    assert session.calls == [None, {'If-None-Match': '"v1"'}]
+
+
+def test_gitlab_detail_cache_eviction_is_thread_safe():
+    """Test pool threads evicting from a full detail cache never race on the same key"""
+    import threading
+    collector = GitLabCollector('https://gitlab.example.com', 'token', 'group/app')
+    collector.MAX_DETAIL_CACHE = 4
+
+    class PipelineSession(FakeSession):
+        def get(self, url, **kwargs):
+            return FakeResponse(gitlab_pipeline(int(url.rsplit('/', 1)[1])))
+
+    collector.session = PipelineSession({})
+    errors = []
+
+    def fetch(offset):
+        try:
+            for pipeline_id in range(offset, 4000, 8):
+                assert collector.get_pipeline_details(pipeline_id)['id'] == pipeline_id
+        except Exception as e:
+            errors.append(e)
+
+    # Switch threads often so unguarded evictions interleave
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=fetch, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+
+    assert errors == []
+    assert len(collector._detail_cache) <= 4
+
+
+def test_jenkins_collects_jobs_in_order():
+    """Test builds fetched concurrently stay grouped under their job"""
+    collector = JenkinsCollector('https://jenkins.example.com', 'user', 'token')
+    jobs = [f'job-{i}' for i in range(10)]
+    routes = {}
+    for i, job in enumerate(jobs):
+        routes[f'/job/{job}/api/json?tree={JenkinsCollector.BUILD_TREE}{{0,5}}'] = {
+            'builds': [{'number': i, 'duration': 1000 * (i + 1), 'result': 'SUCCESS',
+                        'timestamp': 1700000000000,
+                        'actions': [{}, {'_class': 'hudson.tasks.junit.TestResultAction',
+                                         'totalCount': 20, 'failCount': i},
+                                    {'_class': 'jenkins.metrics.impl.TimeInQueueAction',
+                                     'queuingDurationMillis': 4000}]}]
+        }
+    collector.session = FakeSession(routes)
+
+    metrics = collector.collect_all_metrics(jobs=jobs, builds_per_job=5)
+
+    assert [m['job_name'] for m in metrics] == jobs
+    assert [m['duration'] for m in metrics] == [float(i + 1) for i in range(10)]
+    assert [m['failure_count'] for m in metrics] == list(range(10))
+    assert metrics[3]['failure_rate'] == 3 / 20
+    assert metrics[0]['queue_time'] == 4.0
+
+
+def test_gitlab_incremental_collection_passes_updated_after():
+    """Test a repeat incremental scrape asks GitLab only for updated pipelines"""
+    collector = GitLabCollector('https://gitlab.example.com', 'token', 'group/app')
+
+    class ParamSession(FakeSession):
+        def get(self, url, params=None, **kwargs):
+            if url.endswith('/pipelines'):
+                self.calls.append(params)
+            return super().get(url, **kwargs)
+
+    session = ParamSession({'/pipelines': [{'id': 1}], '/pipelines/1': gitlab_pipeline(1)})
+    collector.session = session
+
+    collector.collect_all_metrics(include_jobs=False, include_tests=False, incremental=True)
+    first_scrape = collector._last_scrape
+    collector.collect_all_metrics(include_jobs=False, include_tests=False, incremental=True)
+
+    pipeline_lists = [c for c in session.calls if isinstance(c, dict)]
+    assert 'updated_after' not in pipeline_lists[0]
+    assert pipeline_lists[1]['updated_after'] == first_scrape
+
+
+def test_jenkins_incremental_collection_skips_seen_builds():
+    """Test builds that finished before the last incremental scrape are dropped"""
+    collector = JenkinsCollector('https://jenkins.example.com', 'user', 'token')
+    collector._last_scrape_ms = 1700000010000
+    builds = [
+        {'number': 1, 'timestamp': 1700000000000, 'duration': 5000, 'result': 'SUCCESS'},
+        {'number': 2, 'timestamp': 1700000000000, 'duration': 20000, 'result': 'SUCCESS'},
+        {'number': 3, 'timestamp': 1700000020000, 'duration': 1000, 'result': 'FAILURE'},
+    ]
+    collector.session = FakeSession({f'{{0,5}}': {'builds': builds}})
+
+    metrics = collector.collect_all_metrics(jobs=['build-api'], builds_per_job=5, incremental=True)
+
+    assert [m['build_number'] for m in metrics] == [2, 3]
+    assert collector._last_scrape_ms > 1700000010000
+
+
+def test_collectors_request_compressed_responses():
+    """Test every collector session asks for gzip-encoded JSON"""
+    collectors = [
+        GitLabCollector('https://gitlab.example.com', 'token', 'group/app'),
+        JenkinsCollector('https://jenkins.example.com', 'user', 'token'),
+        GitHubActionsCollector('token', 'org/repo'),
+    ]
+    for collector in collectors:
+        assert 'gzip' in collector.session.headers['Accept-Encoding']
+
+
+def test_prometheus_build_metrics_reuse_label_children():
+    """Test repeated builds update the same labelled series"""
+    registry = CollectorRegistry()
+    exporter = PrometheusExporter(registry=registry)
+
+    for duration in (100.0, 300.0):
+        exporter.record_build_metrics({'job_name': 'build-api', 'result': 'SUCCESS',
+                                       'duration': duration, 'queue_time': 5.0,
+                                       'test_count': 40, 'failure_count': 1})
+    exporter.record_build_metrics({'job_name': 'build-api', 'result': 'FAILURE', 'duration': 50.0})
+
+    labels = {'job_name': 'build-api', 'result': 'SUCCESS'}
+    assert registry.get_sample_value('cicd_build_total', labels) == 2
+    assert registry.get_sample_value('cicd_build_duration_seconds_sum', labels) == 400.0
+    assert registry.get_sample_value('cicd_build_total', dict(labels, result='FAILURE')) == 1
+    assert registry.get_sample_value('cicd_queue_time_seconds_count', {'job_name': 'build-api'}) == 2
+    assert registry.get_sample_value('cicd_data_points_total', {'source': 'github'}) == 3
+    assert len(exporter._build_children) == 2
+
+    bucket = dict(labels, le='300.0')
+    assert registry.get_sample_value('cicd_build_duration_seconds_bucket', bucket) == 2
+    assert registry.get_sample_value('cicd_build_total_created', labels) is None
+
+
+def test_collector_sessions_retry_transient_errors():
+    """Test GitLab and Jenkins sessions retry 429/5xx and honour Retry-After"""
+    gitlab = GitLabCollector('https://gitlab.example.com', 'token', 'group/app')
+    jenkins = JenkinsCollector('https://jenkins.example.com', 'user', 'token')
+
+    for session, url in [(gitlab.session, 'https://gitlab.example.com/api/graphql'),
+                         (jenkins.session, 'https://jenkins.example.com/api/json')]:
+        retry = session.get_adapter(url).max_retries
+        assert retry.total == 3
+        assert 503 in retry.status_forcelist and 429 in retry.status_forcelist
+        assert retry.respect_retry_after_header
+
+    assert 'POST' in gitlab.session.get_adapter('https://gitlab.example.com/api/graphql').max_retries.allowed_methods
+
+
+def test_github_single_run_metrics_match_batch():
+    """Test extract_metrics returns the same record extract_metrics_batch builds"""
+    collector = GitHubActionsCollector('token', 'org/repo')
+    runs = [
+        {'id': 1, 'run_number': 7, 'conclusion': 'success', 'event': 'push',
+         'created_at': '2024-01-01T10:00:00Z', 'run_started_at': '2024-01-01T10:00:30Z',
+         'updated_at': '2024-01-01T10:05:00Z'},
+        {'id': 2, 'created_at': '2024-01-01T11:00:00Z', 'updated_at': '2024-01-01T11:01:00Z'},
+    ]
+
+    batch = collector.extract_metrics_batch(runs, 'ci')
+    assert [collector.extract_metrics(run, 'ci') for run in runs] == batch
+    assert batch[0]['queue_time'] == 30.0 and batch[0]['duration'] == 300.0
+    assert batch[1]['queue_time'] == 0.0 and batch[1]['result'] == 'unknown'
+
+
+def test_collectors_share_one_connection_pool():
+    """Test every collector session mounts the same adapter, with its own auth"""
+    gitlab = GitLabCollector('https://gitlab.example.com', 'token', 'group/app')
+    jenkins = JenkinsCollector('https://jenkins.example.com', 'user', 'token')
+    github = GitHubActionsCollector('token', 'org/repo')
+
+    adapters = {id(c.session.get_adapter(url)) for c, url in [
+        (gitlab, 'https://gitlab.example.com/api/v4'),
+        (jenkins, 'https://jenkins.example.com/api/json'),
+        (github, 'https://api.github.com/repos/org/repo'),
+    ]}
+    assert len(adapters) == 1
+    assert gitlab.session.headers['PRIVATE-TOKEN'] == 'token'
+    assert jenkins.session.auth == ('user', 'token')
+    assert 'PRIVATE-TOKEN' not in github.session.headers
+
+
+def test_collector_bugs_are_not_swallowed():
+    """Test only request and decode errors are turned into empty results"""
+    collector = JenkinsCollector('https://jenkins.example.com', 'user', 'token')
+
+    class BrokenSession(FakeSession):
+        def get(self, url, **kwargs):
+            raise requests.ConnectionError("jenkins down")
+
+    collector.session = BrokenSession({})
+    assert collector.get_recent_builds('build-api') == []
+
+    collector.session = FakeSession({'/api/json?tree=jobs[name]': {'jobs': [{'title': 'x'}]}})
+    with pytest.raises(KeyError):
+        collector.get_job_list()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
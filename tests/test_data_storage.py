@@ -0,0 +1,194 @@
+"""
+Unit tests for data storage
+"""
+
+import sys
+import os
+import json
+import math
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from ml.data_storage import DataStorage
+
+
+def test_load_metrics_reuses_parsed_files(tmp_path, monkeypatch):
+    """Test unchanged metrics files are parsed once across loads"""
+    storage = DataStorage(str(tmp_path), metrics_format='json')
+    storage.save_metrics([{'job_name': 'build', 'duration': 100.0}], 'jenkins')
+
+    import ml.data_storage as data_storage
+    parses = []
+    real_loads = data_storage._loads
+    monkeypatch.setattr(data_storage, '_loads',
+                        lambda raw: parses.append(raw) or real_loads(raw))
+
+    assert len(storage.load_metrics(days=1)) == 1
+    assert len(storage.load_metrics(days=1)) == 1
+    assert len(parses) == 1
+
+
+def test_load_metrics_rereads_modified_file(tmp_path):
+    """Test a rewritten metrics file is parsed again"""
+    storage = DataStorage(str(tmp_path), metrics_format='json')
+    filepath = storage.save_metrics([{'job_name': 'build', 'duration': 100.0}], 'jenkins')
+    assert len(storage.load_metrics(days=1)) == 1
+
+    with open(filepath, 'w') as f:
+        json.dump([{'job_name': 'build', 'duration': 100.0},
+                   {'job_name': 'build', 'duration': 250.0}], f)
+
+    assert len(storage.load_metrics(days=1)) == 2
+
+
+def test_load_metrics_reads_many_files(tmp_path):
+    """Test metrics from several uncached files are all read"""
+    storage = DataStorage(str(tmp_path))
+    for i in range(12):
+        with open(os.path.join(storage.metrics_dir, f'jenkins_{i:02d}.json'), 'w') as f:
+            json.dump([{'job_name': f'job-{i}', 'duration': float(i)}], f)
+
+    metrics = storage.load_metrics(days=1)
+
+    assert len(metrics) == 12
+    assert sorted(m['job_name'] for m in metrics) == sorted(f'job-{i}' for i in range(12))
+    assert storage.load_metrics(source='jenkins_03', days=1) == [{'job_name': 'job-3', 'duration': 3.0}]
+
+
+def test_load_job_metrics_matches_job_or_workflow(tmp_path):
+    """Test per-job lookups return the same records as filtering load_metrics"""
+    storage = DataStorage(str(tmp_path))
+    storage.save_metrics([{'job_name': 'build', 'duration': 1.0},
+                          {'job_name': 'deploy', 'duration': 2.0},
+                          {'workflow_name': 'build', 'duration': 3.0},
+                          {'job_name': 'build', 'workflow_name': 'build', 'duration': 4.0}], 'github')
+
+    expected = [m for m in storage.load_metrics(days=1)
+                if m.get('job_name') == 'build' or m.get('workflow_name') == 'build']
+
+    assert storage.load_job_metrics('build', days=1) == expected
+    assert len(expected) == 3
+    assert storage.load_job_metrics('missing', days=1) == []
+
+
+def test_load_metrics_frame_matches_records(tmp_path):
+    """Test the columnar view holds the same rows as load_metrics"""
+    storage = DataStorage(str(tmp_path))
+    storage.save_metrics([{'job_name': 'build', 'duration': 100.0}], 'jenkins')
+    storage.save_metrics([{'workflow_name': 'ci', 'duration': 50.0, 'result': 'success'}], 'github')
+
+    df = storage.load_metrics_frame(days=1)
+
+    assert len(df) == len(storage.load_metrics(days=1)) == 2
+    assert sorted(df['duration']) == [50.0, 100.0]
+    assert set(df.columns) == {'job_name', 'workflow_name', 'duration', 'result'}
+    assert storage.load_metrics_frame(source='github', days=1)['result'].tolist() == ['success']
+
+
+def test_parquet_metrics_round_trip(tmp_path, monkeypatch):
+    """Test Parquet metrics files load as the same records and frame as JSON ones"""
+    import pandas as pd
+
+    # Stand-in engine so the test does not need pyarrow
+    monkeypatch.setattr(pd.DataFrame, 'to_parquet', lambda self, path, **kwargs: self.to_pickle(path))
+    monkeypatch.setattr('ml.data_storage.pd.read_parquet', pd.read_pickle)
+
+    records = [{'job_name': 'build', 'duration': 100.0, 'result': 'SUCCESS', 'test_count': 3},
+               {'workflow_name': 'ci', 'duration': 50.0, 'result': None}]
+    storage = DataStorage(str(tmp_path), metrics_format='parquet')
+    assert storage.save_metrics(records, 'jenkins').endswith('.parquet')
+    DataStorage(str(tmp_path), metrics_format='json').save_metrics([{'job_name': 'lint', 'duration': 5.0}], 'github')
+
+    assert storage.load_metrics(source='jenkins', days=1) == records
+    assert storage.load_job_metrics('ci', days=1) == [records[1]]
+    assert sorted(storage.load_metrics_frame(days=1)['duration']) == [5.0, 50.0, 100.0]
+    assert storage.load_metrics_frame(source='jenkins', days=1)['test_count'].dtype == float
+
+
+def test_parquet_keeps_field_types_with_pyarrow(tmp_path):
+    """Test mixed-key records keep int, null and list fields through a real Parquet file"""
+    pytest.importorskip('pyarrow')
+
+    records = [{'job_name': 'build', 'test_count': 3, 'stages': ['compile', 'test']},
+               {'job_name': 'lint', 'duration': 5.5, 'result': None},
+               {'job_name': 'deploy', 'test_count': 0, 'duration': float('nan')}]
+    storage = DataStorage(str(tmp_path), metrics_format='parquet')
+    assert storage.save_metrics(records, 'jenkins').endswith('.parquet')
+
+    loaded = storage.load_metrics(source='jenkins', days=1)
+    assert [sorted(r) for r in loaded] == [sorted(r) for r in records]
+    assert loaded[0]['test_count'] == 3 and isinstance(loaded[0]['test_count'], int)
+    assert loaded[0]['stages'] == ['compile', 'test']
+    assert loaded[1]['result'] is None
+    assert math.isnan(loaded[2]['duration'])
+
+
+def test_summary_report_merges_per_file_aggregates(tmp_path, monkeypatch):
+    """Test the report matches a full scan and unchanged files are not re-aggregated"""
+    storage = DataStorage(str(tmp_path), metrics_format='json')
+    storage.save_metrics([{'job_name': 'build', 'duration': 100.0, 'result': 'SUCCESS'},
+                          {'job_name': 'test', 'duration': 300.0, 'result': 'FAILURE'}], 'jenkins')
+    storage.save_metrics([{'workflow_name': 'ci', 'duration': 50.0, 'result': 'SUCCESS'},
+                          {'job_name': 'build', 'result': 'failure'}], 'github')
+
+    report = storage.generate_summary_report()
+
+    df = storage.load_metrics_frame(days=7)
+    assert report['total_metrics'] == len(df) == 4
+    assert report['avg_duration'] == df['duration'].mean() == 150.0
+    assert report['max_duration'] == 300.0
+    assert report['result_distribution'] == {'SUCCESS': 2, 'FAILURE': 1, 'failure': 1}
+    assert report['failure_rate'] == 0.5
+    assert report['total_jobs'] == df['job_name'].nunique() == 2
+    assert report['builds_per_job'] == 2.0
+
+    summarized = []
+    real_summarize = DataStorage._summarize_frame
+    monkeypatch.setattr(DataStorage, '_summarize_frame',
+                        staticmethod(lambda df: summarized.append(len(df)) or real_summarize(df)))
+    storage.save_metrics([{'job_name': 'deploy', 'duration': 10.0, 'result': 'SUCCESS'}], 'gitlab')
+
+    report = storage.generate_summary_report()
+    assert summarized == [1]
+    assert report['total_metrics'] == 5
+    assert report['total_jobs'] == 3
+
+
+def test_save_anomalies_appends_to_hourly_log(tmp_path):
+    """Test repeated saves append to one NDJSON log and legacy files still load"""
+    storage = DataStorage(str(tmp_path))
+    first = storage.save_anomalies([{'index': 0}, {'index': 1}])
+    second = storage.save_anomalies([{'index': 2}])
+
+    with open(os.path.join(storage.anomalies_dir, 'anomalies_ml_legacy.json'), 'w') as f:
+        json.dump([{'index': 3}], f)
+
+    assert first == second
+    assert first.endswith('.ndjson')
+    assert sorted(a['index'] for a in storage.load_recent_anomalies()) == [0, 1, 2, 3]
+    storage.close()
+
+
+
+def test_load_recent_anomalies_skips_partial_line(tmp_path):
+    """Test concurrent loads parse NumPy-valued anomalies and ignore a line still being written"""
+    import numpy as np
+
+    storage = DataStorage(str(tmp_path))
+    filepath = storage.save_anomalies([{'index': np.int64(0), 'max_z_score': np.float64(4.5)}])
+    storage.close()
+    with open(filepath, 'a') as f:
+        f.write('{"index": 1')
+
+    for i in range(3):
+        with open(os.path.join(storage.anomalies_dir, f'anomalies_ml_legacy{i}.json'), 'w') as f:
+            json.dump([{'index': 10 + i}], f)
+
+    anomalies = storage.load_recent_anomalies()
+    assert sorted(a['index'] for a in anomalies) == [0, 10, 11, 12]
+    assert {'index': 0, 'max_z_score': 4.5} in anomalies
+    assert sorted(a['index'] for a in storage.iter_recent_anomalies()) == [0, 10, 11, 12]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
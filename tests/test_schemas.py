@@ -0,0 +1,86 @@
+"""
+Unit tests for API request schemas
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from flask import Flask, request
+from api.schemas import (
+    RequestValidationError, CollectRequest, DetectRequest, TrainRequest, AlertRuleRequest,
+    PipelineRequest
+)
+
+
+def test_defaults_fill_missing_fields():
+    """Test an empty body yields every default"""
+    req = DetectRequest({})
+
+    assert req.metrics == []
+    assert req.threshold == 3.0
+    assert req.send_alerts is True
+
+
+def test_integers_accepted_for_floats():
+    """Test whole numbers are valid for float fields"""
+    assert TrainRequest({'contamination': 0, 'days': 7}).contamination == 0
+
+
+def test_wrong_types_rejected():
+    """Test mistyped fields raise a validation error"""
+    with pytest.raises(RequestValidationError, match="'threshold' must be a number"):
+        DetectRequest({'threshold': 'high'})
+
+    with pytest.raises(RequestValidationError, match="'days' must be an integer"):
+        TrainRequest({'days': True})
+
+    with pytest.raises(RequestValidationError):
+        DetectRequest(['not', 'an', 'object'])
+
+
+def test_required_fields():
+    """Test required fields must be present"""
+    with pytest.raises(RequestValidationError, match="Missing required field: 'name'"):
+        AlertRuleRequest({'job_pattern': 'deploy'})
+
+    req = AlertRuleRequest({'name': 'deploys', 'team_name': None})
+    assert req.to_dict()['channels'] == ['slack']
+    assert req.team_name is None
+
+
+def test_list_items_type_checked():
+    """Test list fields reject elements of the wrong type"""
+    assert PipelineRequest({'source': ['jenkins', 'gitlab']}).source == ['jenkins', 'gitlab']
+    assert PipelineRequest({'source': 'github'}).source == 'github'
+
+    with pytest.raises(RequestValidationError, match="'source' items must be a string"):
+        PipelineRequest({'source': [{'a': 1}]})
+
+    with pytest.raises(RequestValidationError, match="'source' items must be a string"):
+        PipelineRequest({'source': [['jenkins']]})
+
+    with pytest.raises(RequestValidationError, match="'metrics' items must be an object"):
+        DetectRequest({'metrics': [[1, 2]]})
+
+
+def test_from_request_rejects_malformed_json():
+    """Test only a missing body means defaults; an unparseable one is rejected"""
+    app = Flask(__name__)
+
+    with app.test_request_context(method='POST'):
+        assert CollectRequest.from_request(request).source == 'jenkins'
+
+    with app.test_request_context(method='POST', data='{"count": 5}',
+                                  content_type='application/json'):
+        assert CollectRequest.from_request(request).count == 5
+
+    with app.test_request_context(method='POST', data='{not json',
+                                  content_type='application/json'):
+        with pytest.raises(RequestValidationError, match='valid JSON'):
+            CollectRequest.from_request(request)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,410 @@
+"""
+Unit tests for smart alert manager
+"""
+
+import sys
+import os
+import json
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from api.alerting import AlertManager
+from datetime import datetime, timedelta
+from api.smart_alerting import SmartAlertManager, AlertRule, MaintenanceWindow
+
+
+def mock_anomaly(job='build-api', feature='duration'):
+    """Build a minimal anomaly"""
+    return {
+        'max_z_score': 4.5,
+        'anomaly_features': [
+            {'feature': feature, 'value': 800.0, 'expected': 300.0, 'z_score': 4.5}
+        ],
+        'data': {'job_name': job, 'duration': 800.0}
+    }
+
+
+def make_manager(tmp_path, **kwargs):
+    """Smart manager with no outbound channels configured"""
+    return SmartAlertManager(AlertManager({}),
+                             state_file=str(tmp_path / 'state.json'), **kwargs)
+
+
+def test_state_survives_restart_via_wal(tmp_path):
+    """Test fingerprints logged since the last snapshot are replayed on load"""
+    smart = make_manager(tmp_path)
+    assert smart.send_alert(mock_anomaly())['reason'] == 'queued_in_batch'
+
+    assert not os.path.exists(tmp_path / 'state.json')
+    restarted = make_manager(tmp_path)
+    assert restarted.send_alert(mock_anomaly())['reason'] == 'duplicate'
+
+
+def test_suppressed_alerts_write_nothing(tmp_path):
+    """Test suppression paths do not touch the state files"""
+    smart = make_manager(tmp_path)
+    smart.send_alert(mock_anomaly())
+    size = os.path.getsize(tmp_path / 'state.json.wal')
+
+    for _ in range(5):
+        smart.send_alert(mock_anomaly())
+
+    assert os.path.getsize(tmp_path / 'state.json.wal') == size
+    assert not os.path.exists(tmp_path / 'state.json')
+
+
+def test_suppression_stats_snapshot_in_bulk(tmp_path):
+    """Test suppression counters are persisted once STATS_SNAPSHOT_EVERY pile up"""
+    smart = make_manager(tmp_path)
+    smart.STATS_SNAPSHOT_EVERY = 4
+    smart.send_alert(mock_anomaly())
+
+    for _ in range(3):
+        smart.send_alert(mock_anomaly())
+    assert not os.path.exists(tmp_path / 'state.json')
+
+    smart.send_alert(mock_anomaly())
+    with open(tmp_path / 'state.json') as f:
+        assert json.load(f)['stats']['suppressed_duplicate'] == 4
+
+
+def test_snapshot_compacts_wal(tmp_path):
+    """Test a snapshot is written and the WAL truncated every SNAPSHOT_EVERY events"""
+    smart = make_manager(tmp_path)
+    smart.SNAPSHOT_EVERY = 3
+    for i in range(3):
+        smart.send_alert(mock_anomaly(job=f'job-{i}'))
+
+    assert os.path.exists(tmp_path / 'state.json')
+    assert os.path.getsize(tmp_path / 'state.json.wal') == 0
+
+    smart.close()
+    restarted = make_manager(tmp_path)
+    assert restarted.stats['total_received'] == 3
+    assert restarted.send_alert(mock_anomaly(job='job-1'))['reason'] == 'duplicate'
+
+
+def test_duplicate_window_expires(tmp_path, monkeypatch):
+    """Test a fingerprint is accepted again once the dedup window passes"""
+    import api.smart_alerting as smart_alerting
+    clock = [1000.0]
+    monkeypatch.setattr(smart_alerting.time, 'time', lambda: clock[0])
+
+    smart = make_manager(tmp_path, dedup_window_seconds=300)
+    assert smart.send_alert(mock_anomaly())['reason'] == 'queued_in_batch'
+
+    clock[0] += 299
+    assert smart.send_alert(mock_anomaly())['reason'] == 'duplicate'
+
+    clock[0] += 1
+    assert smart.send_alert(mock_anomaly())['reason'] != 'duplicate'
+    assert len(smart._fp_deque) == len(smart._fp_set) == 1
+
+
+def test_rate_limit_token_bucket(tmp_path, monkeypatch):
+    """Test sends beyond the hourly budget are suppressed until tokens refill"""
+    import api.smart_alerting as smart_alerting
+    clock = [1000.0]
+    monkeypatch.setattr(smart_alerting.time, 'time', lambda: clock[0])
+
+    smart = make_manager(tmp_path, max_alerts_per_hour=2, batch_window_seconds=0)
+    assert smart.send_alert(mock_anomaly(job='a'))['reason'] == 'batch_flushed'
+    assert smart.send_alert(mock_anomaly(job='b'))['reason'] == 'batch_flushed'
+    assert smart.send_alert(mock_anomaly(job='c'))['reason'] == 'rate_limit'
+    assert smart.get_stats()['alerts_last_hour'] == 2
+
+    clock[0] += 1800  # half an hour refills one token
+    assert smart.send_alert(mock_anomaly(job='c'))['reason'] == 'batch_flushed'
+    assert smart.send_alert(mock_anomaly(job='d'))['reason'] == 'rate_limit'
+
+    restarted = make_manager(tmp_path, max_alerts_per_hour=2, batch_window_seconds=0)
+    assert restarted.send_alert(mock_anomaly(job='d'))['reason'] == 'rate_limit'
+
+
+def test_rate_limited_batch_can_be_retried(tmp_path, monkeypatch):
+    """Test a rate-limited batch does not mark its anomalies as already sent"""
+    import api.smart_alerting as smart_alerting
+    clock = [1000.0]
+    monkeypatch.setattr(smart_alerting.time, 'time', lambda: clock[0])
+
+    smart = make_manager(tmp_path, max_alerts_per_hour=1, dedup_window_seconds=7200)
+    assert smart.send_batch_alert([mock_anomaly(job='a')])
+    assert not smart.send_batch_alert([mock_anomaly(job='b')])
+    assert smart.stats['suppressed_rate_limit'] == 1
+
+    clock[0] += 3600  # one token back, still inside the dedup window
+    assert smart.send_batch_alert([mock_anomaly(job='b')])
+    assert smart.stats['suppressed_duplicate'] == 0
+    assert not smart.send_batch_alert([mock_anomaly(job='a')])
+
+
+def test_rate_limit_sliding_window(tmp_path, monkeypatch):
+    """Test the previous hour's sends count with a decaying weight"""
+    import api.smart_alerting as smart_alerting
+    clock = [3600.0]
+    monkeypatch.setattr(smart_alerting.time, 'time', lambda: clock[0])
+
+    smart = make_manager(tmp_path, max_alerts_per_hour=2, batch_window_seconds=0,
+                         rate_limit_mode='sliding_window')
+    assert smart.send_alert(mock_anomaly(job='a'))['reason'] == 'batch_flushed'
+    assert smart.send_alert(mock_anomaly(job='b'))['reason'] == 'batch_flushed'
+    assert smart.send_alert(mock_anomaly(job='c'))['reason'] == 'rate_limit'
+
+    clock[0] += 3600 + 900  # previous hour still weighs 0.75 * 2 = 1.5
+    assert smart.send_alert(mock_anomaly(job='c'))['reason'] == 'batch_flushed'
+    assert smart.send_alert(mock_anomaly(job='d'))['reason'] == 'rate_limit'
+    assert smart.get_stats()['alerts_last_hour'] == 2
+
+
+def test_unknown_rate_limit_mode(tmp_path):
+    """Test an unsupported rate limit mode is rejected"""
+    with pytest.raises(ValueError):
+        make_manager(tmp_path, rate_limit_mode='leaky')
+
+
+def test_bloom_dedup_window(tmp_path, monkeypatch):
+    """Test Bloom filter dedup suppresses within the window and forgets after it"""
+    import api.smart_alerting as smart_alerting
+    clock = [1000.0]
+    monkeypatch.setattr(smart_alerting.time, 'time', lambda: clock[0])
+
+    smart = make_manager(tmp_path, dedup_window_seconds=300, dedup_bloom_bits=1 << 12)
+    assert smart.send_alert(mock_anomaly())['reason'] == 'queued_in_batch'
+    assert smart.send_alert(mock_anomaly(job='other'))['reason'] == 'queued_in_batch'
+
+    clock[0] += 299
+    assert smart.send_alert(mock_anomaly())['reason'] == 'duplicate'
+
+    smart.close()
+    restarted = make_manager(tmp_path, dedup_window_seconds=300, dedup_bloom_bits=1 << 12)
+    assert restarted.send_alert(mock_anomaly())['reason'] == 'duplicate'
+
+    clock[0] += 451
+    assert restarted.send_alert(mock_anomaly())['reason'] != 'duplicate'
+
+
+def test_rule_routing_first_match_wins(tmp_path):
+    """Test routing honours rule order and picks up rule changes"""
+    smart = make_manager(tmp_path)
+    smart.add_rule(AlertRule('api', job_pattern='API'))
+    smart.add_rule(AlertRule('build', job_pattern='build'))
+
+    assert smart._resolve_rule('Build-Api').name == 'api'
+    assert smart._resolve_rule('build-web').name == 'build'
+    assert smart._resolve_rule('deploy') is None
+
+    smart.remove_rule('api')
+    assert smart._resolve_rule('Build-Api').name == 'build'
+
+    smart.add_rule(AlertRule('default'))
+    assert smart._resolve_rule('deploy').name == 'default'
+
+
+def test_rules_that_can_never_win_are_skipped(tmp_path):
+    """Test repeated patterns and rules after a catch-all drop out of routing"""
+    smart = make_manager(tmp_path)
+    smart.add_rule(AlertRule('api', job_pattern='api'))
+    smart.add_rule(AlertRule('api-again', job_pattern='API'))
+    smart.add_rule(AlertRule('default'))
+    smart.add_rule(AlertRule('deploy', job_pattern='deploy'))
+
+    assert [r.name for r in smart._route_candidates] == ['api', 'default']
+    assert smart._resolve_rule('build-api').name == 'api'
+    assert smart._resolve_rule('deploy-prod').name == 'default'
+
+    smart.remove_rule('default')
+    assert smart._resolve_rule('deploy-prod').name == 'deploy'
+
+
+def test_maintenance_windows_by_time(tmp_path):
+    """Test only started, unfinished windows suppress and ended ones are dropped"""
+    smart = make_manager(tmp_path)
+    now = datetime.now()
+    smart.add_maintenance_window(MaintenanceWindow(
+        'later', now + timedelta(hours=1), now + timedelta(hours=2)))
+    smart.add_maintenance_window(MaintenanceWindow(
+        'ended', now - timedelta(hours=2), now - timedelta(hours=1)))
+    smart.add_maintenance_window(MaintenanceWindow(
+        'deploy', now - timedelta(minutes=5), now + timedelta(minutes=5), ['deploy-prod']))
+
+    assert smart._in_maintenance('deploy-prod', now.timestamp())
+    assert not smart._in_maintenance('build-api', now.timestamp())
+    assert [w['name'] for w in smart.list_active_windows()] == ['deploy']
+    assert [w.name for w in smart._maintenance_windows] == ['deploy', 'later']
+
+
+def test_maintenance_windows_stay_consistent_across_threads(tmp_path):
+    """Test concurrent adds and pruning lookups keep the window lists in step"""
+    import threading
+    smart = make_manager(tmp_path)
+    now = datetime.now()
+
+    def add(t):
+        for i in range(300):
+            # Alternate windows that already ended (pruned on lookup) and live ones
+            start = now - timedelta(hours=2) if i % 2 else now - timedelta(seconds=i)
+            smart.add_maintenance_window(MaintenanceWindow(
+                f'w-{t}-{i}', start, start + timedelta(hours=1)))
+
+    def look():
+        for _ in range(300):
+            smart.list_active_windows()
+            smart._in_maintenance('deploy', time.time())
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=add, args=(t,)) for t in range(3)]
+        threads += [threading.Thread(target=look) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+
+    assert smart._window_starts == [w._start_ts for w in smart._maintenance_windows]
+    assert smart._window_starts == sorted(smart._window_starts)
+    assert len(smart.list_active_windows()) == 3 * 150
+
+
+def test_team_manager_reused_per_webhook(tmp_path):
+    """Test rules sharing a webhook share one AlertManager until removed"""
+    smart = make_manager(tmp_path)
+    smart.add_rule(AlertRule('web', job_pattern='web', slack_webhook='https://hooks.example.com/web'))
+    smart.add_rule(AlertRule('api', job_pattern='api', slack_webhook='https://hooks.example.com/web'))
+
+    first = smart._get_effective_manager(smart._resolve_rule('build-web'))
+    assert first is smart._get_effective_manager(smart._resolve_rule('build-api'))
+    assert first.config['slack_webhook_url'] == 'https://hooks.example.com/web'
+    assert smart._get_effective_manager(None) is smart.alert_manager
+
+    smart.remove_rule('web')
+    assert smart._get_effective_manager(smart._resolve_rule('build-api')) is first
+
+    smart.remove_rule('api')
+    assert smart._mgr_cache == {}
+
+
+def test_batch_coalesces_repeated_fingerprints(tmp_path):
+    """Test repeats of one alert within a batch are sent once with a count"""
+    smart = make_manager(tmp_path)
+    anomaly = mock_anomaly()
+    for _ in range(3):
+        smart.send_alert(anomaly, force=True)
+    smart.send_alert(mock_anomaly(job='other'), force=True)
+
+    assert smart.get_stats()['pending_in_batch'] == 2
+    assert [a['occurrences'] for a in smart._pending_batch.values()] == [3, 1]
+    assert 'occurrences' not in anomaly
+
+
+def test_send_alerts_bulk_applies_send_alert_checks(tmp_path):
+    """Test bulk sends suppress maintenance and low-severity alerts like send_alert"""
+    smart = make_manager(tmp_path)
+    smart.add_rule(AlertRule('web', job_pattern='web', min_severity='critical'))
+    now = datetime.now()
+    smart.add_maintenance_window(MaintenanceWindow(
+        'deploy', now - timedelta(minutes=5), now + timedelta(minutes=5), ['deploy-prod']))
+
+    outcomes = smart.send_alerts_bulk([
+        mock_anomaly(job='deploy-prod'),
+        mock_anomaly(job='build-web'),
+        mock_anomaly(job='build-api'),
+    ])
+
+    assert [o['reason'] for o in outcomes] == [
+        'maintenance_window', 'below_severity_threshold', 'queued_in_batch']
+    stats = smart.get_stats()
+    assert stats['total_received'] == 3
+    assert stats['suppressed_maintenance'] == 1
+    assert stats['suppressed_severity'] == 1
+
+
+def test_fingerprint_separates_job_and_feature(tmp_path):
+    """Test a '|' in a job name cannot make two different alerts collide"""
+    smart = make_manager(tmp_path)
+    assert smart._fingerprint(mock_anomaly(job='a|b', feature='c')) != \
+        smart._fingerprint(mock_anomaly(job='a', feature='b|c'))
+    assert smart._fingerprint(mock_anomaly()) == smart._fingerprint(mock_anomaly())
+
+
+def test_delivery_runs_off_the_caller_thread(tmp_path):
+    """Test send_alert returns before a slow channel finishes and close() waits for it"""
+    import threading
+    release = threading.Event()
+    delivered = []
+
+    class SlowManager(AlertManager):
+        def send_alert(self, anomaly, channels=None):
+            release.wait(5)
+            delivered.append(anomaly['data']['job_name'])
+            return {'slack': True}
+
+    smart = SmartAlertManager(SlowManager({}), batch_window_seconds=0,
+                              state_file=str(tmp_path / 'state.json'))
+    outcome = smart.send_alert(mock_anomaly())
+    assert outcome == {'sent': True, 'reason': 'batch_flushed',
+                       'job_name': 'build-api', 'severity': 'high'}
+    assert delivered == []
+
+    release.set()
+    smart.close()
+    assert delivered == ['build-api']
+
+    # Once closed, sends happen inline
+    smart.send_alert(mock_anomaly(job='deploy'))
+    assert delivered == ['build-api', 'deploy']
+
+
+def test_concurrent_senders_deliver_each_alert_once(tmp_path):
+    """Test alerts sent and flushed from several threads are delivered exactly once"""
+    import threading
+    from collections import Counter
+    delivered = Counter()
+    delivered_lock = threading.Lock()
+
+    class RecordingManager(AlertManager):
+        def send_alert(self, anomaly, channels=None):
+            with delivered_lock:
+                delivered[anomaly['data']['job_name']] += 1
+            return {'slack': True}
+
+        def send_batch_alert(self, anomalies, max_items=10):
+            with delivered_lock:
+                delivered.update(a['data']['job_name'] for a in anomalies)
+            return True
+
+    smart = SmartAlertManager(RecordingManager({}), batch_window_seconds=0,
+                              max_alerts_per_hour=100_000,
+                              state_file=str(tmp_path / 'state.json'))
+    per_thread = 2000
+
+    def sender(t):
+        for i in range(per_thread):
+            smart.send_alert(mock_anomaly(job=f'job-{t}-{i}'))
+            if i % 50 == 0:
+                smart.flush_now()
+
+    # Switch threads often so unguarded check-then-act sequences interleave
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=sender, args=(t,)) for t in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+    smart.flush_now()
+    smart.close()
+
+    assert len(delivered) == 4 * per_thread
+    assert set(delivered.values()) == {1}
+    assert smart.stats['total_received'] == 4 * per_thread
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
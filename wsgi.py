@@ -0,0 +1,14 @@
+"""
+WSGI entry point for running the API under a production server
+
+    gunicorn wsgi:app
+
+Server settings live in gunicorn.conf.py.
+"""
+
+from api.app import app
+
+# Conventional WSGI callable name, for servers that look for it by default
+application = app
+
+__all__ = ['app', 'application']